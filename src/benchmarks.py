@@ -0,0 +1,442 @@
+"""
+The module contains benchmarks of the simulator: the suite that
+records timings and peak memory of the main operations to a JSON
+baseline and compares later runs with it, and the comparison of the
+array-backed map with the list-of-lists layout it replaced.
+"""
+import io
+import os
+import sys
+import json
+import math
+import argparse
+import platform
+import contextlib
+import tracemalloc
+from random import randint, seed
+from time import perf_counter
+from typing import Callable, Dict, Iterable, List
+
+import numpy as np
+
+import simulator
+from map import Map
+from robot import Robot
+from engine import run_commands
+from sweep import random_script
+from dynamics import Door, Scheduler, Vehicle
+from visibility import Visibility
+
+BASELINE_PATH = '../logs/benchmarks.json'
+# 10000 is supported as well, the placement engine needs about 8GB there
+SIZES = (10, 100, 1000)
+# barriers per 100 x 100 points of the field
+DENSITIES = (1, 10)
+SCRIPTS = (1000, 100000)
+SEED = 1
+# relative slowdown or memory growth reported as a regression
+THRESHOLD = 0.2
+# timings below this are too noisy to be compared
+MIN_SECONDS = 0.01
+# update_picture builds a Python picture of the whole field
+PICTURE_LIMIT = 1000
+# move_robot records a trace of every command, longer scripts are cut
+MOVE_LIMIT = 10000
+# operations repeated by a single measurement
+CALLS = 100
+QUERIES = 10000
+# doors and vehicles changed by the ticks of the scheduler
+OBSTACLES = 20
+
+
+class ListMap:
+    """
+    Reference implementation of the map that stores
+    the field as a list of Python lists of ints.
+    It is kept only to measure the array-backed map against it.
+    """
+
+    def __init__(self, x: int, y: int):
+        self.width = x
+        self.height = y
+        self.map = [[0 for x in range(self.width)]
+                    for row in range(self.height)]
+        self.barriers_count = 0
+
+    def check_collisions(self, x: int, y: int,
+                         off_x: int, off_y: int) -> bool:
+        for cy in range(off_y):
+            for cx in range(off_x):
+                try:
+                    if self.map[y + cy][x + cx] > 0:
+                        return True
+                except IndexError:
+                    return True
+        return False
+
+    def is_full(self):
+        for y in range(self.height):
+            for x in range(self.width):
+                if self.map[y][x] == 0:
+                    return False
+        return True
+
+    def generate_barrier(self, colour: int):
+        if self.is_full():
+            return None
+        x, y, width = 0, 0, 0
+        flag = True
+        while flag:
+            x = randint(0, self.width - 1)
+            y = randint(0, self.height - 1)
+            width = randint(1, math.ceil(min(self.width, self.height) / 3))
+            if not self.check_collisions(x, y, width, width):
+                flag = False
+        self.place_barrier(colour, x, y, width)
+
+    def place_barrier(self, colour: int, x: int, y: int, width: int):
+        self.barriers_count += 1
+        for cy in range(width):
+            for cx in range(width):
+                self.map[y + cy][x + cx] = colour
+
+    def remove_barrier(self, x: int, y: int) -> int:
+        colour = self.map[y][x]
+        for y in range(self.height):
+            for x in range(self.width):
+                if self.map[y][x] == colour:
+                    self.map[y][x] = 0
+        self.barriers_count -= 1
+        return colour
+
+
+def measure(func, *args) -> tuple:
+    """
+    Measures the running time and the peak memory of the call
+
+    :param func: the function to be measured
+    :param args: arguments of the function
+    :return: the result, seconds spent and peak memory in bytes
+    """
+
+    tracemalloc.start()
+    started = perf_counter()
+    result = func(*args)
+    elapsed = perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def time_case(setup: Callable, action: Callable, repeat: int) -> dict:
+    """
+    Measures an action on fresh state several times
+
+    :param setup: makes the state, it is not measured
+    :param action: the measured call, it gets the state
+    :param repeat: number of measurements of the time
+    :return: the smallest time and the peak memory
+    """
+
+    seconds = math.inf
+    for _ in range(repeat):
+        state = setup()
+        started = perf_counter()
+        action(state)
+        seconds = min(seconds, perf_counter() - started)
+    # tracing allocations slows the call down, so it is measured apart
+    _, _, memory = measure(action, setup())
+    return {'seconds': seconds, 'memory': memory}
+
+
+def generated(size: int, count: int) -> Map:
+    """Returns a field with barriers generated from the fixed seed"""
+
+    field = Map(size, size, seed=SEED)
+    field.generate_barriers(count)
+    return field
+
+
+def quiet(action: Callable) -> Callable:
+    """Wraps the action, so what it prints is dropped"""
+
+    def wrapper(state):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return action(state)
+    return wrapper
+
+
+def map_cases(size: int, density: int) -> Dict[str, tuple]:
+    """
+    Makes the cases of the map operations
+
+    :param size: the width and the height of the field
+    :param density: barriers per 100 x 100 points
+    :return: setup and action of every case by the operation name
+    """
+
+    count = max(1, round(density * size * size / 10000))
+    rng = np.random.default_rng(SEED)
+    queries = list(zip(*(rng.integers(0, size, QUERIES).tolist()
+                         for _ in range(2)),
+                       *(rng.integers(1, size // 3 + 2, QUERIES).tolist()
+                         for _ in range(2))))
+
+    def removable():
+        field = generated(size, count)
+        points = [(x, y) for x, y, _ in list(field.barriers.values())[:CALLS]]
+        return field, points
+
+    def remove(state):
+        field, points = state
+        for x, y in points:
+            field.remove_barrier(x, y)
+
+    def check(field):
+        for query in queries:
+            field.check_collisions(*query)
+
+    def generate_one(field):
+        for colour in range(count + 1, count + CALLS + 1):
+            field.generate_barrier(colour)
+
+    def draw(field):
+        robot = Robot(size // 2, size // 2)
+        for _ in range(CALLS):
+            simulator.draw(robot, field)
+
+    def scheduled():
+        # every index that follows the changes is built,
+        # and the cache of the views is full
+        field = generated(size, count)
+        field.occupancy(), field.obstacles(), field.flat_occupancy()
+        visibility = Visibility(field, simulator.VIEW_RADIUS)
+        for x, y, _, _ in queries[:visibility.capacity]:
+            visibility.view(x, y)
+        scheduler = Scheduler(field)
+        places = np.random.default_rng(SEED).integers(
+            0, max(size - 2, 1), (OBSTACLES, 4)).tolist()
+        for x, y, other_x, other_y in places:
+            scheduler.add(Door(x, y, 2, closed=3, opened=2))
+            scheduler.add(Vehicle(other_x, other_y, 1, 1, 0))
+        return scheduler
+
+    def tick(scheduler):
+        for _ in range(CALLS):
+            scheduler.tick()
+
+    cases = {
+        'generate_barriers': (lambda: Map(size, size, seed=SEED),
+                              lambda field: field.generate_barriers(count)),
+        'generate_barrier': (lambda: generated(size, count), generate_one),
+        'check_collisions': (lambda: generated(size, count), check),
+        'remove_barrier': (removable, remove),
+        'draw': (lambda: generated(size, count), quiet(draw)),
+        'scheduler_tick': (scheduled, tick),
+    }
+    if size <= PICTURE_LIMIT:
+        cases['update_picture'] = (
+            lambda: (generated(size, count),
+                     [[' '] * (size + 2) for _ in range(size + 2)]),
+            lambda state: simulator.update_picture(*state))
+    return cases
+
+
+def script_cases(size: int, density: int, length: int) -> Dict[str, tuple]:
+    """
+    Makes the cases of the robot movement
+
+    :param size: the width and the height of the field
+    :param density: barriers per 100 x 100 points
+    :param length: number of commands in the script
+    :return: setup and action of every case by the operation name
+    """
+
+    count = max(1, round(density * size * size / 10000))
+    commands = random_script(length, SEED)
+
+    def field_and_robot():
+        field = Map(size, size, seed=SEED)
+        simulator.prepare_field(field, size // 2, size // 2, count)
+        return field, Robot(size // 2, size // 2)
+
+    def move(state):
+        field, robot = state
+        for command in commands[:MOVE_LIMIT]:
+            simulator.move_robot(command, robot, field.map)
+
+    return {'move_robot': (field_and_robot, quiet(move)),
+            'run_commands': (field_and_robot,
+                             lambda state: run_commands(*state, commands))}
+
+
+def run_suite(sizes: Iterable[int] = SIZES,
+              densities: Iterable[int] = DENSITIES,
+              scripts: Iterable[int] = SCRIPTS, repeat: int = 3,
+              log: Callable = None) -> dict:
+    """
+    Runs every case of the suite
+
+    :param sizes: sizes of the fields
+    :param densities: barriers per 100 x 100 points
+    :param scripts: lengths of the command scripts
+    :param repeat: measurements of every case, the fastest is kept
+    :param log: function that gets the name and the result
+        of every finished case (default is None)
+    :return: description of the environment and results by case name
+    """
+
+    cases = {}
+    for size in sizes:
+        for density in densities:
+            prefix = f'{size}x{size}/density={density}'
+            groups = [(prefix, map_cases(size, density))]
+            groups += [(f'{prefix}/script={length}',
+                        script_cases(size, density, length))
+                       for length in scripts]
+            for name, group in groups:
+                for operation, (setup, action) in group.items():
+                    result = time_case(setup, action, repeat)
+                    cases[f'{operation}/{name}'] = result
+                    if log is not None:
+                        log(f'{operation}/{name}', result)
+    return {'python': platform.python_version(), 'numpy': np.__version__,
+            'repeat': repeat, 'cases': cases}
+
+
+def compare(baseline: dict, current: dict,
+            threshold: float = THRESHOLD) -> List[tuple]:
+    """
+    Finds the cases that became slower or use more memory
+
+    :param baseline: results of run_suite saved earlier
+    :param current: results of run_suite to be checked
+    :param threshold: relative growth that is reported
+    :return: case name, metric, baseline and current values
+        of every regression
+    """
+
+    regressions = []
+    for name, result in current['cases'].items():
+        old = baseline['cases'].get(name)
+        if old is None:
+            continue
+        for metric in ('seconds', 'memory'):
+            if metric == 'seconds' and result[metric] < MIN_SECONDS:
+                continue
+            if result[metric] > old[metric] * (1 + threshold):
+                regressions.append((name, metric, old[metric],
+                                    result[metric]))
+    return regressions
+
+
+def print_case(name: str, result: dict):
+    """Prints the result of a case"""
+
+    print(f'{name}: {result["seconds"]:.4f}s, '
+          f'{result["memory"] / 2 ** 20:.1f}MB', flush=True)
+
+
+def compare_grid_layouts(size: int, barriers: int = 10) -> dict:
+    """
+    Runs the same scenario on both map layouts. The barriers are
+    generated once from a fixed seed and placed on both layouts,
+    the zones checked for collisions are the same too. A barrier is
+    generated only at the end, when the layouts may differ.
+
+    :param size: the width and the height of the field
+    :param barriers: the count of barriers to place
+    :return: timings and peak memory for every layout
+    """
+
+    source = Map(size, size, seed=size)
+    source.generate_barriers(barriers)
+    layout_barriers = source.list_barriers()
+    rng = np.random.default_rng(size)
+    sides = rng.integers(1, max(1, size // 20) + 1, CALLS)
+    queries = list(zip(rng.integers(0, size, CALLS).tolist(),
+                       rng.integers(0, size, CALLS).tolist(),
+                       sides.tolist(), sides.tolist()))
+    _, removed_x, removed_y, _ = layout_barriers[0]
+    results = {}
+    for layout in (ListMap, Map):
+        seed(size)
+        field, build, memory = measure(layout, size, size)
+        timings = {'build': build, 'memory': memory}
+        started = perf_counter()
+        for barrier in layout_barriers:
+            field.place_barrier(*barrier)
+        timings['place_barrier'] = perf_counter() - started
+        started = perf_counter()
+        for query in queries:
+            field.check_collisions(*query)
+        timings['check_collisions'] = perf_counter() - started
+        started = perf_counter()
+        field.is_full()
+        timings['is_full'] = perf_counter() - started
+        started = perf_counter()
+        field.remove_barrier(removed_x, removed_y)
+        timings['remove_barrier'] = perf_counter() - started
+        started = perf_counter()
+        field.generate_barrier(barriers + 1)
+        timings['generate_barrier'] = perf_counter() - started
+        results[layout.__name__] = timings
+    return results
+
+
+def compare_layouts(sizes: list):
+    """Prints the comparison of the map layouts for the given sizes"""
+
+    for size in sizes:
+        for layout, timings in compare_grid_layouts(size).items():
+            print(f'{size}x{size} {layout}: ' + ', '.join(
+                f'{name}={value / 2 ** 20:.1f}MB' if name == 'memory'
+                else f'{name}={value:.4f}s'
+                for name, value in timings.items()))
+
+
+def main(argv=None) -> int:
+    """Runs the suite or the comparison of the map layouts"""
+
+    parser = argparse.ArgumentParser(
+        description='Measure the simulator and compare with a baseline')
+    parser.add_argument('sizes', nargs='*', type=int,
+                        help='sizes of the fields')
+    parser.add_argument('--layouts', action='store_true',
+                        help='compare the array-backed and list-of-lists '
+                             'maps instead of running the suite')
+    parser.add_argument('--densities', nargs='+', type=int,
+                        default=DENSITIES,
+                        help='barriers per 100 x 100 points')
+    parser.add_argument('--scripts', nargs='+', type=int, default=SCRIPTS,
+                        help='lengths of the command scripts')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', default=BASELINE_PATH,
+                        help='file the results are written to')
+    parser.add_argument('--compare', metavar='BASELINE',
+                        help='baseline the results are compared with')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD)
+    args = parser.parse_args(argv)
+
+    if args.layouts:
+        compare_layouts(args.sizes or [100, 1000, 2000])
+        return 0
+    results = run_suite(args.sizes or SIZES, args.densities, args.scripts,
+                        args.repeat, print_case)
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(json.load(file), results, args.threshold)
+        for name, metric, old, new in regressions:
+            print(f'REGRESSION {name} {metric}: {old:.6g} -> {new:.6g}')
+        if regressions:
+            return 1
+        print('No regressions')
+        return 0
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
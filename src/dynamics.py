@@ -0,0 +1,307 @@
+"""
+The module contains the obstacles that appear, disappear and move
+while the robot executes commands, and the scheduler that changes
+the map for them between the commands.
+
+Every change goes through Map.place_barrier and Map.remove_barrier_by_id,
+so the indexes of the map are updated around the changed points instead
+of being built again.
+
+Usage:
+    scheduler = Scheduler(field, [robot])
+    scheduler.add(Door(10, 4, 2, closed=5, opened=5))
+    scheduler.add(Vehicle(0, 20, 1, 1, 0))
+    ...
+    scheduler.tick()
+"""
+from time import perf_counter
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from map import Map
+from robot import Robot
+from engine import Engine, EngineResult, Outcomes, parse_command
+
+
+class Obstacle:
+    """
+    A class used to represent a square barrier that changes over time
+
+    Attributes:
+        x : int
+            X coordinate of the upper-left corner
+        y : int
+            Y coordinate of the upper-left corner
+        width : int
+            width of the barrier
+        colour : int
+            colour(id) of the barrier on the map, 0 until it is scheduled
+        present : bool
+            whether the barrier is on the map
+    """
+    __slots__ = ('x', 'y', 'width', 'colour', 'present')
+
+    def __init__(self, x: int, y: int, width: int):
+        """
+        Parameters
+        :param x: X coordinate of the upper-left corner
+        :param y: Y coordinate of the upper-left corner
+        :param width: width of the barrier
+        """
+
+        if width <= 0:
+            raise ValueError('Width should be more than 0')
+        self.x = x
+        self.y = y
+        self.width = width
+        self.colour = 0
+        self.present = False
+
+    def wanted(self, tick: int) -> Optional[Tuple[int, int]]:
+        """
+        Tells where the barrier should be on the tick
+
+        :param tick: number of the tick
+        :return: X and Y of the upper-left corner,
+            None if the barrier should be absent
+        """
+
+        return self.x, self.y
+
+    def refused(self):
+        """Is called when the barrier could not take the wanted place"""
+
+        return None
+
+
+class Door(Obstacle):
+    """
+    A barrier that is closed for a number of ticks and then open
+    for a number of ticks. A door does not close on a robot.
+
+    Attributes:
+        closed : int
+            ticks the door is on the map
+        opened : int
+            ticks the door is off the map
+        phase : int
+            shift of the cycle in ticks
+    """
+    __slots__ = ('closed', 'opened', 'phase')
+
+    def __init__(self, x: int, y: int, width: int, closed: int = 1,
+                 opened: int = 1, phase: int = 0):
+        """
+        Parameters
+        :param x: X coordinate of the upper-left corner
+        :param y: Y coordinate of the upper-left corner
+        :param width: width of the door
+        :param closed: ticks the door is on the map (default is 1)
+        :param opened: ticks the door is off the map (default is 1)
+        :param phase: shift of the cycle in ticks (default is 0)
+        """
+
+        super().__init__(x, y, width)
+        if closed < 0 or opened < 0 or closed + opened == 0:
+            raise ValueError('Door should be closed or opened for some ticks')
+        self.closed = closed
+        self.opened = opened
+        self.phase = phase
+
+    def wanted(self, tick: int) -> Optional[Tuple[int, int]]:
+        if (tick + self.phase) % (self.closed + self.opened) < self.closed:
+            return self.x, self.y
+        return None
+
+
+class Vehicle(Obstacle):
+    """
+    A barrier that moves one step every tick and turns back
+    when it meets a border, a barrier or a robot
+
+    Attributes:
+        off_x : int
+            step by X
+        off_y : int
+            step by Y
+    """
+    __slots__ = ('off_x', 'off_y')
+
+    def __init__(self, x: int, y: int, width: int, off_x: int, off_y: int):
+        """
+        Parameters
+        :param x: X coordinate of the upper-left corner
+        :param y: Y coordinate of the upper-left corner
+        :param width: width of the vehicle
+        :param off_x: step by X
+        :param off_y: step by Y
+        """
+
+        super().__init__(x, y, width)
+        self.off_x = off_x
+        self.off_y = off_y
+
+    def wanted(self, tick: int) -> Optional[Tuple[int, int]]:
+        if not self.present:
+            return self.x, self.y
+        return self.x + self.off_x, self.y + self.off_y
+
+    def refused(self):
+        self.off_x, self.off_y = -self.off_x, -self.off_y
+
+
+class Scheduler:
+    """
+    A class used to change the map for the dynamic obstacles.
+
+    On every tick each obstacle is asked where it should be. A barrier
+    is placed only where the map is free, except for the barrier itself,
+    and where no robot stands, so the points of the robots stay free as
+    prepare_field leaves them. A vehicle that moves by Map.move_barrier
+    changes only the points it leaves and the points it takes, two
+    strips along its sides. The work of a tick depends on the number
+    of the changed points and, through the indexes of the map, on its
+    side: the occupancy index adds up the changes it keeps aside after
+    about as many changes as the side of the map, and the obstacle index
+    writes the runs of free points around a change. It does not depend
+    on the area of the map.
+
+    Attributes:
+        field : Map
+            the map that is changed
+        robots : list
+            robots whose points are kept free
+        obstacles : list
+            the scheduled obstacles
+        ticks : int
+            number of ticks made
+    """
+
+    def __init__(self, field: Map, robots: Iterable[Robot] = ()):
+        """
+        Parameters
+        :param field: the map that is changed
+        :param robots: robots whose points are kept free (default is ())
+        """
+
+        self.field = field
+        self.robots: List[Robot] = list(robots)
+        self.obstacles: List[Obstacle] = []
+        self.ticks = 0
+
+    def add(self, obstacle: Obstacle) -> Obstacle:
+        """
+        Schedules the obstacle with a colour that is not used on the map,
+        it appears on the next tick
+
+        :param obstacle: the obstacle
+        :return: the same obstacle
+        """
+
+        used = max(self.field.barriers, default=0)
+        for other in self.obstacles:
+            used = max(used, other.colour)
+        obstacle.colour = used + 1
+        self.obstacles.append(obstacle)
+        return obstacle
+
+    def remove(self, obstacle: Obstacle):
+        """
+        Takes the obstacle off the map and stops scheduling it
+
+        :param obstacle: the obstacle
+        :return: None
+        """
+
+        self.obstacles.remove(obstacle)
+        if obstacle.present:
+            self.field.remove_barrier_by_id(obstacle.colour)
+            obstacle.present = False
+
+    def _fits(self, obstacle: Obstacle, x: int, y: int,
+              protected: Sequence[Tuple[int, int]]) -> bool:
+        """Checks that the obstacle can take the place"""
+
+        width = obstacle.width
+        if x < 0 or y < 0 or x + width > self.field.width \
+                or y + width > self.field.height:
+            return False
+        for point_x, point_y in protected:
+            if x <= point_x < x + width and y <= point_y < y + width:
+                return False
+        cells = self.field.map[y:y + width, x:x + width]
+        if obstacle.present:
+            return not ((cells != 0) & (cells != obstacle.colour)).any()
+        return not cells.any()
+
+    def tick(self, protected: Iterable[Tuple[int, int]] = ()) -> int:
+        """
+        Moves, places and removes the obstacles for the next tick
+
+        :param protected: more points that should stay free,
+            for example the points of a fleet (default is ())
+        :return: number of changed points
+        """
+
+        self.ticks += 1
+        protected = [(robot.c_x, robot.c_y) for robot in self.robots] \
+            + list(protected)
+        field = self.field
+        changed = 0
+        for obstacle in self.obstacles:
+            wanted = obstacle.wanted(self.ticks)
+            current = (obstacle.x, obstacle.y) if obstacle.present else None
+            if wanted == current:
+                continue
+            if wanted is not None and \
+                    not self._fits(obstacle, *wanted, protected):
+                obstacle.refused()
+                continue
+            width = obstacle.width
+            area = width * width
+            if obstacle.present and wanted is not None:
+                off_x, off_y = (abs(wanted[0] - obstacle.x),
+                                abs(wanted[1] - obstacle.y))
+                kept = max(width - off_x, 0) * max(width - off_y, 0)
+                field.move_barrier(obstacle.colour, *wanted)
+                obstacle.x, obstacle.y = wanted
+                changed += 2 * (area - kept)
+                continue
+            if obstacle.present:
+                field.remove_barrier_by_id(obstacle.colour)
+                obstacle.present = False
+                changed += area
+            if wanted is not None:
+                obstacle.x, obstacle.y = wanted
+                field.place_barrier(obstacle.colour, obstacle.x, obstacle.y,
+                                    obstacle.width)
+                obstacle.present = True
+                changed += area
+        return changed
+
+
+def run_scheduled(field: Map, robot: Robot, commands: Iterable[str],
+                  scheduler: Scheduler) -> EngineResult:
+    """
+    Applies the commands to the robot and makes a tick
+    of the scheduler after every command
+
+    :param field: the field where the robot moves
+    :param robot: the robot that executes the commands
+    :param commands: iterable or stream of commands
+    :param scheduler: the scheduler of the obstacles on the field
+    :return: the final state of the robot and outcome of every command
+    """
+
+    started = perf_counter()
+    engine = Engine(field, robot)
+    outcomes = Outcomes()
+    for line in commands:
+        command, count = parse_command(line)
+        if not command:
+            continue
+        if command == 'QUIT':
+            break
+        for _ in range(count):
+            outcomes += engine.run((command,)).outcomes
+            scheduler.tick()
+    return EngineResult(robot, outcomes, perf_counter() - started)
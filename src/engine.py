@@ -0,0 +1,622 @@
+"""
+The module contains the headless engine that applies commands
+to the robot without any terminal input or output.
+"""
+import sys
+import json
+import argparse
+import itertools
+from time import perf_counter
+from typing import Dict, Iterable, Iterator, Tuple
+from map import Map
+from robot import Robot
+from stats import STATS
+from traces import COMMANDS, OUTCOMES, MOVED, TURNED, \
+    HIT_BORDER, HIT_BARRIER
+
+VIEWS = {'UP': '^', 'DOWN': 'v', 'LEFT': '<', 'RIGHT': '>'}
+
+
+def build_transitions() -> Dict[str, Dict[int, tuple]]:
+    """
+    Finds out how every command changes the state of the robot.
+
+    A scratch robot is driven through the same calls as
+    simulator.move_robot makes, starting from every angle the robot
+    can have, so the engine follows exactly the same rules.
+
+    :return: table where table[command][angle] is the new angle,
+        the new orientation and the offsets by X and Y
+    """
+
+    table = {command: {} for command in COMMANDS}
+    angles, queue = {90}, [90]
+    while queue:
+        angle = queue.pop()
+        for command in COMMANDS:
+            robot = Robot(0, 0)
+            robot.angle = angle
+            robot.update_orientation()
+            while robot.orientation != command:
+                robot.handling_command(command)
+                if command.startswith('ROTATE'):
+                    break
+            off_y, off_x = robot.update_orientation()
+            robot.step = 1
+            table[command][angle] = \
+                (robot.angle, robot.orientation, off_x, off_y)
+            if robot.angle not in angles:
+                angles.add(robot.angle)
+                queue.append(robot.angle)
+    return table
+
+
+def build_repeats(table: Dict[str, Dict[int, tuple]]) \
+        -> Dict[str, Dict[int, tuple]]:
+    """
+    Finds out the states the robot goes through when a command
+    is repeated, they always end in a cycle because the robot
+    has a few angles only
+
+    :param table: transitions made by build_transitions
+    :return: table where table[command][angle] is a tuple of the
+        states after 1, 2, ... repeats and the index where the cycle
+        of the states starts
+    """
+
+    repeats = {command: {} for command in table}
+    for command, moves in table.items():
+        for angle in moves:
+            states, seen = [], {}
+            state = angle
+            while state not in seen:
+                seen[state] = len(states)
+                states.append(moves[state])
+                state = moves[state][0]
+            repeats[command][angle] = (tuple(states), seen[state])
+    return repeats
+
+
+TRANSITIONS = build_transitions()
+REPEATS = build_repeats(TRANSITIONS)
+
+
+def repeat(command: str, angle: int, count: int) -> tuple:
+    """
+    Finds out the state of the robot after a command is repeated
+
+    :param command: one of the robot commands
+    :param angle: angle of the robot before the command
+    :param count: number of repeats, at least one
+    :return: the new angle, the new orientation and the offsets
+        by X and Y made by the last repeat
+    """
+
+    states, start = REPEATS[command][angle]
+    if count > len(states):
+        count = start + (count - start - 1) % (len(states) - start) + 1
+    return states[count - 1]
+
+
+def parse_command(line: str) -> Tuple[str, int]:
+    """
+    Reads one line of commands, the line may repeat a command
+    by itself, for example UP*500
+
+    :param line: the line in any case
+    :return: the command and the number of its repeats, the command
+        is empty for a blank line and QUIT is returned as it is
+    """
+
+    command, star, times = line.strip().upper().partition('*')
+    command = command.rstrip()
+    if not star:
+        if command and command != 'QUIT' and command not in TRANSITIONS:
+            raise ValueError(f'Unknown command: {command}')
+        return command, 1
+    if command not in TRANSITIONS:
+        raise ValueError(f'Unknown command: {command}')
+    try:
+        times = int(times)
+    except ValueError:
+        times = -1
+    if times < 0:
+        raise ValueError(f'Wrong number of repeats: {line.strip()}')
+    return command, times
+
+
+def compile_commands(commands: Iterable[str]) -> Iterator[Tuple[str, int]]:
+    """
+    Turns commands into runs of the same command, so every run
+    can be applied at once. Commands are read by parse_command,
+    blank lines are skipped and QUIT ends the commands.
+
+    :param commands: iterable or stream of commands
+    :return: pairs of a command and the number of its repeats
+    """
+
+    last, count = None, 0
+    for line in commands:
+        if line == last:
+            count += 1
+            continue
+        if line in TRANSITIONS:
+            command, times = line, 1
+        else:
+            command, times = parse_command(line)
+            if not command:
+                continue
+            if command == 'QUIT':
+                break
+        if command == last:
+            count += times
+        elif times:
+            if count:
+                yield last, count
+            last, count = command, times
+    if count:
+        yield last, count
+
+
+class Outcomes:
+    """
+    A class used to keep the outcome codes of the applied commands.
+    Single commands add one byte each, a run of the same command adds
+    its outcomes as a code and a number of repeats, so the size of
+    the outcomes does not depend on the length of the runs.
+
+    Attributes:
+        append : callable
+            adds the outcome code of one command
+    """
+    __slots__ = ('_parts', '_tail', '_length', 'append')
+
+    def __init__(self, codes: Iterable[int] = ()):
+        """
+        Parameters
+        :param codes: outcome codes to start with (default is ())
+        """
+
+        # bytes of single commands and (code, count) pairs of runs
+        self._parts = []
+        self._tail = bytearray(codes)
+        self._length = 0
+        self.append = self._tail.append
+
+    def add_run(self, code: int, count: int):
+        """
+        Adds the same outcome of a number of commands
+
+        :param code: outcome code
+        :param count: number of commands
+        :return: None
+        """
+
+        if count <= 0:
+            return None
+        if self._tail:
+            self._parts.append(bytes(self._tail))
+            self._length += len(self._tail)
+            # the tail is cleared in place, so bound appends stay valid
+            self._tail.clear()
+        self._parts.append((code, count))
+        self._length += count
+
+    def runs(self) -> Iterator[Tuple[int, int]]:
+        """
+        Returns the outcomes as runs of the same code
+
+        :return: pairs of a code and the number of commands in a row
+        """
+
+        last, count = None, 0
+        for part in self._parts + [self._tail]:
+            pairs = [part] if isinstance(part, tuple) else \
+                ((code, 1) for code in part)
+            for code, times in pairs:
+                if code == last:
+                    count += times
+                    continue
+                if count:
+                    yield last, count
+                last, count = code, times
+        if count:
+            yield last, count
+
+    def count(self, code: int) -> int:
+        """
+        Counts the commands with the outcome
+
+        :param code: outcome code
+        :return: number of commands
+        """
+
+        total = self._tail.count(code)
+        for part in self._parts:
+            if isinstance(part, tuple):
+                total += part[1] if part[0] == code else 0
+            else:
+                total += part.count(code)
+        return total
+
+    def extend(self, other):
+        """
+        Adds outcomes of other commands
+
+        :param other: Outcomes or outcome codes
+        :return: None
+        """
+
+        if not isinstance(other, Outcomes):
+            self._tail += other
+            return None
+        for part in other._parts + [other._tail]:
+            if isinstance(part, tuple):
+                self.add_run(*part)
+            else:
+                self._tail += part
+
+    def __iadd__(self, other) -> 'Outcomes':
+        self.extend(other)
+        return self
+
+    def __len__(self) -> int:
+        return self._length + len(self._tail)
+
+    def __iter__(self) -> Iterator[int]:
+        for part in self._parts + [self._tail]:
+            if isinstance(part, tuple):
+                yield from itertools.repeat(*part)
+            else:
+                yield from part
+
+    def __getitem__(self, index: int) -> int:
+        index = range(len(self))[index]
+        for part in self._parts + [self._tail]:
+            size = part[1] if isinstance(part, tuple) else len(part)
+            if index < size:
+                return part[0] if isinstance(part, tuple) else part[index]
+            index -= size
+        raise IndexError(index)
+
+    def __bytes__(self) -> bytes:
+        return b''.join(bytes((part[0],)) * part[1]
+                        if isinstance(part, tuple) else bytes(part)
+                        for part in self._parts + [self._tail])
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, Outcomes):
+            return len(self) == len(other) and \
+                list(self.runs()) == list(other.runs())
+        if isinstance(other, (bytes, bytearray, list)):
+            return len(self) == len(other) and bytes(self) == bytes(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f'Outcomes({list(self.runs())})'
+
+
+class EngineResult:
+    """
+    A class used to represent the result of a run
+
+    Attributes:
+        c_x : int
+            final position of the robot by X
+        c_y : int
+            final position of the robot by Y
+        angle : int
+            final angle of the robot
+        orientation : str
+            final direction of the robot
+        outcomes : Outcomes
+            outcome code of every applied command
+        elapsed : float
+            seconds spent on the run
+    """
+    __slots__ = ('c_x', 'c_y', 'angle', 'orientation', 'outcomes', 'elapsed')
+
+    def __init__(self, robot: Robot, outcomes: Outcomes, elapsed: float):
+        self.c_x = robot.c_x
+        self.c_y = robot.c_y
+        self.angle = robot.angle
+        self.orientation = robot.orientation
+        self.outcomes = outcomes
+        self.elapsed = elapsed
+
+    def counts(self) -> Dict[str, int]:
+        """
+        Counts the commands by their outcome
+
+        :return: number of commands for every outcome name
+        """
+
+        return {name: self.outcomes.count(code)
+                for code, name in enumerate(OUTCOMES)}
+
+    def as_dict(self) -> dict:
+        """Returns the result in a form suitable for JSON"""
+
+        return {'c_x': self.c_x, 'c_y': self.c_y, 'angle': self.angle,
+                'orientation': self.orientation,
+                'commands': len(self.outcomes), 'outcomes': self.counts(),
+                'elapsed': self.elapsed}
+
+
+class Engine:
+    """
+    A class used to apply commands to the robot on the field
+    with the same rules as simulator.move_robot, but without
+    printing, drawing or recording traces
+
+    Attributes:
+        field : Map
+            the field where the robot moves
+        robot : Robot
+            the robot that executes the commands
+    """
+
+    def __init__(self, field: Map, robot: Robot):
+        """
+        Parameters
+        :param field: the field where the robot moves
+        :param robot: the robot that executes the commands
+        """
+
+        self.field = field
+        self.robot = robot
+        self._blocked = None
+        self._revision = None
+
+    def blocked(self):
+        """
+        Returns the occupied points of the field indexed by
+        y * width + x, it is rebuilt only when the field changes
+
+        :return: one byte per point, non-zero if the point is occupied
+        """
+
+        if self._blocked is None or self._revision != self.field.revision:
+            self._blocked = self.field.flat_occupancy()
+            self._revision = self.field.revision
+        return self._blocked
+
+    def step(self, command: str) -> int:
+        """
+        Applies one command
+
+        :param command: one of the robot commands
+        :return: outcome code of the command
+        """
+
+        return self.run((command,)).outcomes[0]
+
+    def ray(self, x: int, y: int, off_x: int, off_y: int,
+            length: int) -> int:
+        """
+        Counts the free points that follow the point in a direction,
+        it looks through the occupancy bytes of the field at once
+
+        :param x: X coordinate of the point
+        :param y: Y coordinate of the point
+        :param off_x: step by X, one of -1, 0 and 1
+        :param off_y: step by Y, one of -1, 0 and 1
+        :param length: the most points to be checked
+        :return: number of free points before the first barrier,
+            the border of the field or the end of the ray
+        """
+
+        blocked = self.blocked()
+        if not isinstance(blocked, (bytes, bytearray)):
+            return self.field.ray(x, y, off_x, off_y, length)
+        width, height = self.field.width, self.field.height
+        if off_x > 0:
+            length = min(length, width - 1 - x)
+        elif off_x < 0:
+            length = min(length, x)
+        elif off_y > 0:
+            length = min(length, height - 1 - y)
+        else:
+            length = min(length, y)
+        if length <= 0:
+            return 0
+        start = y * width + x
+        if off_x > 0:
+            found = blocked.find(1, start + 1, start + 1 + length)
+            return length if found < 0 else found - start - 1
+        if off_x < 0:
+            found = blocked.rfind(1, start - length, start)
+            return length if found < 0 else start - found - 1
+        if off_y > 0:
+            cells = blocked[start + width:start + (length + 1) * width:width]
+        else:
+            stop = start - (length + 1) * width
+            cells = blocked[start - width:stop if stop >= 0 else None:-width]
+        found = cells.find(1)
+        return length if found < 0 else found
+
+    def advance(self, x: int, y: int, angle: int, command: str,
+                count: int, outcomes: Outcomes) -> tuple:
+        """
+        Applies a run of the same command at once. Repeated rotations
+        are looked up in a table and repeated steps are checked with
+        one ray, the result is the same as if the commands were
+        applied one by one.
+
+        :param x: position of the robot by X
+        :param y: position of the robot by Y
+        :param angle: angle of the robot
+        :param command: one of the robot commands
+        :param count: number of repeats
+        :param outcomes: outcome codes the run is added to
+        :return: the new position by X and Y, angle and orientation
+        """
+
+        off_x, off_y = TRANSITIONS[command][angle][2:]
+        if not (off_x or off_y):
+            angle, orientation, _, _ = repeat(command, angle, count)
+            outcomes.add_run(TURNED, count)
+            return x, y, angle, orientation
+        angle, orientation = TRANSITIONS[command][angle][:2]
+        # a step command turns the robot only the first time,
+        # the rest of the run goes straight in one direction
+        free = self.ray(x, y, off_x, off_y, count)
+        if self.robot.coverage is not None:
+            self.robot.coverage.visit_line(x, y, off_x, off_y, free)
+        x, y = x + off_x * free, y + off_y * free
+        outcomes.add_run(MOVED, free)
+        if free < count:
+            new_x, new_y = x + off_x, y + off_y
+            code = HIT_BARRIER if 0 <= new_x < self.field.width and \
+                0 <= new_y < self.field.height else HIT_BORDER
+            outcomes.add_run(code, count - free)
+        return x, y, angle, orientation
+
+    def _finish(self, x: int, y: int, angle: int, orientation: str,
+                outcomes: Outcomes, started: float) -> EngineResult:
+        """Moves the robot to its final state and makes the result"""
+
+        robot = self.robot
+        robot.c_x, robot.c_y, robot.angle = x, y, angle
+        robot.orientation = orientation
+        robot.view = VIEWS[orientation]
+        result = EngineResult(robot, outcomes, perf_counter() - started)
+        if STATS.enabled:
+            STATS.count('engine_commands', len(outcomes))
+            STATS.record('engine', int(result.elapsed * 1e9))
+        return result
+
+    def run(self, commands: Iterable[str]) -> EngineResult:
+        """
+        Applies the commands one by one until they end or QUIT is met.
+        Commands are accepted in any case, blank lines are skipped
+        and a line may repeat a command, for example UP*500.
+
+        :param commands: iterable or stream of commands
+        :return: the final state of the robot and outcome of every command
+        """
+
+        started = perf_counter()
+        robot = self.robot
+        blocked = self.blocked()
+        width, height = self.field.width, self.field.height
+        x, y, angle = robot.c_x, robot.c_y, robot.angle
+        orientation = robot.orientation
+        table = TRANSITIONS
+        outcomes = Outcomes()
+        record = outcomes.append
+        visit = robot.coverage.visit if robot.coverage is not None else None
+        if hasattr(commands, 'readline'):
+            # lines of a file or stdin end with a line break
+            commands = map(str.rstrip, commands)
+        for command in commands:
+            try:
+                moves = table[command]
+            except KeyError:
+                moves = table.get(command.rstrip())
+                if moves is None:
+                    command, count = parse_command(command)
+                    if not command:
+                        continue
+                    if command == 'QUIT':
+                        break
+                    if count != 1:
+                        if count:
+                            x, y, angle, orientation = self.advance(
+                                x, y, angle, command, count, outcomes)
+                        continue
+                    moves = table[command]
+            angle, orientation, off_x, off_y = moves[angle]
+            if off_x or off_y:
+                new_x, new_y = x + off_x, y + off_y
+                if 0 <= new_x < width and 0 <= new_y < height:
+                    if blocked[new_y * width + new_x]:
+                        record(HIT_BARRIER)
+                    else:
+                        x, y = new_x, new_y
+                        record(MOVED)
+                        if visit is not None:
+                            visit(x, y)
+                else:
+                    record(HIT_BORDER)
+            else:
+                record(TURNED)
+        return self._finish(x, y, angle, orientation, outcomes, started)
+
+    def execute(self, program: Iterable[Tuple[str, int]]) -> EngineResult:
+        """
+        Applies runs of the same command made by compile_commands
+
+        :param program: pairs of a command and the number of its repeats
+        :return: the final state of the robot and outcome of every command
+        """
+
+        started = perf_counter()
+        robot = self.robot
+        x, y, angle = robot.c_x, robot.c_y, robot.angle
+        orientation = robot.orientation
+        outcomes = Outcomes()
+        for command, count in program:
+            if count:
+                x, y, angle, orientation = self.advance(
+                    x, y, angle, command, count, outcomes)
+        return self._finish(x, y, angle, orientation, outcomes, started)
+
+
+def run_commands(field: Map, robot: Robot,
+                 commands: Iterable[str]) -> EngineResult:
+    """
+    Applies the commands to the robot on the field without terminal I/O
+
+    :param field: the field where the robot moves
+    :param robot: the robot that executes the commands
+    :param commands: iterable or stream of commands
+    :return: the final state of the robot and outcome of every command
+    """
+
+    return Engine(field, robot).run(commands)
+
+
+def main(argv=None):
+    """Runs a command file or stdin on a random field and prints a summary"""
+
+    parser = argparse.ArgumentParser(
+        description='Run robot commands without the interactive terminal')
+    parser.add_argument('script', nargs='?', default='-',
+                        help='file with one command per line, - for stdin')
+    parser.add_argument('--width', type=int, default=100)
+    parser.add_argument('--height', type=int, default=100)
+    parser.add_argument('--barriers', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--stats', action='store_true',
+                        help='add counters and timings of the phases')
+    parser.add_argument('--coverage', action='store_true',
+                        help='add the visited points and the coverage')
+    args = parser.parse_args(argv)
+
+    if args.stats:
+        STATS.enable()
+    from simulator import prepare_field
+    field = Map(args.width, args.height, seed=args.seed)
+    center_x, center_y = args.width // 2, args.height // 2
+    prepare_field(field, center_x, center_y, args.barriers)
+    robot = Robot(center_x, center_y)
+    if args.coverage:
+        from exploration import Coverage
+        robot.coverage = Coverage(field, center_x, center_y)
+    if args.script == '-':
+        result = run_commands(field, robot, sys.stdin)
+    else:
+        with open(args.script) as script:
+            result = run_commands(field, robot, script)
+    summary = result.as_dict()
+    if args.stats:
+        summary['stats'] = STATS.snapshot()
+    if args.coverage:
+        summary['coverage'] = robot.coverage.as_dict()
+    json.dump(summary, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
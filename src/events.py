@@ -0,0 +1,255 @@
+"""
+The module contains the events the robot emits when it executes
+commands and the sinks that receive them. Nothing is formatted
+or written unless a sink is subscribed.
+
+Usage:
+    robot.events.subscribe(ConsoleSink())
+    ...
+    robot.events.flush()
+"""
+import sys
+from typing import Callable, List, NamedTuple, Optional, TextIO
+
+from traces import COMMANDS, ORIENTATIONS, OUTCOMES, MOVED, TURNED, \
+    HIT_BORDER, TraceWriter
+
+
+class Event(NamedTuple):
+    """
+    One executed command, the outcome is one of the codes MOVED, TURNED,
+    HIT_BORDER and HIT_BARRIER. For collisions the target point is the
+    point the robot tried to enter.
+    """
+    outcome: int
+    command: Optional[str]
+    orientation: str
+    from_x: int
+    from_y: int
+    to_x: int
+    to_y: int
+
+    @property
+    def name(self) -> str:
+        return OUTCOMES[self.outcome]
+
+    def as_dict(self) -> dict:
+        return {'command': self.command, 'orientation': self.orientation,
+                'from': [self.from_x, self.from_y],
+                'to': [self.to_x, self.to_y], 'outcome': self.name}
+
+
+def format_event(event: Event) -> str:
+    """
+    Returns the text the simulator prints for the event
+
+    :param event: the event
+    :return: one or more lines without the final line break
+    """
+
+    if event.outcome == TURNED:
+        return f'Robot turned {event.orientation}'
+    if event.outcome == MOVED:
+        return f'Robot direction: {event.orientation}\n' \
+            f'Robot arrived to [{event.to_x}, {event.to_y}]' \
+            f' from [{event.from_x}, {event.from_y}]'
+    if event.outcome == HIT_BORDER:
+        return 'Oops...We hit a border. Try again.'
+    return 'Oops...We hit a barrier. Try again.'
+
+
+class NullSink:
+    """A sink that drops the events, it also shows the sink interface"""
+
+    def handle(self, event: Event):
+        """
+        Receives one event
+
+        :param event: the event
+        :return: None
+        """
+
+        return None
+
+    def flush(self):
+        """Passes on the buffered events"""
+
+        return None
+
+    def close(self):
+        """Passes on the buffered events and releases the resources"""
+
+        self.flush()
+
+
+class BatchSink(NullSink):
+    """
+    A sink that collects the events and passes them on in batches
+
+    Attributes:
+        batch_size : int
+            number of events passed on at once
+    """
+
+    def __init__(self, consumer: Callable[[List[Event]], None],
+                 batch_size: int = 1024):
+        """
+        Parameters
+        :param consumer: function that gets every batch
+        :param batch_size: number of events passed on at once
+            (default is 1024)
+        """
+
+        self.consumer = consumer
+        self.batch_size = batch_size
+        self._batch: List[Event] = []
+
+    def handle(self, event: Event):
+        self._batch.append(event)
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self._batch:
+            batch, self._batch = self._batch, []
+            self.consumer(batch)
+
+
+class ConsoleSink(BatchSink):
+    """
+    A sink that prints the events as the simulator always did.
+    The text is made only when the batch is written.
+    """
+
+    def __init__(self, out: TextIO = None, batch_size: int = 64):
+        """
+        Parameters
+        :param out: stream for the text, the current sys.stdout
+            if it is None (default is None)
+        :param batch_size: number of events printed at once
+            (default is 64)
+        """
+
+        super().__init__(self._print, batch_size)
+        self.out = out
+
+    def _print(self, batch: List[Event]):
+        out = self.out or sys.stdout
+        out.write(''.join(format_event(event) + '\n' for event in batch))
+
+
+class QueueSink(BatchSink):
+    """A sink that puts batches of the events into a queue"""
+
+    def __init__(self, queue, batch_size: int = 1024):
+        """
+        Parameters
+        :param queue: queue.Queue, multiprocessing.Queue or any object
+            with the put method
+        :param batch_size: number of events in one batch (default is 1024)
+        """
+
+        super().__init__(queue.put, batch_size)
+
+
+class FileSink(NullSink):
+    """
+    A sink that writes the events as trace records, the file
+    is read back by traces.read_traces
+    """
+
+    def __init__(self, path: str, binary: bool = False,
+                 batch_size: int = 1024):
+        """
+        Parameters
+        :param path: path of the file, it is overwritten
+        :param binary: whether the binary format is used
+            (default is False)
+        :param batch_size: number of events written in one batch
+            (default is 1024)
+        """
+
+        self.writer = TraceWriter(path, binary, batch_size)
+
+    def handle(self, event: Event):
+        self.writer.write(
+            COMMANDS.index(event.command) if event.command is not None
+            else -1, ORIENTATIONS.index(event.orientation), event.from_x,
+            event.from_y, event.to_x, event.to_y, event.outcome)
+
+    def flush(self):
+        self.writer.flush()
+
+    def close(self):
+        self.writer.close()
+
+
+class EventBus:
+    """
+    A class used to pass the events of a robot to the subscribed sinks
+
+    Attributes:
+        sinks : list
+            the sinks in the order of subscription, the robot makes
+            no events while it is empty
+    """
+
+    def __init__(self):
+        self.sinks: List[NullSink] = []
+
+    def subscribe(self, sink: NullSink) -> NullSink:
+        """
+        Passes all next events to the sink
+
+        :param sink: the sink
+        :return: the same sink
+        """
+
+        self.sinks.append(sink)
+        return sink
+
+    def unsubscribe(self, sink: NullSink):
+        """
+        Stops passing the events to the sink, its buffered
+        events are passed on
+
+        :param sink: the sink
+        :return: None
+        """
+
+        if sink in self.sinks:
+            self.sinks.remove(sink)
+            sink.flush()
+
+    def emit(self, outcome: int, command: Optional[str], orientation: str,
+             from_x: int, from_y: int, to_x: int, to_y: int):
+        """
+        Passes an event to every sink
+
+        :param outcome: outcome code of the command
+        :param command: executed command or None if it is unknown
+        :param orientation: direction of the robot after the command
+        :param from_x: position of the robot before the command by X
+        :param from_y: position of the robot before the command by Y
+        :param to_x: position the robot moved or tried to move to by X
+        :param to_y: position the robot moved or tried to move to by Y
+        :return: None
+        """
+
+        event = Event(outcome, command, orientation,
+                      from_x, from_y, to_x, to_y)
+        for sink in self.sinks:
+            sink.handle(event)
+
+    def flush(self):
+        """Makes every sink pass on its buffered events"""
+
+        for sink in self.sinks:
+            sink.flush()
+
+    def close(self):
+        """Closes every sink and unsubscribes them"""
+
+        for sink in self.sinks:
+            sink.close()
+        self.sinks = []
@@ -0,0 +1,401 @@
+"""
+The module contains the coverage of the map by a robot: which points
+it has visited, how often, and what share of the reachable free points
+that is. Every visit is counted in constant time, so the metrics are
+read without going through the trace. Changes of the barriers update
+the reachable points locally when they can.
+
+Usage:
+    robot.coverage = Coverage(field, robot.c_x, robot.c_y)
+    ...
+    robot.coverage.percent()
+"""
+from bisect import bisect_right
+from collections import Counter, deque
+from typing import Dict, Optional
+
+import numpy as np
+
+from map import Map
+
+# points a local fill may add before the reachable points
+# are found again over the whole map
+LOCAL_FILL = 4096
+# visited points are kept in blocks of 2 ** BLOCK_SHIFT bits
+BLOCK_SHIFT = 15
+# rows of the map read at once while the reachable points are found
+BAND = 256
+
+
+class Coverage:
+    """
+    A class used to represent the points visited by a robot.
+
+    Visited points are kept as one bit per point in blocks that are
+    allocated on the first visit, so a large or sparse map takes memory
+    only where the robot has been. Points visited more than once also
+    have the number of extra visits.
+
+    The reachable free points are found by a flood fill from the robot
+    over runs of free points in the rows. The map is read through
+    Map.window in bands of rows, so SparseMap is supported too, but the
+    reachable points take a boolean per point of the map and they are
+    found only on request. Changes of the
+    barriers are applied locally: a barrier placed on reachable points
+    removes them, unless the free points around it are split and it may
+    cut the area in parts, and a removed barrier next to reachable
+    points is filled from with at most LOCAL_FILL points. Other changes
+    mark the points stale and they are found again on the next request.
+
+    Attributes:
+        field : Map
+            the map on which the robot moves
+        x : int
+            X coordinate of the last visited point
+        y : int
+            Y coordinate of the last visited point
+        visited : int
+            number of distinct visited points
+        moves : int
+            number of visits
+        revisits : int
+            number of visits to points that were visited before
+    """
+
+    def __init__(self, field: Map, x: int, y: int):
+        """
+        Parameters
+        :param field: the map on which the robot moves
+        :param x: X coordinate of the start point, it is visited
+        :param y: Y coordinate of the start point, it is visited
+        """
+
+        self.field = field
+        self.x, self.y = x, y
+        self.visited = 0
+        self.moves = 0
+        self.revisits = 0
+        self._bits: Dict[int, bytearray] = {}
+        self._extra = Counter()
+        self._reachable: Optional[np.ndarray] = None
+        self._area = 0
+        self._covered = 0
+        field.listeners.append(self._changed)
+        self.visit(x, y)
+        self.moves = 0
+
+    def close(self):
+        """Stops following the changes of the map"""
+
+        if self._changed in self.field.listeners:
+            self.field.listeners.remove(self._changed)
+
+    def _changed(self, zone: Optional[tuple]):
+        """
+        Updates the reachable points after a change of the map
+
+        :param zone: X, Y, width and height of the zone,
+            None if the whole map may have changed
+        :return: None
+        """
+
+        if self._reachable is None:
+            return None
+        if zone is None:
+            self._reachable = None
+            return None
+        x, y, width, height = zone
+        width = min(width, self.field.width - x)
+        height = min(height, self.field.height - y)
+        cells = self.field.window(x, y, width, height)
+        if cells.all():
+            self._occupied(x, y, width, height)
+        elif not cells.any():
+            self._freed(x, y, width, height)
+        else:
+            self._reachable = None
+
+    def _occupied(self, x: int, y: int, width: int, height: int):
+        """Removes the points of a placed barrier from the reachable ones"""
+
+        inside = self._reachable[y:y + height, x:x + width]
+        if not inside.any():
+            return None
+        if x <= self.x < x + width and y <= self.y < y + height:
+            self._reachable = None
+            return None
+        self._area -= int(np.count_nonzero(inside))
+        self._covered -= int(np.count_nonzero(
+            inside & self._visited(x, y, width, height)))
+        inside[...] = False
+        ring = self._ring(x, y, width, height)
+        # the free points around the barrier are connected along the
+        # ring, so every path through the barrier can go around it
+        if not ring.all() and np.count_nonzero(ring & ~np.roll(ring, 1)) > 1:
+            self._reachable = None
+
+    def _freed(self, x: int, y: int, width: int, height: int):
+        """Adds the points a removed barrier made reachable"""
+
+        reachable = self._reachable
+        field = self.field
+        if width * height > LOCAL_FILL or \
+                x <= self.x < x + width and y <= self.y < y + height:
+            self._reachable = None
+            return None
+        sides = (reachable[y:y + height, max(x - 1, 0)],
+                 reachable[y:y + height, min(x + width, field.width - 1)],
+                 reachable[max(y - 1, 0), x:x + width],
+                 reachable[min(y + height, field.height - 1), x:x + width])
+        if not any(side.any() for side in sides):
+            return None
+        queue = deque((column, row) for row in range(y, y + height)
+                      for column in range(x, x + width))
+        for column, row in queue:
+            reachable[row, column] = True
+        added = []
+        while queue:
+            column, row = queue.popleft()
+            added.append((column, row))
+            if len(added) > LOCAL_FILL:
+                self._reachable = None
+                return None
+            for near_x, near_y in ((column, row - 1), (column, row + 1),
+                                   (column - 1, row), (column + 1, row)):
+                if 0 <= near_x < field.width and 0 <= near_y < field.height \
+                        and not reachable[near_y, near_x] \
+                        and field.free_point(near_x, near_y):
+                    reachable[near_y, near_x] = True
+                    queue.append((near_x, near_y))
+        self._area += len(added)
+        self._covered += sum(self.is_visited(column, row)
+                             for column, row in added)
+
+    def _ring(self, x: int, y: int, width: int, height: int) -> np.ndarray:
+        """
+        Returns whether the points around the zone are free,
+        in order around it, points outside the map are not free
+        """
+
+        field = self.field
+        left, top = x - 1, y - 1
+        box = np.zeros((height + 2, width + 2), dtype=bool)
+        x0, y0 = max(left, 0), max(top, 0)
+        x1 = min(x + width + 1, field.width)
+        y1 = min(y + height + 1, field.height)
+        box[y0 - top:y1 - top, x0 - left:x1 - left] = \
+            field.window(x0, y0, x1 - x0, y1 - y0) == 0
+        return np.concatenate((box[0, :-1], box[:-1, -1],
+                               box[-1, :0:-1], box[:0:-1, 0]))
+
+    def _refresh(self):
+        """Finds the reachable free points from the last visited point"""
+
+        field = self.field
+        x, y = self.x, self.y
+        height, width = field.height, field.width
+        parts = []
+        for top in range(0, height, BAND):
+            free = field.window(0, top, width, min(BAND, height - top)) == 0
+            if top <= y < top + BAND:
+                free[y - top, x] = True
+            # the runs of free points start at +1 and end at -1
+            edges = np.diff(free.view(np.int8), axis=1, prepend=0, append=0)
+            rows, starts = np.nonzero(edges == 1)
+            parts.append((rows + top, starts, np.nonzero(edges == -1)[1]))
+        del free, edges
+        rows, starts, ends = (np.concatenate(part) for part in zip(*parts))
+        bounds = np.searchsorted(rows, np.arange(height + 1)).tolist()
+        row_of, start_of, end_of = rows.tolist(), starts.tolist(), \
+            ends.tolist()
+        first = bisect_right(start_of, x, bounds[y], bounds[y + 1]) - 1
+        seen = bytearray(len(start_of))
+        seen[first] = 1
+        queue = [first]
+        while queue:
+            run = queue.pop()
+            row, start, end = row_of[run], start_of[run], end_of[run]
+            for near in (row - 1, row + 1):
+                if not 0 <= near < height:
+                    continue
+                last = bounds[near + 1]
+                index = bisect_right(end_of, start, bounds[near], last)
+                while index < last and start_of[index] < end:
+                    if not seen[index]:
+                        seen[index] = 1
+                        queue.append(index)
+                    index += 1
+        chosen = np.frombuffer(seen, dtype=np.uint8) != 0
+        marks = np.zeros((height, width + 1), dtype=np.int8)
+        marks[rows[chosen], starts[chosen]] = 1
+        marks[rows[chosen], ends[chosen]] = -1
+        reachable = np.cumsum(marks, axis=1, dtype=np.int8)[:, :width] != 0
+        if not field.free_point(x, y):
+            reachable[y, x] = False
+        self._reachable = reachable
+        self._area = int(np.count_nonzero(reachable))
+        flat = reachable.reshape(-1)
+        self._covered = sum(int(np.count_nonzero(flat[indexes]))
+                            for indexes in self._indexes())
+
+    def _indexes(self):
+        """Yields the indexes y * width + x of the visited points by block"""
+
+        size = self.field.width * self.field.height
+        for key, bits in self._bits.items():
+            offsets = np.nonzero(np.unpackbits(
+                np.frombuffer(bits, dtype=np.uint8), bitorder='little'))[0]
+            indexes = (key << BLOCK_SHIFT) + offsets
+            yield indexes[indexes < size]
+
+    def _visited(self, x: int, y: int, width: int, height: int) \
+            -> np.ndarray:
+        """Returns the visited points of a zone as a boolean array"""
+
+        indexes = (np.arange(y, y + height)[:, None] * self.field.width
+                   + np.arange(x, x + width))
+        zone = np.zeros((height, width), dtype=bool)
+        keys = indexes >> BLOCK_SHIFT
+        for key in np.unique(keys).tolist():
+            bits = self._bits.get(key)
+            if bits is None:
+                continue
+            inside = keys == key
+            offsets = indexes[inside] & ((1 << BLOCK_SHIFT) - 1)
+            zone[inside] = np.frombuffer(bits, dtype=np.uint8)[offsets >> 3] \
+                >> (offsets & 7) & 1 != 0
+        return zone
+
+    def visit(self, x: int, y: int):
+        """
+        Counts a visit of the robot to the point
+
+        :param x: X coordinate of the point
+        :param y: Y coordinate of the point
+        :return: None
+        """
+
+        self.x, self.y = x, y
+        self.moves += 1
+        index = y * self.field.width + x
+        bits = self._bits.get(index >> BLOCK_SHIFT)
+        if bits is None:
+            bits = self._bits[index >> BLOCK_SHIFT] = \
+                bytearray(1 << BLOCK_SHIFT - 3)
+        offset = index & (1 << BLOCK_SHIFT) - 1
+        bit = 1 << (offset & 7)
+        if bits[offset >> 3] & bit:
+            self.revisits += 1
+            self._extra[index] += 1
+            return None
+        bits[offset >> 3] |= bit
+        self.visited += 1
+        if self._reachable is not None and self._reachable[y, x]:
+            self._covered += 1
+
+    def visit_line(self, x: int, y: int, off_x: int, off_y: int,
+                   count: int):
+        """
+        Counts visits to the points the robot passes in one direction
+
+        :param x: X coordinate of the point before the first step
+        :param y: Y coordinate of the point before the first step
+        :param off_x: step by X, one of -1, 0 and 1
+        :param off_y: step by Y, one of -1, 0 and 1
+        :param count: number of steps
+        :return: None
+        """
+
+        visit = self.visit
+        for step in range(1, count + 1):
+            visit(x + off_x * step, y + off_y * step)
+
+    def is_visited(self, x: int, y: int) -> bool:
+        """
+        Checks that the robot has visited the point
+
+        :param x: X coordinate of the point
+        :param y: Y coordinate of the point
+        :return: True if the point was visited
+        """
+
+        index = y * self.field.width + x
+        bits = self._bits.get(index >> BLOCK_SHIFT)
+        offset = index & (1 << BLOCK_SHIFT) - 1
+        return bits is not None and bool(bits[offset >> 3]
+                                         & 1 << (offset & 7))
+
+    def visits(self, x: int, y: int) -> int:
+        """
+        Returns how many times the robot has visited the point
+
+        :param x: X coordinate of the point
+        :param y: Y coordinate of the point
+        :return: number of visits
+        """
+
+        if not self.is_visited(x, y):
+            return 0
+        return 1 + self._extra[y * self.field.width + x]
+
+    def reachable(self) -> int:
+        """
+        Returns the number of free points the robot can reach
+        from the last visited point
+
+        :return: number of points
+        """
+
+        if self._reachable is None:
+            self._refresh()
+        return self._area
+
+    def percent(self) -> float:
+        """
+        Returns the share of the reachable free points
+        the robot has visited
+
+        :return: coverage in percent
+        """
+
+        area = self.reachable()
+        return 100 * self._covered / area if area else 0.0
+
+    def as_dict(self) -> dict:
+        """Returns the metrics in a form suitable for JSON"""
+
+        return {'visited': self.visited, 'moves': self.moves,
+                'revisits': self.revisits, 'reachable': self.reachable(),
+                'coverage': self.percent()}
+
+    def heatmap(self) -> np.ndarray:
+        """
+        Returns the number of visits to every point of the map
+
+        :return: height x width array of visit counts
+        """
+
+        heat = np.zeros((self.field.height, self.field.width),
+                        dtype=np.uint32)
+        flat = heat.reshape(-1)
+        for indexes in self._indexes():
+            flat[indexes] = 1
+        for index, extra in self._extra.items():
+            flat[index] += extra
+        return heat
+
+    def write_heatmap(self, path: str):
+        """
+        Writes the visit counts as a binary PGM image, the most
+        visited point is white and unvisited points are black
+
+        :param path: path of the image
+        :return: None
+        """
+
+        heat = self.heatmap()
+        top = int(heat.max()) or 1
+        with open(path, 'wb') as file:
+            file.write(b'P5\n%d %d\n255\n' % (heat.shape[1], heat.shape[0]))
+            for row in heat:
+                file.write((row * 255 // top).astype(np.uint8).tobytes())
@@ -0,0 +1,233 @@
+"""
+The module contains the fleet of robots that are stored
+in parallel arrays and moved by all at once in ticks.
+"""
+from typing import Iterable, Sequence, Tuple, Union
+
+import numpy as np
+
+from map import Map
+from robot import Robot
+from engine import COMMANDS, TRANSITIONS, VIEWS, OUTCOMES, \
+    MOVED, TURNED, HIT_BORDER, HIT_BARRIER
+
+
+BLOCKED = 4
+FLEET_OUTCOMES = OUTCOMES + ('blocked',)
+
+ANGLES = tuple(sorted(TRANSITIONS['UP']))
+ORIENTATIONS = tuple(VIEWS)
+
+_ANGLE_INDEX = {angle: index for index, angle in enumerate(ANGLES)}
+_COMMAND_CODES = {command: code for code, command in enumerate(COMMANDS)}
+
+
+def _transition_arrays() -> Tuple[np.ndarray, ...]:
+    """
+    Turns the transition table of the engine into arrays indexed
+    by the command code and the index of the current angle
+
+    :return: next angle index, orientation code and offsets by X and Y
+    """
+
+    shape = (len(COMMANDS), len(ANGLES))
+    angles = np.zeros(shape, dtype=np.uint8)
+    orientations = np.zeros(shape, dtype=np.uint8)
+    off_x = np.zeros(shape, dtype=np.int8)
+    off_y = np.zeros(shape, dtype=np.int8)
+    for code, command in enumerate(COMMANDS):
+        for index, angle in enumerate(ANGLES):
+            new_angle, orientation, dx, dy = TRANSITIONS[command][angle]
+            angles[code, index] = _ANGLE_INDEX[new_angle]
+            orientations[code, index] = ORIENTATIONS.index(orientation)
+            off_x[code, index], off_y[code, index] = dx, dy
+    return angles, orientations, off_x, off_y
+
+
+NEXT_ANGLE, NEXT_ORIENTATION, OFF_X, OFF_Y = _transition_arrays()
+
+
+def command_codes(commands: Union[str, Iterable[str]], size: int) -> np.ndarray:
+    """
+    Converts commands to codes
+
+    :param commands: one command for every robot or one for all of them
+    :param size: number of robots
+    :return: array of command codes
+    """
+
+    if isinstance(commands, str):
+        commands = [commands] * size
+    elif isinstance(commands, np.ndarray) and commands.dtype.kind in 'iu':
+        return commands
+    try:
+        codes = np.array([_COMMAND_CODES[command] for command in commands],
+                         dtype=np.uint8)
+    except KeyError as error:
+        raise ValueError(f'Unknown command: {error.args[0]}')
+    if codes.size != size:
+        raise ValueError(f'Expected {size} commands, got {codes.size}')
+    return codes
+
+
+class Fleet:
+    """
+    A class used to represent many robots on one map.
+    The state of the robots is kept in parallel arrays instead of
+    Robot objects, and every tick moves all robots with vector operations.
+
+    Attributes:
+        field : Map
+            the field where the robots move
+        xs : numpy.ndarray
+            positions of the robots by X
+        ys : numpy.ndarray
+            positions of the robots by Y
+        angles : numpy.ndarray
+            indexes of the angles of the robots in ANGLES
+        orientations : numpy.ndarray
+            indexes of the directions of the robots in ORIENTATIONS
+    """
+
+    def __init__(self, field: Map, positions: Sequence[Tuple[int, int]]):
+        """
+        Parameters
+        :param field: the field where the robots move
+        :param positions: X and Y coordinates of every robot,
+            robots look up as a new Robot does
+        """
+
+        self.field = field
+        points = np.array(positions, dtype=np.int64).reshape(-1, 2)
+        self.xs = points[:, 0].copy()
+        self.ys = points[:, 1].copy()
+        if ((self.xs < 0) | (self.xs >= field.width)
+                | (self.ys < 0) | (self.ys >= field.height)).any():
+            raise ValueError('Robots should be placed on the map')
+        if field.map[self.ys, self.xs].any():
+            raise ValueError('Robots should be placed on free points')
+        if np.unique(self.ys * field.width + self.xs).size != len(self):
+            raise ValueError('Robots should be placed on different points')
+        self.angles = np.full(len(self), _ANGLE_INDEX[90], dtype=np.uint8)
+        self.orientations = np.full(len(self), ORIENTATIONS.index('UP'),
+                                    dtype=np.uint8)
+
+    def __len__(self) -> int:
+        return self.xs.size
+
+    @classmethod
+    def from_robots(cls, field: Map, robots: Iterable[Robot]) -> 'Fleet':
+        """
+        Creates a fleet with the state of existing robots
+
+        :param field: the field where the robots move
+        :param robots: robots whose state is copied
+        :return: new fleet
+        """
+
+        robots = list(robots)
+        fleet = cls(field, [(robot.c_x, robot.c_y) for robot in robots])
+        fleet.angles[:] = [_ANGLE_INDEX[robot.angle] for robot in robots]
+        fleet.orientations[:] = [ORIENTATIONS.index(robot.orientation)
+                                 for robot in robots]
+        return fleet
+
+    def robot(self, index: int) -> Robot:
+        """
+        Creates a Robot with the state of one robot of the fleet
+
+        :param index: index of the robot in the fleet
+        :return: new robot
+        """
+
+        robot = Robot(int(self.xs[index]), int(self.ys[index]))
+        robot.angle = ANGLES[self.angles[index]]
+        robot.orientation = ORIENTATIONS[self.orientations[index]]
+        robot.view = VIEWS[robot.orientation]
+        return robot
+
+    def tick(self, commands: Union[str, Iterable[str]]) -> np.ndarray:
+        """
+        Applies one command to every robot.
+
+        Robots turn and check borders and barriers independently.
+        A robot cannot enter a point that another robot keeps after
+        the tick, two robots cannot swap places, and when several robots
+        move into the same point only the one with the lowest index does.
+        Robots that gave way stay in place with the BLOCKED outcome.
+
+        :param commands: one command for every robot, or one for all
+        :return: outcome code of every robot
+        """
+
+        codes = command_codes(commands, len(self))
+        width, height = self.field.width, self.field.height
+        self.orientations = NEXT_ORIENTATION[codes, self.angles]
+        off_x = OFF_X[codes, self.angles]
+        off_y = OFF_Y[codes, self.angles]
+        self.angles = NEXT_ANGLE[codes, self.angles]
+
+        outcomes = np.full(len(self), MOVED, dtype=np.uint8)
+        walking = (off_x != 0) | (off_y != 0)
+        outcomes[~walking] = TURNED
+        new_x, new_y = self.xs + off_x, self.ys + off_y
+        inside = (new_x >= 0) & (new_x < width) \
+            & (new_y >= 0) & (new_y < height)
+        outcomes[walking & ~inside] = HIT_BORDER
+        movers = walking & inside
+        hit = np.zeros(len(self), dtype=bool)
+        hit[movers] = self.field.map[new_y[movers], new_x[movers]] != 0
+        outcomes[hit] = HIT_BARRIER
+        movers &= ~hit
+
+        blocked = self._resolve(movers, new_x, new_y)
+        outcomes[blocked] = BLOCKED
+        movers &= ~blocked
+        self.xs[movers] = new_x[movers]
+        self.ys[movers] = new_y[movers]
+        return outcomes
+
+    def sense(self) -> np.ndarray:
+        """
+        Reads the range sensors of every robot, other robots
+        are not seen by the sensors
+
+        :return: n x 4 array of the number of free points up, down,
+            to the left and to the right before a barrier or a border
+        """
+
+        return self.field.sense_many(self.xs, self.ys)
+
+    def _resolve(self, movers: np.ndarray, new_x: np.ndarray,
+                 new_y: np.ndarray) -> np.ndarray:
+        """
+        Finds robots that have to give way to other robots
+
+        :param movers: robots that can make a step on the map
+        :param new_x: positions by X the robots are going to
+        :param new_y: positions by Y the robots are going to
+        :return: mask of the robots that stay in place
+        """
+
+        width = self.field.width
+        movers = movers.copy()
+        current = self.ys * width + self.xs
+        target = new_y * width + new_x
+        order = np.argsort(current)
+        slot = np.minimum(np.searchsorted(current[order], target),
+                          len(self) - 1)
+        occupant = order[slot]
+        swap = movers & (current[occupant] == target) & movers[occupant] \
+            & (target[occupant] == current)
+        blocked = swap.copy()
+        movers &= ~swap
+        index = np.arange(len(self))
+        while True:
+            final = np.where(movers, target, current)
+            order = np.lexsort((index, movers, final))
+            repeated = final[order[1:]] == final[order[:-1]]
+            losers = order[1:][repeated]
+            if losers.size == 0:
+                return blocked
+            movers[losers] = False
+            blocked[losers] = True
@@ -1,7 +1,13 @@
 """Module containing the map class"""
-from random import randint
+from typing import List, Optional, Tuple
 import math
 
+import numpy as np
+
+from occupancy import SummedAreaTable, ObstacleIndex
+from placement import PlacementEngine
+from stats import STATS
+
 
 class Map:
     """
@@ -12,23 +18,86 @@ class Map:
             the width of the map
         height : int
             the height of the map
-        map : list
-            a list that stores information about each point on the map
+        map : numpy.ndarray
+            a 2D array (height x width) that stores
+            the colour(id) of the barrier in each point or 0 if it is free
+        barriers : dict
+            registry of the barriers, maps colour(id) of a barrier
+            to the X, Y coordinates of its upper-left corner and its width
         barriers_count : int
             number of barriers on the map
+        revision : int
+            counter of the changes of the grid, caches built
+            from the map are valid while it stays the same
+        rng : numpy.random.Generator
+            random generator used to place barriers
+        listeners : list
+            functions called after every change of the grid with the
+            changed zone (x, y, width, height) or None if the whole
+            grid may have changed
+
+    The grid should be changed only through the methods of the map,
+    they keep the occupancy index, the obstacle index and the placement
+    engine in sync with it.
     """
 
-    def __init__(self, x: int, y: int):
+    # random draws tried before the placement engine is asked for a barrier
+    PLACEMENT_ATTEMPTS = 32
+    # limits of the number of candidates drawn at once by generate_barriers
+    MIN_BATCH = 64
+    MAX_BATCH = 65536
+
+    def __init__(self, x: int, y: int, dtype=np.uint8, seed=None):
         """
         Parameters
         :param x: the width of the map
         :param y: the height of the map
+        :param dtype: initial integer type of the cells,
+            it is widened automatically when colours do not fit
+            (default is numpy.uint8)
+        :param seed: seed or numpy.random.Generator used to place
+            barriers, the same seed gives the same barriers
+            (default is None)
         """
         self.width = x
         self.height = y
-        self.map = [[0 for x in range(self.width)]
-                    for row in range(self.height)]
-        self.barriers_count = 0
+        self.map = np.zeros((self.height, self.width), dtype=dtype)
+        self.barriers = {}
+        self.revision = 0
+        self.rng = np.random.default_rng(seed)
+        self._occupancy = None
+        self._obstacles = None
+        self._placement = None
+        self._flat = None
+        self.listeners = []
+
+    @classmethod
+    def from_grid(cls, grid: np.ndarray, barriers: dict = None,
+                  seed=None) -> 'Map':
+        """
+        Creates a map over an existing grid without copying it
+
+        :param grid: height x width array of colours(ids),
+            for example a memory-mapped file
+        :param barriers: registry of the barriers on the grid
+            (default is None)
+        :param seed: seed or numpy.random.Generator used to place
+            barriers (default is None)
+        :return: new map
+        """
+
+        field = cls.__new__(cls)
+        field.height, field.width = grid.shape
+        field.map = grid
+        field.barriers = dict(barriers or {})
+        field.revision = 0
+        field.rng = np.random.default_rng(seed)
+        field._occupancy = None
+        field._obstacles = None
+        field._placement = None
+        field._flat = None
+        field.listeners = []
+        return field
 
     @property
     def width(self):
@@ -50,10 +119,107 @@ class Map:
             raise ValueError('Height should be more than 0')
         self._height = value
 
+    @property
+    def barriers_count(self) -> int:
+        return len(self.barriers)
+
+    def occupancy(self) -> SummedAreaTable:
+        """
+        Returns the occupancy index of the map,
+        it is built on the first request
+
+        :return: summed-area table of the occupied points
+        """
+
+        if self._occupancy is None:
+            self._occupancy = SummedAreaTable(self.map)
+        return self._occupancy
+
+    def obstacles(self) -> ObstacleIndex:
+        """
+        Returns the index of the nearest obstacles,
+        it is built on the first request
+
+        :return: distances to the nearest obstacle in four directions
+        """
+
+        if self._obstacles is None:
+            self._obstacles = ObstacleIndex(self.map)
+        return self._obstacles
+
+    @property
+    def max_barrier_size(self) -> int:
+        return math.ceil(min(self.width, self.height) / 3)
+
+    def placement(self) -> PlacementEngine:
+        """
+        Returns the placement engine of the map,
+        it is created on the first request
+
+        :return: engine that knows all feasible barriers
+        """
+
+        if self._placement is None:
+            self._placement = PlacementEngine(self, self.max_barrier_size)
+        return self._placement
+
+    def _changed(self, x: int, y: int, width: int, height: int, sign: int):
+        """
+        Passes a change of the grid to the indexes that are built
+
+        :param x: coordinate of the upper-left corner of the zone by X
+        :param y: coordinate of the upper-left corner of the zone by Y
+        :param width: width of the changed zone
+        :param height: height of the changed zone
+        :param sign: 1 if the zone was occupied, -1 if it was freed
+        :return: None
+        """
+
+        self.revision += 1
+        if self._occupancy is not None:
+            self._occupancy.update(x, y, width, height, sign)
+        if self._obstacles is not None:
+            self._obstacles.update(self.map, x, y, width, height)
+        if self._placement is not None:
+            self._placement.update(x, y, width, height, sign)
+        if self._flat is not None:
+            flat = self._flat[1]
+            cells = self.map[y:y + height, x:x + width] != 0
+            for row in range(height):
+                start = (y + row) * self.width + x
+                flat[start:start + width] = cells[row].tobytes()
+            self._flat = (self.revision, flat)
+        for listener in self.listeners:
+            listener((x, y, width, height))
+
+    def _rebuilt(self, grown: bool = False):
+        """
+        Drops the indexes after a large change of the grid,
+        they are built again on the next request
+
+        :param grown: whether barriers were only added, then
+            the placement engine is refitted instead of dropped
+            (default is False)
+        :return: None
+        """
+
+        self.revision += 1
+        self._occupancy = None
+        self._obstacles = None
+        self._flat = None
+        if grown and self._placement is not None:
+            self._placement.refit()
+        else:
+            self._placement = None
+        for listener in self.listeners:
+            listener(None)
+
     def check_collisions(self, x: int, y: int,
                          off_x: int, off_y: int) -> bool:
         """
-        Checks whether there are collisions in a particular zone
+        Checks whether there are collisions in a particular zone.
+        It takes constant time, plus the number of changes the occupancy
+        index keeps aside, at most about the side of the map.
 
         :param x: coordinate of the upper-left corner of the zone by X
         :param y: coordinate of the upper-left corner of the zone by Y
@@ -62,14 +228,10 @@ class Map:
         :return: True if a collisions was found else False
         """
 
-        for cy in range(off_y):
-            for cx in range(off_x):
-                try:
-                    if self.map[y + cy][x + cx] > 0:
-                        return True
-                except IndexError:
-                    return True
-        return False
+        if x < 0 or y < 0 or \
+                x + off_x > self.width or y + off_y > self.height:
+            return True
+        return self.occupancy().count(x, y, off_x, off_y) > 0
 
     def free_point(self, x: int, y: int) -> bool:
         """
@@ -82,6 +244,97 @@ class Map:
 
         return True if self.map[y][x] == 0 else False
 
+    def sense(self, x: int, y: int) -> Tuple[int, int, int, int]:
+        """
+        Measures the distances from the point to the nearest barrier
+        or border up, down, to the left and to the right, the distance
+        is the number of free points on the way
+
+        :param x: X coordinate of the point
+        :param y: Y coordinate of the point
+        :return: distances up, down, to the left and to the right
+        """
+
+        return self.obstacles().sense(x, y)
+
+    def sense_many(self, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        """
+        Measures the distances from many points at once
+
+        :param xs: X coordinates of the points
+        :param ys: Y coordinates of the points
+        :return: n x 4 array of the distances up, down,
+            to the left and to the right
+        """
+
+        return self.obstacles().sense_many(xs, ys)
+
+    def window(self, x: int, y: int, width: int, height: int) -> np.ndarray:
+        """
+        Returns the cells of a zone that lies on the map
+
+        :param x: coordinate of the upper-left corner of the zone by X
+        :param y: coordinate of the upper-left corner of the zone by Y
+        :param width: width of the zone
+        :param height: height of the zone
+        :return: height x width array of colours(ids)
+        """
+
+        return self.map[y:y + height, x:x + width]
+
+    def ray(self, x: int, y: int, off_x: int, off_y: int,
+            length: int) -> int:
+        """
+        Counts the free points that follow the point in a direction
+        one after another, the point itself is not counted
+
+        :param x: X coordinate of the point
+        :param y: Y coordinate of the point
+        :param off_x: step by X, one of -1, 0 and 1
+        :param off_y: step by Y, one of -1, 0 and 1
+        :param length: the most points to be checked
+        :return: number of free points before the first barrier,
+            the border of the map or the end of the ray
+        """
+
+        if self._obstacles is not None:
+            up, down, left, right = self._obstacles.sense(x, y)
+            return min(length, right if off_x > 0 else left if off_x < 0
+                       else down if off_y > 0 else up)
+        if off_x > 0:
+            length = min(length, self.width - 1 - x)
+        elif off_x < 0:
+            length = min(length, x)
+        elif off_y > 0:
+            length = min(length, self.height - 1 - y)
+        else:
+            length = min(length, y)
+        if length <= 0:
+            return 0
+        if off_x > 0:
+            cells = self.window(x + 1, y, length, 1)[0]
+        elif off_x < 0:
+            cells = self.window(x - length, y, length, 1)[0, ::-1]
+        elif off_y > 0:
+            cells = self.window(x, y + 1, 1, length)[:, 0]
+        else:
+            cells = self.window(x, y - length, 1, length)[::-1, 0]
+        blocked = np.flatnonzero(cells)
+        return int(blocked[0]) if blocked.size else length
+
+    def flat_occupancy(self):
+        """
+        Returns the occupancy of the points indexed by y * width + x,
+        it is shared by all users and patched in place when
+        a barrier is placed or removed
+
+        :return: one byte per point, non-zero if the point is occupied
+        """
+
+        if self._flat is None or self._flat[0] != self.revision:
+            self._flat = (self.revision, bytearray((self.map != 0).tobytes()))
+        return self._flat[1]
+
     def is_full(self):
         """
         Check that there is no place for a barrier on the map
@@ -89,48 +342,249 @@ class Map:
         :return: True if map is full else False
         """
 
-        for y in range(self.height):
-            for x in range(self.width):
-                if self.map[y][x] == 0:
-                    return False
-        return True
+        if self._occupancy is not None:
+            return self._occupancy.total() == self.map.size
+        return np.count_nonzero(self.map) == self.map.size
 
-    def generate_barrier(self, colour: int):
+    def _fit_colour(self, colour: int):
         """
-        Generates a new random size barrier
+        Widens the type of the cells if the colour does not fit into it.
+        A grid the map does not own, such as a memory-mapped file or
+        shared memory, cannot be widened in place, a wider copy would
+        silently stop writing to it.
 
-        :param colour: colour(id) of generated barrier
+        :param colour: colour(id) that is going to be stored
         :return: None
         """
 
+        if colour > np.iinfo(self.map.dtype).max:
+            if not self.map.flags.owndata:
+                raise ValueError(f'Colour {colour} does not fit into '
+                                 f'{self.map.dtype} cells of a grid '
+                                 f'that is not owned by the map')
+            self.map = self.map.astype(np.min_scalar_type(colour))
+
+    def generate_barrier(self, colour: int) -> bool:
+        """
+        Generates a new random size barrier.
+
+        A few random positions and sizes are tried first, which is
+        enough while the map is sparse. If all of them collide, the
+        barrier is sampled from the placement engine, so the result is
+        uniform over all feasible barriers and the work is bounded.
+
+        :param colour: colour(id) of generated barrier
+        :return: True if the barrier was placed,
+            False if there is no place for a barrier of any size
+        """
+
         if self.is_full():
-            return None
-        x, y, width = 0, 0, 0
-        flag = True
-        while flag:
-            x = randint(0, self.width - 1)
-            y = randint(0, self.height - 1)
-            width = randint(1, math.ceil(min(self.width, self.height) / 3))
+            return False
+        for attempts in range(1, self.PLACEMENT_ATTEMPTS + 1):
+            x, y, width = (int(value) for value in self.rng.integers(
+                (0, 0, 1), (self.width, self.height,
+                            self.max_barrier_size + 1)))
             if not self.check_collisions(x, y, width, width):
-                flag = False
-        self.barriers_count += 1
-        for cy in range(width):
-            for cx in range(width):
-                self.map[y + cy][x + cx] = colour
+                STATS.count('placement_attempts', attempts)
+                break
+        else:
+            STATS.count('placement_attempts', self.PLACEMENT_ATTEMPTS)
+            STATS.count('placement_fallbacks')
+            candidate = self.placement().sample()
+            if candidate is None:
+                return False
+            x, y, width = candidate
+        self.place_barrier(colour, x, y, width)
+        return True
 
-    def remove_barrier(self, x: int, y: int) -> int:
+    def generate_barriers(self, count: int, colour: int = 1) -> int:
         """
-        Delete the barrier to which the transmitted point belongs.
+        Generates many random size barriers with consecutive colours.
+
+        Candidates are drawn in batches: uniformly while the map is
+        sparse and then from the placement engine, which knows all
+        feasible barriers. Candidates that collide with the map are
+        rejected with one vector query to the occupancy index, the rest
+        are taken in the order they were drawn and skipped if they hit
+        a barrier placed earlier in the same batch. This gives the same
+        distribution as generating barriers one by one.
+
+        :param count: number of barriers to generate
+        :param colour: colour(id) of the first barrier (default is 1)
+        :return: number of placed barriers
+        """
+
+        placed = 0
+        sparse = True
+        while placed < count and not self.is_full():
+            size = int(np.clip(4 * (count - placed),
+                               self.MIN_BATCH, self.MAX_BATCH))
+            if sparse:
+                xs = self.rng.integers(0, self.width, size)
+                ys = self.rng.integers(0, self.height, size)
+                widths = self.rng.integers(1, self.max_barrier_size + 1,
+                                           size)
+                fits = (xs + widths <= self.width) \
+                    & (ys + widths <= self.height)
+                xs, ys, widths = xs[fits], ys[fits], widths[fits]
+                table = self.occupancy().table
+                free = (table[ys + widths, xs + widths]
+                        - table[ys, xs + widths] - table[ys + widths, xs]
+                        + table[ys, xs]) == 0
+                xs, ys, widths = xs[free], ys[free], widths[free]
+            else:
+                xs, ys, widths = self.placement().sample_many(size)
+            accepted = 0
+            for x, y, width in zip(xs.tolist(), ys.tolist(),
+                                   widths.tolist()):
+                if placed == count:
+                    break
+                if accepted and self.map[y:y + width, x:x + width].any():
+                    continue
+                self._place(colour, x, y, width)
+                colour += 1
+                placed += 1
+                accepted += 1
+            STATS.count('placement_candidates', size)
+            if accepted:
+                self._rebuilt(grown=True)
+            if accepted * self.MIN_BATCH < size:
+                sparse = False
+        return placed
+
+    def place_barrier(self, colour: int, x: int, y: int, width: int):
+        """
+        Places a barrier of the given colour into the free zone
+
+        :param colour: colour(id) of the barrier
+        :param x: coordinate of the upper-left corner of the barrier by X
+        :param y: coordinate of the upper-left corner of the barrier by Y
+        :param width: width of the barrier
+        :return: None
+        """
+
+        self._place(colour, x, y, width)
+        self._changed(x, y, width, width, 1)
+
+    def _place(self, colour: int, x: int, y: int, width: int):
+        """
+        Writes a barrier into the grid and the registry
+        without updating the indexes
+
+        :return: None
+        """
+
+        if colour <= 0:
+            raise ValueError('Colour of a barrier should be more than 0')
+        if colour in self.barriers:
+            raise ValueError(f'Barrier {colour} is already on the map')
+        self._fit_colour(colour)
+        self.barriers[colour] = (x, y, width)
+        self.map[y:y + width, x:x + width] = colour
+
+    def barrier_at(self, x: int, y: int) -> Optional[int]:
+        """
+        Finds the barrier to which the transmitted point belongs
 
         :param x: coordinate of point by X
         :param y: coordinate of point by Y
+        :return: colour(id) of the barrier or None if the point is free
+        """
+
+        colour = int(self.map[y][x])
+        return colour if colour else None
+
+    def list_barriers(self) -> List[Tuple[int, int, int, int]]:
+        """
+        Lists the barriers in the order they were placed
+
+        :return: colour(id), X, Y of the upper-left corner
+            and width of every barrier
+        """
+
+        return [(colour, x, y, width)
+                for colour, (x, y, width) in self.barriers.items()]
+
+    def remove_barrier_by_id(self, colour: int) -> int:
+        """
+        Delete the barrier with the transmitted colour(id)
+
+        :param colour: colour(id) of the barrier
         :return: colour(id) of removed barrier
         """
 
-        colour = self.map[y][x]
-        for y in range(self.height):
-            for x in range(self.width):
-                if self.map[y][x] == colour:
-                    self.map[y][x] = 0
-        self.barriers_count -= 1
+        try:
+            x, y, width = self.barriers.pop(colour)
+        except KeyError:
+            raise ValueError(f'There is no barrier {colour} on the map')
+        self.map[y:y + width, x:x + width] = 0
+        self._changed(x, y, width, width, -1)
         return colour
+
+    @staticmethod
+    def _uncovered(x: int, y: int, other_x: int, other_y: int,
+                   width: int) -> List[Tuple[int, int, int, int]]:
+        """
+        Splits the points of a square that are not covered by another
+        square of the same width into at most two zones,
+        the squares should overlap
+
+        :return: X, Y, width and height of every zone
+        """
+
+        zones = []
+        off_x, off_y = other_x - x, other_y - y
+        if off_x:
+            left = x if off_x > 0 else x + width + off_x
+            zones.append((left, y, abs(off_x), width))
+        if off_y:
+            top = y if off_y > 0 else y + width + off_y
+            zones.append((max(x, other_x), top, width - abs(off_x),
+                          abs(off_y)))
+        return zones
+
+    def move_barrier(self, colour: int, x: int, y: int):
+        """
+        Moves the barrier so that its upper-left corner is at the point.
+        If the old and the new place overlap, only the points the
+        barrier leaves and the points it takes are changed, so the
+        indexes see two thin zones instead of two whole barriers.
+        The points the barrier takes should be free.
+
+        :param colour: colour(id) of the barrier
+        :param x: new coordinate of the upper-left corner by X
+        :param y: new coordinate of the upper-left corner by Y
+        :return: None
+        """
+
+        try:
+            old_x, old_y, width = self.barriers[colour]
+        except KeyError:
+            raise ValueError(f'There is no barrier {colour} on the map')
+        if abs(x - old_x) >= width or abs(y - old_y) >= width:
+            self.remove_barrier_by_id(colour)
+            self.place_barrier(colour, x, y, width)
+            return None
+        self.barriers[colour] = (x, y, width)
+        for left, top, off_x, off_y in self._uncovered(old_x, old_y,
+                                                       x, y, width):
+            self.map[top:top + off_y, left:left + off_x] = 0
+            self._changed(left, top, off_x, off_y, -1)
+        for left, top, off_x, off_y in self._uncovered(x, y, old_x, old_y,
+                                                       width):
+            self.map[top:top + off_y, left:left + off_x] = colour
+            self._changed(left, top, off_x, off_y, 1)
+
+    def remove_barrier(self, x: int, y: int) -> int:
+        """
+        Delete the barrier to which the transmitted point belongs.
+
+        :param x: coordinate of point by X
+        :param y: coordinate of point by Y
+        :return: colour(id) of removed barrier or 0 if the point is free
+        """
+
+        colour = self.barrier_at(x, y)
+        if colour is None:
+            return 0
+        return self.remove_barrier_by_id(colour)
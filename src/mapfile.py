@@ -0,0 +1,121 @@
+"""
+The module contains saving of maps to a binary file
+and loading them back through memory mapping.
+
+The file starts with a header, then the registry of barriers follows,
+and the raw grid starts at the next page boundary:
+
+    magic        8 bytes   b'RSMAP\\x00\\x00\\x01'
+    width        uint32
+    height       uint32
+    dtype        8 bytes   numpy type string, for example '<u2'
+    barriers     uint64    number of barriers in the registry
+    grid offset  uint64    position of the grid in the file
+    registry     barriers records of colour, x, y, width
+    grid         height x width cells in row order
+"""
+import os
+import struct
+
+import numpy as np
+
+from map import Map
+
+
+MAGIC = b'RSMAP\x00\x00\x01'
+HEADER = struct.Struct('<8sII8sQQ')
+REGISTRY = np.dtype([('colour', '<u8'), ('x', '<u4'), ('y', '<u4'),
+                     ('width', '<u4')])
+PAGE = 4096
+# rows of a map that are written at once when it is not a dense array
+BAND = 1024
+
+
+def save_map(field: Map, path: str):
+    """
+    Saves the map to a binary file
+
+    :param field: the map to be saved
+    :param path: path of the file
+    :return: None
+    """
+
+    registry = np.array(
+        [(colour, x, y, width) for colour, x, y, width
+         in field.list_barriers()], dtype=REGISTRY)
+    sample = field.window(0, 0, 1, 1)
+    dtype = sample.dtype.newbyteorder('<')
+    offset = HEADER.size + registry.nbytes
+    offset += -offset % PAGE
+    with open(path, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, field.width, field.height,
+                               dtype.str.encode().ljust(8, b'\0'),
+                               registry.size, offset))
+        file.write(registry.tobytes())
+        file.write(b'\0' * (offset - file.tell()))
+        if isinstance(field.map, np.ndarray):
+            np.ascontiguousarray(field.map, dtype=dtype).tofile(file)
+        else:
+            for top in range(0, field.height, BAND):
+                rows = min(BAND, field.height - top)
+                field.window(0, top, field.width, rows) \
+                    .astype(dtype).tofile(file)
+
+
+def read_header(path: str) -> dict:
+    """
+    Reads and checks the header of a map file
+
+    :param path: path of the file
+    :return: width, height, dtype, barriers registry and grid offset
+    """
+
+    size = os.path.getsize(path)
+    with open(path, 'rb') as file:
+        head = file.read(HEADER.size)
+        if len(head) < HEADER.size:
+            raise ValueError(f'{path} is not a map file')
+        magic, width, height, dtype, count, offset = HEADER.unpack(head)
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a map file')
+        dtype = np.dtype(dtype.rstrip(b'\0').decode())
+        if dtype.kind not in 'iu' or width <= 0 or height <= 0:
+            raise ValueError(f'{path} has a broken header')
+        if offset < HEADER.size + count * REGISTRY.itemsize or \
+                size != offset + width * height * dtype.itemsize:
+            raise ValueError(f'{path} is truncated or broken')
+        registry = np.frombuffer(file.read(count * REGISTRY.itemsize),
+                                 dtype=REGISTRY)
+    barriers = {int(colour): (int(x), int(y), int(side))
+                for colour, x, y, side in registry}
+    for x, y, side in barriers.values():
+        if x + side > width or y + side > height:
+            raise ValueError(f'{path} has a barrier outside the map')
+    return {'width': width, 'height': height, 'dtype': dtype,
+            'barriers': barriers, 'offset': offset}
+
+
+def load_map(path: str, mode: str = 'c', seed=None) -> Map:
+    """
+    Opens a map file without reading the grid: the grid is
+    memory-mapped and its pages are read when they are used.
+
+    With mode 'r' the map is read-only and processes that open the
+    same file share its pages. With mode 'c' every process shares the
+    pages until it changes them, changes stay in the process and never
+    reach the file. With mode 'r+' changes are written to the file.
+    Colours must fit into the type of the cells of the file, the grid
+    is not widened.
+
+    :param path: path of the file
+    :param mode: memory mapping mode, 'r', 'c' or 'r+' (default is 'c')
+    :param seed: seed or numpy.random.Generator used to place
+        barriers (default is None)
+    :return: map over the memory-mapped grid
+    """
+
+    header = read_header(path)
+    grid = np.memmap(path, dtype=header['dtype'], mode=mode,
+                     offset=header['offset'],
+                     shape=(header['height'], header['width']))
+    return Map.from_grid(grid, header['barriers'], seed)
@@ -0,0 +1,278 @@
+"""Module containing the occupancy index of the map"""
+import numpy as np
+
+
+class SummedAreaTable:
+    """
+    An integral image of the occupied points of the map.
+    Answers how many points of a rectangle are occupied in constant time
+    while no changes are kept aside.
+
+    Changes of the map are kept aside and counts are corrected by them,
+    so a count takes time in the number of the kept changes. They are
+    added to the table together once there are about as many of them
+    as the side of the map. Adding them touches the table below and to
+    the right of the changes, so a change costs about the side of the
+    map on average, not its area.
+
+    Attributes:
+        table : numpy.ndarray
+            a (height + 1) x (width + 1) array where table[y][x] is
+            the number of occupied points above and to the left of (x, y)
+    """
+
+    # the fewest changes kept aside before they are added to the table
+    PENDING = 32
+
+    def __init__(self, grid: np.ndarray):
+        """
+        Parameters
+        :param grid: cells of the map, non-zero cells are occupied
+        """
+
+        height, width = grid.shape
+        dtype = np.int32 if height * width < 2 ** 31 else np.int64
+        self._table = np.zeros((height + 1, width + 1), dtype=dtype)
+        np.cumsum(grid != 0, axis=0, dtype=dtype, out=self._table[1:, 1:])
+        np.cumsum(self._table[1:, 1:], axis=1, out=self._table[1:, 1:])
+        # x, y, width, height and sign of every change kept aside
+        limit = max(self.PENDING, int((height * width) ** 0.5))
+        self._pending = np.empty((5, limit), dtype=np.int64)
+        self._size = 0
+        self._delta = 0
+
+    @property
+    def table(self) -> np.ndarray:
+        if self._size:
+            self._flush()
+        return self._table
+
+    def count(self, x: int, y: int, off_x: int, off_y: int) -> int:
+        """
+        Counts occupied points of the zone, the zone must lie on the map
+
+        :param x: coordinate of the upper-left corner of the zone by X
+        :param y: coordinate of the upper-left corner of the zone by Y
+        :param off_x: width of the zone
+        :param off_y: height of the zone
+        :return: number of occupied points
+        """
+
+        table = self._table
+        count = int(table[y + off_y, x + off_x] - table[y, x + off_x]
+                    - table[y + off_y, x] + table[y, x])
+        if self._size:
+            lefts, tops, widths, heights, signs = \
+                self._pending[:, :self._size]
+            across = np.minimum(x + off_x, lefts + widths) \
+                - np.maximum(x, lefts)
+            down = np.minimum(y + off_y, tops + heights) - np.maximum(y, tops)
+            count += int((signs * np.maximum(across, 0)
+                          * np.maximum(down, 0)).sum())
+        return count
+
+    def total(self) -> int:
+        """Returns the number of occupied points on the whole map"""
+
+        return int(self._table[-1, -1]) + self._delta
+
+    def update(self, x: int, y: int, off_x: int, off_y: int, sign: int):
+        """
+        Accounts for a zone that became fully occupied (sign=1)
+        or fully free (sign=-1) without rebuilding the table
+
+        :param x: coordinate of the upper-left corner of the zone by X
+        :param y: coordinate of the upper-left corner of the zone by Y
+        :param off_x: width of the zone
+        :param off_y: height of the zone
+        :param sign: 1 if the zone was occupied, -1 if it was freed
+        :return: None
+        """
+
+        self._pending[:, self._size] = (x, y, off_x, off_y, sign)
+        self._size += 1
+        self._delta += sign * off_x * off_y
+        if self._size == self._pending.shape[1]:
+            self._flush()
+
+    def _flush(self):
+        """
+        Adds the changes kept aside to the table. A single change is
+        the outer product of two ramps below and to the right of the
+        zone, many changes are summed up as one grid of differences.
+
+        :return: None
+        """
+
+        pending = self._pending[:, :self._size].T.tolist()
+        self._size = 0
+        self._delta = 0
+        height, width = self._table.shape
+        dtype = self._table.dtype
+        if len(pending) == 1:
+            x, y, off_x, off_y, sign = pending[0]
+            rows = np.minimum(np.arange(1, height - y, dtype=dtype), off_y)
+            cols = np.minimum(np.arange(1, width - x, dtype=dtype), off_x)
+            delta = np.multiply.outer(rows, cols)
+            if sign > 0:
+                self._table[y + 1:, x + 1:] += delta
+            else:
+                self._table[y + 1:, x + 1:] -= delta
+            return None
+        top = min(change[1] for change in pending)
+        left = min(change[0] for change in pending)
+        delta = np.zeros((height - 1 - top, width - 1 - left), dtype=dtype)
+        for x, y, off_x, off_y, sign in pending:
+            delta[y - top:y - top + off_y, x - left:x - left + off_x] += sign
+        np.cumsum(delta, axis=0, out=delta)
+        np.cumsum(delta, axis=1, out=delta)
+        self._table[top + 1:, left + 1:] += delta
+
+
+class ObstacleIndex:
+    """
+    Distances from every point of the map to the nearest occupied
+    point or the border in four directions, like range sensors.
+    A distance is the number of free points between the point and
+    the obstacle, that is how many steps the robot can make.
+    An occupied point keeps the distances it would have if it were
+    free, so a change of a zone needs only the distances around it.
+
+    Attributes:
+        up, down, left, right : numpy.ndarray
+            height x width arrays of the distances in every direction
+    """
+
+    # rows or columns handled at once while the index is built
+    BAND = 1024
+
+    def __init__(self, grid: np.ndarray):
+        """
+        Parameters
+        :param grid: cells of the map, non-zero cells are occupied
+        """
+
+        height, width = grid.shape
+        dtype = np.min_scalar_type(max(height, width))
+        self.up = np.empty((height, width), dtype=dtype)
+        self.down = np.empty((height, width), dtype=dtype)
+        self.left = np.empty((height, width), dtype=dtype)
+        self.right = np.empty((height, width), dtype=dtype)
+        for y in range(0, height, self.BAND):
+            self._rows(grid, y, min(y + self.BAND, height))
+        for x in range(0, width, self.BAND):
+            self._columns(grid, x, min(x + self.BAND, width))
+
+    @staticmethod
+    def _lines(occupied: np.ndarray) -> tuple:
+        """
+        Finds the distances along the rows of a block
+
+        :param occupied: boolean array, True in occupied points
+        :return: distances to the left and to the right
+        """
+
+        length = occupied.shape[1]
+        positions = np.arange(length)
+        before = np.where(occupied, positions, -1)
+        np.maximum.accumulate(before, axis=1, out=before)
+        after = np.where(occupied, positions, length)[:, ::-1]
+        after = np.minimum.accumulate(after, axis=1)[:, ::-1]
+        left = np.empty_like(before)
+        left[:, 0] = 0
+        left[:, 1:] = positions[1:] - before[:, :-1] - 1
+        right = np.empty_like(after)
+        right[:, -1] = 0
+        right[:, :-1] = after[:, 1:] - positions[:-1] - 1
+        return left, right
+
+    def _rows(self, grid: np.ndarray, top: int, bottom: int):
+        """Finds the distances to the left and to the right in the rows"""
+
+        self.left[top:bottom], self.right[top:bottom] = \
+            self._lines(grid[top:bottom] != 0)
+
+    def _columns(self, grid: np.ndarray, first: int, last: int):
+        """Finds the distances up and down in the columns"""
+
+        up, down = self._lines((grid[:, first:last] != 0).T)
+        self.up[:, first:last], self.down[:, first:last] = up.T, down.T
+
+    @staticmethod
+    def _line(cells: np.ndarray, before: np.ndarray, after: np.ndarray,
+              start: int, stop: int):
+        """
+        Corrects the distances in one row or column after the points
+        from start to stop were all occupied or all freed. The distances
+        to the nearest obstacles around the change are still right,
+        only the distances that point to the change or across it are
+        written, that is the run of free points around the change.
+
+        :param cells: cells of the row or the column after the change
+        :param before: distances to the left or up
+        :param after: distances to the right or down
+        :param start: the first changed point
+        :param stop: the last changed point
+        :return: None
+        """
+
+        first = start - int(before[start]) - 1
+        last = stop + int(after[stop]) + 1
+        low, high = max(first, 0), min(last, cells.shape[0] - 1)
+        if cells[start]:
+            after[low:start] = np.arange(start - low, 0, -1) - 1
+            after[start:stop] = 0
+            before[start + 1:stop + 1] = 0
+            before[stop + 1:high + 1] = np.arange(high - stop)
+        else:
+            after[low:stop + 1] = np.arange(last - low, last - stop - 1,
+                                            -1) - 1
+            before[start:high + 1] = np.arange(start - first,
+                                               high - first + 1) - 1
+
+    def update(self, grid: np.ndarray, x: int, y: int,
+               off_x: int, off_y: int):
+        """
+        Accounts for a changed zone, only the rows and the columns
+        that cross the zone are found again, between the nearest
+        obstacles around the zone
+
+        :param grid: cells of the map after the change
+        :param x: coordinate of the upper-left corner of the zone by X
+        :param y: coordinate of the upper-left corner of the zone by Y
+        :param off_x: width of the zone
+        :param off_y: height of the zone
+        :return: None
+        """
+
+        for row in range(y, y + off_y):
+            self._line(grid[row], self.left[row], self.right[row],
+                       x, x + off_x - 1)
+        for column in range(x, x + off_x):
+            self._line(grid[:, column], self.up[:, column],
+                       self.down[:, column], y, y + off_y - 1)
+
+    def sense(self, x: int, y: int) -> tuple:
+        """
+        Returns the distances from the point in four directions
+
+        :param x: X coordinate of the point
+        :param y: Y coordinate of the point
+        :return: distances up, down, to the left and to the right
+        """
+
+        return (int(self.up[y, x]), int(self.down[y, x]),
+                int(self.left[y, x]), int(self.right[y, x]))
+
+    def sense_many(self, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        """
+        Returns the distances from many points at once
+
+        :param xs: X coordinates of the points
+        :param ys: Y coordinates of the points
+        :return: n x 4 array of the distances up, down,
+            to the left and to the right
+        """
+
+        return np.stack((self.up[ys, xs], self.down[ys, xs],
+                         self.left[ys, xs], self.right[ys, xs]), axis=1)
@@ -0,0 +1,203 @@
+"""
+The module contains the route planner that drives the robot
+to a target point along a shortest path.
+"""
+from array import array
+from collections import OrderedDict, deque
+from typing import List, Optional
+
+import numpy as np
+
+from map import Map
+from robot import Robot
+from engine import Engine, EngineResult, compile_commands
+
+
+# offsets by X and Y of the commands that move the robot
+STEPS = {'UP': (0, -1), 'DOWN': (0, 1), 'LEFT': (-1, 0), 'RIGHT': (1, 0)}
+
+
+class Planner:
+    """
+    A class used to plan shortest paths on the map.
+
+    A direction command turns the robot as many times as needed and then
+    makes one step, so turns cost nothing and a shortest path is a
+    breadth-first search over free points. The distances from every
+    point to a target are cached for the most recently used targets
+    and dropped when the barriers of the map change.
+
+    On maps larger than MAX_SEARCH_AREA points the search is limited
+    to the box around the robot and the target widened by the margin,
+    so paths that leave the box are not found.
+
+    Attributes:
+        field : Map
+            the map on which paths are planned
+        capacity : int
+            number of targets whose distances are cached
+        margin : int
+            widening of the search box, None to search the whole map
+    """
+
+    MAX_SEARCH_AREA = 4096 * 4096
+
+    def __init__(self, field: Map, capacity: int = 8, margin: int = None):
+        """
+        Parameters
+        :param field: the map on which paths are planned
+        :param capacity: number of targets whose distances are cached
+            (default is 8)
+        :param margin: widening of the search box, by default the whole
+            map is searched unless it is larger than MAX_SEARCH_AREA
+        """
+
+        self.field = field
+        self.capacity = capacity
+        if margin is None and \
+                field.width * field.height > self.MAX_SEARCH_AREA:
+            margin = 256
+        self.margin = margin
+        self._cache = OrderedDict()
+        self._revision = field.revision
+
+    def _search(self, x: int, y: int, region: tuple) -> np.ndarray:
+        """
+        Computes the number of steps from every point of the region
+        to the target
+
+        :param x: X coordinate of the target
+        :param y: Y coordinate of the target
+        :param region: X, Y of the upper-left corner, width and height
+            of the searched zone
+        :return: array of distances over the region, -1 if unreachable
+        """
+
+        left, top, width, height = region
+        blocked = (self.field.window(*region) != 0).tobytes()
+        distances = array('i', [-1]) * (width * height)
+        start = (y - top) * width + x - left
+        distances[start] = 0
+        queue = deque((start,))
+        pop, push = queue.popleft, queue.append
+        while queue:
+            point = pop()
+            step = distances[point] + 1
+            column = point % width
+            for near in (point - width if point >= width else -1,
+                         point + width if point + width < width * height
+                         else -1,
+                         point - 1 if column else -1,
+                         point + 1 if column + 1 < width else -1):
+                if near >= 0 and distances[near] < 0 and not blocked[near]:
+                    distances[near] = step
+                    push(near)
+        return np.frombuffer(distances, dtype=np.int32).reshape(height,
+                                                                width)
+
+    def _distances(self, x: int, y: int, region: tuple) -> np.ndarray:
+        """
+        Returns the distances over the region from the cache
+        or computes them
+
+        :return: array of distances over the region, -1 if unreachable
+        """
+
+        if self._revision != self.field.revision:
+            self._cache.clear()
+            self._revision = self.field.revision
+        key = (x, y, region)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        distances = self._search(x, y, region)
+        self._cache[key] = distances
+        if len(self._cache) > self.capacity:
+            self._cache.popitem(last=False)
+        return distances
+
+    def distances(self, x: int, y: int) -> np.ndarray:
+        """
+        Returns the distances from every point of the map to the target
+
+        :param x: X coordinate of the target
+        :param y: Y coordinate of the target
+        :return: height x width array of distances, -1 if unreachable
+        """
+
+        return self._distances(x, y, (0, 0, self.field.width,
+                                      self.field.height))
+
+    def _region(self, c_x: int, c_y: int, x: int, y: int) -> tuple:
+        """
+        Chooses the zone searched for a path between two points
+
+        :return: X, Y of the upper-left corner, width and height
+        """
+
+        if self.margin is None:
+            return 0, 0, self.field.width, self.field.height
+        left = max(min(c_x, x) - self.margin, 0)
+        top = max(min(c_y, y) - self.margin, 0)
+        right = min(max(c_x, x) + self.margin + 1, self.field.width)
+        bottom = min(max(c_y, y) + self.margin + 1, self.field.height)
+        return left, top, right - left, bottom - top
+
+    def path(self, robot: Robot, x: int, y: int) -> Optional[List[str]]:
+        """
+        Plans the commands that bring the robot to the target.
+        Among shortest paths the one that keeps the direction
+        of the robot longer is preferred.
+
+        :param robot: the robot that should reach the target
+        :param x: X coordinate of the target
+        :param y: Y coordinate of the target
+        :return: list of direction commands,
+            None if the target is not reachable
+        """
+
+        if not (0 <= x < self.field.width and 0 <= y < self.field.height) \
+                or not self.field.free_point(x, y):
+            return None
+        c_x, c_y = robot.c_x, robot.c_y
+        left, top, width, height = region = self._region(c_x, c_y, x, y)
+        distances = self._distances(x, y, region)
+        c_x, c_y = c_x - left, c_y - top
+        remaining = int(distances[c_y, c_x])
+        if remaining < 0:
+            return None
+        commands = []
+        direction = robot.orientation
+        while remaining:
+            order = [direction] + [name for name in STEPS
+                                   if name != direction]
+            for name in order:
+                off_x, off_y = STEPS[name]
+                near_x, near_y = c_x + off_x, c_y + off_y
+                if 0 <= near_x < width and 0 <= near_y < height \
+                        and distances[near_y, near_x] == remaining - 1:
+                    break
+            commands.append(name)
+            direction, c_x, c_y = name, near_x, near_y
+            remaining -= 1
+        return commands
+
+
+def goto(field: Map, robot: Robot, x: int, y: int,
+         planner: Planner = None) -> Optional[EngineResult]:
+    """
+    Drives the robot to the target without terminal I/O
+
+    :param field: the field where the robot moves
+    :param robot: the robot that should reach the target
+    :param x: X coordinate of the target
+    :param y: Y coordinate of the target
+    :param planner: planner with cached distances (default is None)
+    :return: result of the engine run, None if the target is not reachable
+    """
+
+    planner = planner or Planner(field)
+    commands = planner.path(robot, x, y)
+    if commands is None:
+        return None
+    return Engine(field, robot).execute(compile_commands(commands))
@@ -0,0 +1,194 @@
+"""Module containing the barrier placement engine"""
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+class PlacementEngine:
+    """
+    Keeps the set of all positions and sizes where a barrier fits.
+
+    For every point of the map the engine stores the size of the
+    largest free square whose upper-left corner is in this point
+    (limited by the maximum barrier size). A point with the value m
+    is the corner of exactly m feasible barriers, so the values
+    describe the whole set of feasible (x, y, width) candidates.
+
+    Attributes:
+        field : Map
+            the map on which barriers are placed
+        max_size : int
+            the largest allowed width of a barrier
+    """
+
+    def __init__(self, field, max_size: int):
+        """
+        Parameters
+        :param field: the map on which barriers are placed
+        :param max_size: the largest allowed width of a barrier
+        """
+
+        self.field = field
+        self.max_size = max_size
+        self._sizes = None
+        self._row_totals = None
+
+    def _fit(self, top: int, left: int, limit: np.ndarray) -> np.ndarray:
+        """
+        Finds the largest free squares for a block of corners
+        with a vectorized binary search over the occupancy index.
+        The upper bounds are checked first, so corners whose squares
+        did not shrink are settled at once. The other corners double
+        the probed size until it collides and then halve the interval,
+        so the work depends on the found sizes rather than the bounds.
+        Only the corners whose size is not known yet take part
+        in each step of the search.
+
+        :param top: Y coordinate of the upper-left corner of the block
+        :param left: X coordinate of the upper-left corner of the block
+        :param limit: upper bounds of the sizes for every corner
+        :return: sizes of the largest free squares
+        """
+
+        table = self.field.occupancy().table
+        stride = table.shape[1]
+        flat = table.ravel()
+        rows, columns = limit.shape
+        corners = ((np.arange(top, top + rows, dtype=np.int64) * stride)
+                   [:, None] + np.arange(left, left + columns)).ravel()
+        high = limit.ravel().astype(limit.dtype)
+        down = high.astype(np.int64) * stride
+        fits = flat[corners + down + high] - flat[corners + high] \
+            - flat[corners + down] + flat[corners] == 0
+        low = np.where(fits, high, 0).astype(limit.dtype)
+        active = np.flatnonzero(~fits)
+        high[active] -= 1
+        active = active[high[active] > 0]
+        growing = np.ones(active.size, dtype=bool)
+        while active.size:
+            corner = corners[active]
+            lower, upper = low[active], high[active]
+            mid = np.where(growing, np.minimum(2 * lower + 1, upper),
+                           (lower + upper + 1) // 2)
+            down = mid.astype(np.int64) * stride
+            free = flat[corner + down + mid] - flat[corner + mid] \
+                - flat[corner + down] + flat[corner] == 0
+            lower = np.where(free, mid, lower)
+            upper = np.where(free, upper, mid - 1)
+            low[active], high[active] = lower, upper
+            growing &= free
+            unknown = lower < upper
+            active, growing = active[unknown], growing[unknown]
+        return low.reshape(limit.shape)
+
+    def _build(self):
+        """
+        Computes the sizes for the whole map
+
+        :return: None
+        """
+
+        height, width = self.field.height, self.field.width
+        ys = np.arange(height, 0, -1, dtype=np.int32)[:, None]
+        xs = np.arange(width, 0, -1, dtype=np.int32)[None, :]
+        limit = np.minimum(np.minimum(ys, xs), self.max_size)
+        self._sizes = self._fit(0, 0, limit)
+        self._row_totals = self._sizes.sum(axis=1, dtype=np.int64)
+
+    def refit(self):
+        """
+        Recomputes the sizes for the whole map after barriers were
+        added. The squares can only shrink, so the old sizes are used
+        as the upper bounds of the search.
+
+        :return: None
+        """
+
+        if self._sizes is None:
+            return None
+        self._sizes = self._fit(0, 0, self._sizes)
+        self._row_totals = self._sizes.sum(axis=1, dtype=np.int64)
+
+    def update(self, x: int, y: int, width: int, height: int, sign: int):
+        """
+        Updates the sizes after a change of the map.
+        A new barrier can only shrink the squares whose corner lies
+        above and to the left of it within the current largest size,
+        so only that block is searched again. Freed zones reset
+        the engine and the sizes are computed again when needed.
+
+        :param x: coordinate of the upper-left corner of the zone by X
+        :param y: coordinate of the upper-left corner of the zone by Y
+        :param width: width of the changed zone
+        :param height: height of the changed zone
+        :param sign: 1 if the zone was occupied, -1 if it was freed
+        :return: None
+        """
+
+        if self._sizes is None:
+            return None
+        if sign < 0:
+            self._sizes = None
+            self._row_totals = None
+            return None
+        reach = int(self._sizes.max())
+        top, left = max(y - reach + 1, 0), max(x - reach + 1, 0)
+        bottom, right = y + height, x + width
+        block = self._sizes[top:bottom, left:right]
+        block[...] = self._fit(top, left, block)
+        self._row_totals[top:bottom] = \
+            self._sizes[top:bottom].sum(axis=1, dtype=np.int64)
+
+    def candidates(self) -> int:
+        """
+        Counts the feasible (x, y, width) candidates of a barrier
+
+        :return: number of candidates, 0 if no barrier can be placed
+        """
+
+        if self._sizes is None:
+            self._build()
+        return int(self._row_totals.sum())
+
+    def sample(self) -> Optional[Tuple[int, int, int]]:
+        """
+        Chooses a candidate uniformly from the set of feasible ones
+
+        :return: x, y and width of the barrier or None if nothing fits
+        """
+
+        total = self.candidates()
+        if total == 0:
+            return None
+        rng = self.field.rng
+        rest = int(rng.integers(total))
+        bounds = np.cumsum(self._row_totals)
+        y = int(np.searchsorted(bounds, rest, side='right'))
+        if y:
+            rest -= int(bounds[y - 1])
+        x = int(np.searchsorted(np.cumsum(self._sizes[y]), rest,
+                                side='right'))
+        return x, y, int(rng.integers(1, self._sizes[y, x] + 1))
+
+    def sample_many(self, count: int) -> Tuple[np.ndarray, ...]:
+        """
+        Chooses candidates independently and uniformly
+        from the set of feasible ones, they may overlap each other
+
+        :param count: number of candidates
+        :return: arrays of x, y and width of the candidates,
+            empty if nothing fits
+        """
+
+        total = self.candidates()
+        if total == 0:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, empty
+        rng = self.field.rng
+        sizes = self._sizes.ravel()
+        points = np.searchsorted(np.cumsum(sizes, dtype=np.int64),
+                                 rng.integers(total, size=count),
+                                 side='right')
+        widths = rng.integers(1, sizes[points].astype(np.int64) + 1)
+        ys, xs = np.divmod(points, self.field.width)
+        return xs, ys, widths
@@ -0,0 +1,169 @@
+"""
+The module contains the viewport renderer that formats only
+the visible area of the field and redraws only the changed points.
+"""
+import sys
+from typing import List, Tuple
+from stats import STATS
+
+
+COLORS = {
+    'red': '\033[31m',
+    'yellow': '\033[33m',
+    'purple': '\033[35m',
+    'white': '\033[37m',
+    'teal': '\033[36m'
+}
+
+BORDER = f'{COLORS["purple"]}#{COLORS["white"]}'
+BARRIER = f'{COLORS["red"]}+{COLORS["white"]}'
+FENCE = f'{COLORS["teal"]}"{COLORS["white"]}'
+HIDDEN = f'{COLORS["teal"]}.{COLORS["white"]}'
+
+
+class ViewportRenderer:
+    """
+    A class used to draw the visible area of the field in the terminal
+
+    The first frame is printed entirely, the next frames only move
+    the cursor to the points that changed and rewrite them.
+
+    Attributes:
+        out : file
+            stream where the frames are written
+        footer : str
+            text that is kept under the frame
+        visibility : Visibility
+            line of sight of the robot, the points it does not see
+            are hidden, None to show the whole visible area
+    """
+
+    def __init__(self, out=None, footer: str = '', visibility=None):
+        """
+        Parameters
+        :param out: stream where the frames are written
+            (default is sys.stdout)
+        :param footer: text that is kept under the frame (default is '')
+        :param visibility: line of sight of the robot (default is None)
+        """
+
+        self.out = out or sys.stdout
+        self.footer = footer
+        self.visibility = visibility
+        self._frame = None
+        self._layer = {}
+        self._field = None
+        self._revision = None
+
+    def _static(self, field, x: int, y: int) -> str:
+        """
+        Returns the image of the point without the robot.
+        Barriers do not move during a session, so images are cached
+        until the revision of the map changes.
+
+        :param field: the field that is drawn
+        :param x: X coordinate of the point, may lie on the border
+        :param y: Y coordinate of the point, may lie on the border
+        :return: image of the point
+        """
+
+        if field is not self._field or field.revision != self._revision:
+            self._layer.clear()
+            self._field = field
+            self._revision = field.revision
+        point = self._layer.get((x, y))
+        if point is None:
+            if 0 <= x < field.width and 0 <= y < field.height:
+                point = ' ' if field.free_point(x, y) else BARRIER
+            else:
+                point = BORDER
+            self._layer[(x, y)] = point
+        return point
+
+    def viewport(self, robot, field, coord: Tuple) -> List[List[str]]:
+        """
+        Formats the visible area of the field and the robot in it
+
+        :param robot: the robot whose position is displayed
+        :param field: the field where the robot moves
+        :param coord: coordinates of view zone
+        :return: rows of images of the visible points
+        """
+
+        picture = [[self._static(field, x, y)
+                    for x in range(coord[0] - 1, coord[1] + 1)]
+                   for y in range(coord[2] - 1, coord[3] + 1)]
+        if self.visibility is not None:
+            view = self.visibility.view(robot.c_x, robot.c_y)
+            for y in range(coord[2], min(coord[3], field.height - 1) + 1):
+                row = picture[y - coord[2] + 1]
+                for x in range(coord[0], min(coord[1], field.width - 1) + 1):
+                    if (x, y) not in view:
+                        row[x - coord[0] + 1] = HIDDEN
+        row, column = robot.c_y - coord[2] + 1, robot.c_x - coord[0] + 1
+        picture[row][column] = \
+            f'{COLORS["yellow"]}{robot.view}{COLORS["white"]}'
+        return picture
+
+    def render(self, robot, field, coord: Tuple):
+        """
+        Displays the visible area, rewriting only the changed points
+        if the previous frame has the same size
+
+        :param robot: the robot whose position is displayed
+        :param field: the field where the robot moves
+        :param coord: coordinates of view zone
+        :return: None
+        """
+
+        frame = self.viewport(robot, field, coord)
+        previous = self._frame
+        self._frame = frame
+        if previous is None or len(previous) != len(frame) \
+                or len(previous[0]) != len(frame[0]):
+            STATS.count('cells_rendered', len(frame) * len(frame[0]))
+            self.out.write('\033[H\033[2J' + frame_text(frame) + '\n'
+                           + (self.footer + '\n' if self.footer else ''))
+            self.out.flush()
+            return None
+        changes = [f'\033[{y + 2};{2 * x + 3}H{point}'
+                   for y, row in enumerate(frame)
+                   for x, point in enumerate(row)
+                   if point != previous[y][x]]
+        STATS.count('cells_rendered', len(changes))
+        if changes:
+            self.out.write('\0337' + ''.join(changes) + '\0338')
+            self.out.flush()
+
+    def clear_status(self):
+        """
+        Moves the cursor under the frame and
+        clears the messages printed after it
+
+        :return: None
+        """
+
+        if self._frame is not None:
+            line = len(self._frame) + 3
+            if self.footer:
+                line += self.footer.count('\n') + 1
+            self.out.write(f'\033[{line};1H\033[J')
+            self.out.flush()
+
+    def reset(self):
+        """Forces the next frame to be printed entirely"""
+
+        self._frame = None
+
+
+def frame_text(picture: List[List[str]]) -> str:
+    """
+    Joins the images of the points into a frame with a fence around it
+
+    :param picture: rows of images of the visible points
+    :return: text of the frame
+    """
+
+    fence = f'{COLORS["teal"]}" {COLORS["white"]}' * (len(picture[0]) + 2)
+    rows = [' '.join([FENCE, *row, FENCE]) for row in picture]
+    return '\n'.join([fence, *rows, fence])
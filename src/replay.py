@@ -0,0 +1,317 @@
+"""
+The module contains recording of sessions with periodic snapshots
+and their replay from any step.
+
+A recording is a directory with the command log, one byte per applied
+command (its index in COMMANDS), and snapshots made every interval
+of commands. A snapshot is a JSON file with the state of the robot
+and the name of a map file in the mapfile format, the map file is
+shared by the snapshots while the map does not change.
+
+To seek a step the nearest snapshot before it is loaded and only
+the commands after the snapshot are applied by the engine,
+without drawing.
+
+Usage:
+    recorder = Recorder('../logs/replay', field, robot)
+    recorder.record('UP')
+    recorder.close()
+    field, robot = Replay('../logs/replay').seek(3000000)
+"""
+import os
+import sys
+import json
+import argparse
+from bisect import bisect_right
+from typing import Iterable, List, Tuple
+
+import numpy as np
+
+from map import Map
+from robot import Robot
+from engine import Engine, EngineResult, Outcomes, VIEWS, \
+    compile_commands
+from mapfile import save_map, load_map
+from traces import COMMANDS
+
+COMMANDS_NAME = 'commands.bin'
+CODES = {command: bytes((code,)) for code, command in enumerate(COMMANDS)}
+# commands between two snapshots
+INTERVAL = 100000
+
+
+class Recorder:
+    """
+    A class used to record the commands applied to a robot
+    and snapshots of the robot and the map
+
+    Attributes:
+        path : str
+            directory of the recording
+        field : Map
+            the map where the robot moves
+        robot : Robot
+            the recorded robot
+        interval : int
+            commands between two snapshots
+        steps : int
+            number of recorded commands
+    """
+
+    def __init__(self, path: str, field: Map, robot: Robot,
+                 interval: int = INTERVAL):
+        """
+        Parameters
+        :param path: directory of the recording, a recording
+            in it is replaced
+        :param field: the map where the robot moves
+        :param robot: the recorded robot, its current state
+            is the first snapshot
+        :param interval: commands between two snapshots
+            (default is INTERVAL)
+        """
+
+        if interval <= 0:
+            raise ValueError('Interval should be more than 0')
+        os.makedirs(path, exist_ok=True)
+        for name in os.listdir(path):
+            if name == COMMANDS_NAME or name.startswith(('snapshot-',
+                                                          'map-')):
+                os.remove(os.path.join(path, name))
+        self.path = path
+        self.field = field
+        self.robot = robot
+        self.interval = interval
+        self.steps = 0
+        self._log = open(os.path.join(path, COMMANDS_NAME), 'wb')
+        self._map = None
+        self._revision = None
+        self.snapshot()
+
+    def snapshot(self):
+        """
+        Saves the state of the robot after the recorded commands,
+        the map is saved again only if it changed
+
+        :return: None
+        """
+
+        if self._map is None or self._revision != self.field.revision:
+            self._map = f'map-{self.steps:012d}.rsmap'
+            self._revision = self.field.revision
+            save_map(self.field, os.path.join(self.path, self._map))
+        robot = self.robot
+        with open(os.path.join(self.path,
+                               f'snapshot-{self.steps:012d}.json'),
+                  'w') as file:
+            json.dump({'steps': self.steps, 'map': self._map,
+                       'c_x': robot.c_x, 'c_y': robot.c_y,
+                       'angle': robot.angle,
+                       'orientation': robot.orientation,
+                       'step': robot.step}, file)
+
+    def record(self, command: str, count: int = 1):
+        """
+        Adds commands that were applied to the robot,
+        a snapshot is made when an interval ends
+
+        :param command: one of the robot commands
+        :param count: number of repeats (default is 1)
+        :return: None
+        """
+
+        self._write(((command, count),), count)
+
+    def _write(self, program: List[Tuple[str, int]], size: int):
+        """Adds runs of commands with the given total length"""
+
+        self._log.write(b''.join(CODES[command] * count
+                                 for command, count in program))
+        self.steps += size
+        if self.steps % self.interval < size:
+            self._log.flush()
+            self.snapshot()
+
+    def run(self, engine: Engine, commands: Iterable[str]) -> EngineResult:
+        """
+        Applies the commands with the engine and records them.
+        The commands of every interval are applied at once,
+        runs of the same command are split at the snapshots.
+
+        :param engine: the engine of the recorded robot
+        :param commands: iterable or stream of commands
+        :return: the final state of the robot and outcome of every command
+        """
+
+        outcomes = Outcomes()
+        elapsed = 0.0
+        program, size = [], 0
+        # commands left before the next snapshot
+        left = self.interval - self.steps % self.interval
+        for command, count in compile_commands(commands):
+            while count >= left:
+                program.append((command, left))
+                count -= left
+                elapsed += self._apply(engine, program, size + left,
+                                       outcomes)
+                program, size, left = [], 0, self.interval
+            if count:
+                program.append((command, count))
+                size += count
+                left -= count
+        if program:
+            elapsed += self._apply(engine, program, size, outcomes)
+        return EngineResult(engine.robot, outcomes, elapsed)
+
+    def _apply(self, engine: Engine, program: List[Tuple[str, int]],
+               size: int, outcomes: Outcomes) -> float:
+        """
+        Applies and records runs of commands, single commands
+        take the fast path of Engine.run
+
+        :return: seconds spent by the engine
+        """
+
+        result = engine.run(command if count == 1 else f'{command}*{count}'
+                            for command, count in program)
+        outcomes += result.outcomes
+        self._write(program, size)
+        return result.elapsed
+
+    def close(self):
+        """Writes the command log"""
+
+        self._log.close()
+
+    def __enter__(self) -> 'Recorder':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def runs(codes: np.ndarray) -> List[Tuple[str, int]]:
+    """
+    Turns command codes into runs of the same command for the engine
+
+    :param codes: indexes of the commands in COMMANDS
+    :return: pairs of a command and the number of its repeats
+    """
+
+    if not len(codes):
+        return []
+    starts = np.flatnonzero(np.diff(codes)) + 1
+    starts = np.concatenate(([0], starts))
+    counts = np.diff(np.append(starts, len(codes)))
+    return [(COMMANDS[code], count) for code, count
+            in zip(codes[starts].tolist(), counts.tolist())]
+
+
+class Replay:
+    """
+    A class used to restore a recorded session at any step
+
+    Attributes:
+        path : str
+            directory of the recording
+        snapshots : list
+            numbers of the steps that have snapshots, in order
+        steps : int
+            number of recorded commands
+    """
+
+    def __init__(self, path: str):
+        """
+        Parameters
+        :param path: directory of the recording
+        """
+
+        self.path = path
+        self.snapshots = sorted(
+            int(name[len('snapshot-'):-len('.json')])
+            for name in os.listdir(path)
+            if name.startswith('snapshot-') and name.endswith('.json'))
+        if not self.snapshots:
+            raise ValueError(f'{path} has no snapshots')
+        log = os.path.join(path, COMMANDS_NAME)
+        self._codes = np.memmap(log, dtype=np.uint8, mode='r') \
+            if os.path.getsize(log) else np.empty(0, dtype=np.uint8)
+        self.steps = len(self._codes)
+
+    def commands(self, first: int, last: int) -> List[str]:
+        """
+        Returns the recorded commands from the first step
+        up to the last step, not including it
+
+        :param first: number of the first step
+        :param last: number of the step after the last one
+        :return: the commands
+        """
+
+        return [COMMANDS[code] for code in self._codes[first:last].tolist()]
+
+    def load(self, steps: int) -> Tuple[Map, Robot]:
+        """
+        Restores the state of a snapshot
+
+        :param steps: number of the step of the snapshot
+        :return: the map and the robot
+        """
+
+        with open(os.path.join(self.path,
+                               f'snapshot-{steps:012d}.json')) as file:
+            state = json.load(file)
+        field = load_map(os.path.join(self.path, state['map']))
+        robot = Robot(state['c_x'], state['c_y'])
+        robot.angle = state['angle']
+        robot.orientation = state['orientation']
+        robot.view = VIEWS[robot.orientation]
+        robot.step = state['step']
+        return field, robot
+
+    def seek(self, step: int) -> Tuple[Map, Robot]:
+        """
+        Restores the state after the number of commands from the
+        nearest snapshot, the rest commands are applied without drawing
+
+        :param step: number of commands applied since the start
+        :return: the map and the robot
+        """
+
+        if not 0 <= step <= self.steps:
+            raise ValueError(f'Step should be from 0 to {self.steps}')
+        nearest = self.snapshots[bisect_right(self.snapshots, step) - 1]
+        field, robot = self.load(nearest)
+        Engine(field, robot).execute(runs(self._codes[nearest:step]))
+        return field, robot
+
+
+def main(argv=None):
+    """Seeks a step of a recording and prints or plays it"""
+
+    parser = argparse.ArgumentParser(
+        description='Restore a recorded session at any step')
+    parser.add_argument('recording', nargs='?', default='../logs/replay')
+    parser.add_argument('--seek', type=int, default=0,
+                        help='number of commands applied before the start')
+    parser.add_argument('--play', type=int, default=0,
+                        help='number of commands drawn one by one')
+    args = parser.parse_args(argv)
+
+    import simulator
+    from renderer import ViewportRenderer
+    replay = Replay(args.recording)
+    field, robot = replay.seek(args.seek)
+    if args.play:
+        renderer = ViewportRenderer()
+        for command in replay.commands(args.seek, args.seek + args.play):
+            simulator.move_robot(command, robot, field.map)
+            simulator.draw(robot, field, renderer)
+    json.dump({'steps': replay.steps, 'c_x': robot.c_x, 'c_y': robot.c_y,
+               'angle': robot.angle, 'orientation': robot.orientation},
+              sys.stdout)
+    print()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,8 @@
 """Module containing the robot class"""
-from typing import Tuple
+from typing import Optional, Tuple
+from traces import Trace, MOVED, TURNED, HIT_BORDER, HIT_BARRIER
+from stats import STATS
+from events import EventBus
 
 
 class Robot:
@@ -21,8 +24,12 @@ class Robot:
             the current value of the angle
         step : int
             the step size of the robot
-        trace : str
+        trace : Trace
             contains logs of robot movements
+        coverage : Coverage
+            points visited by the robot, None if they are not counted
+        events : EventBus
+            passes the outcome of every command to the subscribed sinks
     """
     __slots__ = ('view',
                  'orientation',
@@ -31,7 +38,9 @@ class Robot:
                  'c_x',
                  'angle',
                  'step',
-                 'trace')
+                 'trace',
+                 'coverage',
+                 'events')
 
     def __init__(self, center_x: int, center_y: int):
         """
@@ -52,7 +61,9 @@ class Robot:
         }
         self.angle = 90
         self.step = 1
-        self.trace = ''
+        self.trace = Trace()
+        self.coverage = None
+        self.events = EventBus()
 
     def turn_90(self):
         """Rotates the robot 90 degrees"""
@@ -104,6 +115,8 @@ class Robot:
         :return: None
         """
 
+        # rotations call it with a zero step
+        moved = self.step != 0
         if self.orientation == 'UP':
             self.c_y -= self.step
         elif self.orientation == 'DOWN':
@@ -113,6 +126,8 @@ class Robot:
         elif self.orientation == 'RIGHT':
             self.c_x += self.step
         self.step = 1
+        if moved and self.coverage is not None:
+            self.coverage.visit(self.c_x, self.c_y)
 
     def update_orientation(self, rotation: str = None) -> Tuple[int, int]:
         """
@@ -147,50 +162,79 @@ class Robot:
             return self.step, 0
         return 0, 0
 
-    def check_collisions(self, field: list, off_x: int, off_y: int) -> bool:
+    def collision(self, field: list, off_x: int, off_y: int) -> Optional[int]:
         """
-        Checks whether the robot has encountered an obstacle or not.
+        Finds out what the robot encounters after the offset
 
         :param field: field on which the robot rides
         :param off_x: robot's offset by X
         :param off_y: robot's offset by Y
-        :return: True if a collisions was found else False
+        :return: HIT_BORDER or HIT_BARRIER code, None if the way is free
         """
 
         if off_x == 0 and off_y == 0:
-            return False
+            return None
+        if self.c_y + off_y < 0 or self.c_x + off_x < 0:
+            return HIT_BORDER
         try:
-            if self.c_y + off_y < 0:
-                print('Oops...We hit a border. Try again.')
-                return True
-            elif self.c_x + off_x < 0:
-                print('Oops...We hit a border. Try again.')
-                return True
-            elif field[self.c_y + off_y][self.c_x + off_x] > 0:
-                print('Oops...We hit a barrier. Try again.')
-                return True
+            if field[self.c_y + off_y][self.c_x + off_x] > 0:
+                return HIT_BARRIER
         except IndexError:
-            print('Oops...We hit a border. Try again.')
-            return True
-        return False
+            return HIT_BORDER
+        return None
 
-    def print_state(self, off_x: int, off_y: int):
+    def sense(self, field) -> Tuple[int, int, int, int]:
         """
-        Displays the robot status to the user after
+        Reads the range sensors of the robot
+
+        :param field: the map on which the robot rides
+        :return: number of free points up, down, to the left and
+            to the right before a barrier or a border
+        """
+
+        return field.sense(self.c_x, self.c_y)
+
+    def check_collisions(self, field: list, off_x: int, off_y: int,
+                         command: str = None) -> bool:
+        """
+        Checks whether the robot has encountered an obstacle or not.
+
+        :param field: field on which the robot rides
+        :param off_x: robot's offset by X
+        :param off_y: robot's offset by Y
+        :param command: the command that is executed, it is
+            written to the trace with the collision (default is None)
+        :return: True if a collisions was found else False
+        """
+
+        with STATS.phase('collision'):
+            outcome = self.collision(field, off_x, off_y)
+        if outcome is None:
+            return False
+        STATS.count('collisions')
+        if self.events.sinks:
+            self.events.emit(outcome, command, self.orientation, self.c_x,
+                             self.c_y, self.c_x + off_x, self.c_y + off_y)
+        self.trace.append(command, self.orientation, self.c_x, self.c_y,
+                          self.c_x + off_x, self.c_y + off_y, outcome)
+        return True
+
+    def print_state(self, off_x: int, off_y: int, command: str = None):
+        """
+        Reports the robot status to the event sinks after
         executing the command and adds traces
-        
+
         :param off_x: robot's offset by X
         :param off_y: robot's offset by Y
+        :param command: the command that is executed (default is None)
         :return: None
         """
 
-        if off_x == 0 and off_y == 0:
-            state = f'Robot turned {self.orientation}'
-        else:
-            shifted_x = self.c_x + off_x
-            shifted_y = self.c_y + off_y
-            state = f'Robot direction: {self.orientation}\n'\
-                f'Robot arrived to [{shifted_x}, {shifted_y}]'\
-                f' from [{self.c_x}, {self.c_y}]'
-        self.trace += f'{state}\n'
-        print(state)
+        shifted_x = self.c_x + off_x
+        shifted_y = self.c_y + off_y
+        outcome = TURNED if off_x == 0 and off_y == 0 else MOVED
+        self.trace.append(command, self.orientation, self.c_x, self.c_y,
+                          shifted_x, shifted_y, outcome)
+        if self.events.sinks:
+            self.events.emit(outcome, command, self.orientation, self.c_x,
+                             self.c_y, shifted_x, shifted_y)
@@ -0,0 +1,398 @@
+"""
+The module contains the asyncio server that hosts many robot
+sessions over TCP and the load generator used to test it.
+
+The protocol is line based. A client starts a session with
+    NEW [WIDTH HEIGHT [BARRIERS [SEED]]]    a private field
+    JOIN NAME [WIDTH HEIGHT [BARRIERS [SEED]]]    a shared field,
+        it is created by the first client that joins it
+and then sends the robot commands, one per line, a command may be
+repeated like UP*500. STATE returns the whole state of the robot,
+SENSE the distances to the nearest obstacles, LOOK the barrier points
+in the line of sight and QUIT ends the session.
+
+Every request gets one JSON line. Commands return the outcome and only
+the part of the state that changed, for example
+    {"outcome": "moved", "y": 49}
+    {"outcome": "turned", "orientation": "RIGHT"}
+    {"outcome": "hit_border"}
+and repeated commands return the number of every outcome instead,
+a command may be repeated at most MAX_REPEAT times.
+Robots on a shared field do not see each other.
+"""
+import sys
+import json
+import asyncio
+import argparse
+from time import perf_counter
+from typing import Dict, List, Optional
+
+from map import Map
+from robot import Robot
+from engine import Engine, parse_command
+from traces import OUTCOMES
+from simulator import prepare_field
+from visibility import Visibility
+from sweep import random_script
+
+HOST = '127.0.0.1'
+PORT = 8765
+# the largest field a client may ask for, by every side
+MAX_SIZE = 4096
+# the longest accepted line in bytes
+MAX_LINE = 1024
+# the most repeats of one command in a request
+MAX_REPEAT = 1000000
+DEFAULT_FIELD = (100, 100, 10)
+# how far the robots see with LOOK
+LOOK_RADIUS = 10
+
+
+def make_field(width: int, height: int, barriers: int,
+               seed: Optional[int]) -> Map:
+    """
+    Makes a field with a free point in the center for the robot
+
+    :param width: the width of the field
+    :param height: the height of the field
+    :param barriers: the count of barriers
+    :param seed: seed of the barriers
+    :return: the field
+    """
+
+    field = Map(width, height, seed=seed)
+    prepare_field(field, width // 2, height // 2, barriers)
+    return field
+
+
+def read_field(arguments: List[str]) -> tuple:
+    """
+    Reads the parameters of a field from a NEW or JOIN request
+
+    :param arguments: words after the request name
+    :return: width, height, count of barriers and seed
+    """
+
+    if len(arguments) > 4:
+        raise ValueError('Too many parameters')
+    try:
+        values = [int(value) for value in arguments]
+    except ValueError:
+        raise ValueError('Parameters should be integers') from None
+    width, height, barriers = \
+        (values + list(DEFAULT_FIELD[len(values):]))[:3]
+    if len(values) == 1:
+        raise ValueError('Both width and height are needed')
+    if not (0 < width <= MAX_SIZE and 0 < height <= MAX_SIZE):
+        raise ValueError(f'Width and height should be from 1 to {MAX_SIZE}')
+    if barriers < 0:
+        raise ValueError('Barriers count should not be negative')
+    return width, height, barriers, values[3] if len(values) == 4 else None
+
+
+class Session:
+    """
+    A class used to represent the robot of one client
+
+    Attributes:
+        field : Map
+            the field where the robot moves, it may be shared
+        robot : Robot
+            the robot of the client
+        engine : Engine
+            the engine that applies the commands
+        visibility : Visibility
+            line of sight on the field, shared by the sessions
+            of a shared field
+    """
+
+    def __init__(self, field: Map, visibility: Visibility = None):
+        """
+        Parameters
+        :param field: the field where the robot moves
+        :param visibility: line of sight on the field, a new one
+            is made if it is None (default is None)
+        """
+
+        self.field = field
+        self.robot = Robot(field.width // 2, field.height // 2)
+        self.engine = Engine(field, self.robot)
+        self.visibility = visibility or Visibility(field, LOOK_RADIUS)
+
+    def state(self) -> dict:
+        """Returns the whole state of the robot"""
+
+        return {'x': self.robot.c_x, 'y': self.robot.c_y,
+                'orientation': self.robot.orientation,
+                'width': self.field.width, 'height': self.field.height}
+
+    def execute(self, line: str) -> dict:
+        """
+        Applies a robot command or answers a STATE, SENSE or LOOK request
+
+        :param line: the request line
+        :return: the response
+        """
+
+        request = line.strip().upper()
+        if request == 'STATE':
+            return self.state()
+        if request == 'SENSE':
+            return {'sense': list(self.field.sense(self.robot.c_x,
+                                                   self.robot.c_y))}
+        if request == 'LOOK':
+            view = self.visibility.view(self.robot.c_x, self.robot.c_y)
+            return {'visible': len(view), 'barriers': self.visibility
+                    .barriers(self.robot.c_x, self.robot.c_y)}
+        command, count = parse_command(request)
+        if count > MAX_REPEAT:
+            raise ValueError(f'Too many repeats, at most {MAX_REPEAT}')
+        robot = self.robot
+        before = (robot.c_x, robot.c_y, robot.orientation)
+        result = self.engine.execute(((command, count),))
+        if count == 1:
+            response = {'outcome': OUTCOMES[result.outcomes[0]]}
+        else:
+            response = {'outcomes': {name: number for name, number
+                                     in result.counts().items() if number}}
+        for name, old, new in zip(('x', 'y', 'orientation'), before,
+                                  (robot.c_x, robot.c_y, robot.orientation)):
+            if old != new:
+                response[name] = new
+        return response
+
+
+class SimulatorServer:
+    """
+    A class used to host robot sessions over TCP
+
+    Attributes:
+        shared : dict
+            shared fields by name
+        views : dict
+            line of sight on every shared field by name
+        sessions : int
+            number of open connections
+    """
+
+    def __init__(self):
+        self.shared: Dict[str, Map] = {}
+        self.views: Dict[str, Visibility] = {}
+        self.sessions = 0
+        self._creating: Dict[str, asyncio.Future] = {}
+
+    async def _session(self, words: List[str]) -> Session:
+        """
+        Makes a session on a new field for NEW or on the shared field
+        for JOIN, the shared field is made by the first JOIN.
+        Fields are made in a thread, so other clients are not stalled.
+
+        :param words: the words of the request
+        :return: the session
+        """
+
+        loop = asyncio.get_running_loop()
+        if words[0] == 'NEW':
+            return Session(await loop.run_in_executor(
+                None, make_field, *read_field(words[1:])))
+        if len(words) < 2:
+            raise ValueError('JOIN needs the name of the field')
+        name = words[1]
+        if name not in self.shared:
+            await self._create(name, words[2:])
+        return Session(self.shared[name], self.views[name])
+
+    async def _create(self, name: str, parameters: List[str]):
+        """Makes the shared field once for all clients that wait for it"""
+
+        loop = asyncio.get_running_loop()
+        if name not in self._creating:
+            self._creating[name] = loop.run_in_executor(
+                None, make_field, *read_field(parameters))
+        try:
+            field = await self._creating[name]
+        finally:
+            self._creating.pop(name, None)
+        if name not in self.shared:
+            self.shared[name] = field
+            self.views[name] = Visibility(field, LOOK_RADIUS)
+
+    async def respond(self, session: Optional[Session],
+                      words: List[str]) -> tuple:
+        """
+        Answers one request
+
+        :param session: the session of the client, None before
+            NEW or JOIN
+        :param words: the words of the request in upper case
+        :return: the session after the request and the response
+        """
+
+        try:
+            if words[0] == 'QUIT':
+                return session, {'bye': True}
+            if words[0] in ('NEW', 'JOIN'):
+                session = await self._session(words)
+                return session, session.state()
+            if session is None:
+                return session, {'error': 'Send NEW or JOIN first'}
+            return session, session.execute(' '.join(words))
+        except ValueError as error:
+            return session, {'error': str(error)}
+
+    async def handle(self, reader: asyncio.StreamReader,
+                     writer: asyncio.StreamWriter):
+        """
+        Serves one connection until QUIT or the end of the stream
+
+        :param reader: stream of the requests
+        :param writer: stream of the responses
+        :return: None
+        """
+
+        self.sessions += 1
+        session = None
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    words, response = None, {'error': 'Line is too long'}
+                else:
+                    if not line:
+                        break
+                    words = line.decode(errors='replace').upper().split()
+                    if not words:
+                        continue
+                    session, response = await self.respond(session, words)
+                writer.write(json.dumps(response).encode() + b'\n')
+                # waits only for this client if it reads slowly
+                await writer.drain()
+                if words and words[0] == 'QUIT':
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            self.sessions -= 1
+            writer.close()
+
+    async def start(self, host: str = HOST, port: int = PORT) \
+            -> asyncio.AbstractServer:
+        """
+        Starts listening
+
+        :param host: the address to listen on
+        :param port: the port to listen on, 0 for any free port
+        :return: the asyncio server
+        """
+
+        return await asyncio.start_server(self.handle, host, port,
+                                          limit=MAX_LINE)
+
+
+async def serve(host: str = HOST, port: int = PORT):
+    """Runs the server until it is interrupted"""
+
+    server = await SimulatorServer().start(host, port)
+    print(f'Listening on {host}:{server.sockets[0].getsockname()[1]}')
+    async with server:
+        await server.serve_forever()
+
+
+async def client(host: str, port: int, start: str,
+                 commands: List[str]) -> List[float]:
+    """
+    Drives one session with the commands and waits for every response
+
+    :param host: the address of the server
+    :param port: the port of the server
+    :param start: the NEW or JOIN request
+    :param commands: the robot commands
+    :return: latency of every command in seconds
+    """
+
+    reader, writer = await asyncio.open_connection(host, port,
+                                                   limit=MAX_LINE)
+    latencies = []
+    try:
+        for line in [start, *commands]:
+            started = perf_counter()
+            writer.write(line.encode() + b'\n')
+            await writer.drain()
+            response = json.loads(await reader.readline())
+            if 'error' in response:
+                raise RuntimeError(response['error'])
+            latencies.append(perf_counter() - started)
+        writer.write(b'QUIT\n')
+        await writer.drain()
+        await reader.readline()
+    finally:
+        writer.close()
+    return latencies[1:]
+
+
+async def load(host: str = HOST, port: int = PORT, clients: int = 100,
+               commands: int = 1000, shared: Optional[str] = None,
+               size: int = 100, barriers: int = 10) -> dict:
+    """
+    Runs many clients at once and measures the server
+
+    :param host: the address of the server
+    :param port: the port of the server
+    :param clients: number of concurrent sessions
+    :param commands: random commands sent by every client
+    :param shared: name of the shared field, every client
+        gets its own field if it is None (default is None)
+    :param size: the width and the height of the fields (default is 100)
+    :param barriers: the count of barriers (default is 10)
+    :return: number of commands, seconds spent, commands per second
+        and latency percentiles
+    """
+
+    parameters = f'{size} {size} {barriers}'
+    started = perf_counter()
+    results = await asyncio.gather(*(
+        client(host, port,
+               f'JOIN {shared} {parameters} 0' if shared
+               else f'NEW {parameters} {index}',
+               random_script(commands, index))
+        for index in range(clients)))
+    elapsed = perf_counter() - started
+    latencies = sorted(latency for result in results for latency in result)
+    return {'commands': len(latencies), 'elapsed': elapsed,
+            'throughput': len(latencies) / elapsed,
+            **{f'p{share}': latencies[min(len(latencies) - 1,
+                                          len(latencies) * share // 100)]
+               for share in (50, 90, 99)}}
+
+
+def main(argv=None):
+    """Runs the server or the load generator"""
+
+    parser = argparse.ArgumentParser(
+        description='Host robot sessions over TCP or load the server')
+    parser.add_argument('mode', choices=('serve', 'load'))
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--clients', type=int, default=100)
+    parser.add_argument('--commands', type=int, default=1000)
+    parser.add_argument('--shared', default=None,
+                        help='name of the field shared by the clients')
+    parser.add_argument('--size', type=int, default=100)
+    parser.add_argument('--barriers', type=int, default=10)
+    args = parser.parse_args(argv)
+
+    if args.mode == 'serve':
+        try:
+            asyncio.run(serve(args.host, args.port))
+        except KeyboardInterrupt:
+            pass
+    else:
+        json.dump(asyncio.run(load(args.host, args.port, args.clients,
+                                   args.commands, args.shared, args.size,
+                                   args.barriers)), sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
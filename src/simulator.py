@@ -3,21 +3,33 @@ The module contains simulator functions for correct data entry,
 interaction between the robot and the field, and display,
 as well as displaying the results of work.
 """
-import json
-from typing import Tuple
+import os
+from typing import Optional, Tuple
 from platform import system
 from subprocess import call
 from map import Map
 from robot import Robot
-
-
-COLORS = {
-    'red': '\033[31m',
-    'yellow': '\033[33m',
-    'purple': '\033[35m',
-    'white': '\033[37m',
-    'teal': '\033[36m'
-}
+from renderer import COLORS, ViewportRenderer, frame_text
+from traces import TraceWriter, write_traces
+from pathfinding import Planner
+from stats import STATS
+from visibility import Visibility
+from exploration import Coverage
+from events import ConsoleSink
+from dynamics import Scheduler
+from replay import Recorder
+from tiling import generate_tiled
+
+
+TRACES_PATH = '../logs/traces.jsonl'
+SESSION_PATH = '../logs/session.jsonl'
+STATS_PATH = '../logs/stats.jsonl'
+RECORDING_PATH = '../logs/replay'
+# fields of this area and larger are generated in a pool of processes
+# and the coverage of the session is not counted
+TILED_AREA = 4096 * 4096
+# how far the robot sees in the terminal
+VIEW_RADIUS = 3
 
 
 def calculate_viewzone(field: Map, robot: Robot, x_1: int = 3,
@@ -58,15 +70,10 @@ def update_picture(field: Map, picture: list):
     :return: None
     """
 
-    for y in range(field.height):
-        for x in range(field.width):
-            if field.map[y][x] == 0:
-                picture[y + 1][x + 1] = ' '
-            elif type(field.map[y][x]) is int:
-                picture[y + 1][x + 1] = f'{COLORS["red"]}+{COLORS["white"]}'
-            else:
-                point = field.map[y][x]
-                picture[y + 1][x + 1] = f'{COLORS["yellow"]}{point}{COLORS["white"]}'
+    barrier = f'{COLORS["red"]}+{COLORS["white"]}'
+    for y, row in enumerate(field.map.tolist()):
+        for x, point in enumerate(row):
+            picture[y + 1][x + 1] = ' ' if point == 0 else barrier
 
 
 def color_picture(picture: list, coord: Tuple):
@@ -88,23 +95,29 @@ def color_picture(picture: list, coord: Tuple):
     print(f'{teal}" {white}' * (coord[1] - coord[0] + 4))
 
 
-def draw(robot: Robot, field: Map):
+def draw(robot: Robot, field: Map, renderer: ViewportRenderer = None):
     """
     Displays the current location of
      the robot and the visible area of the field
 
     :param robot: the robot whose position you want to display
     :param field: the field where the robot moves
+    :param renderer: renderer that redraws only the changed points,
+        without it the whole visible area is printed (default is None)
     :return: None
     """
 
-    purple = COLORS["purple"]
-    white = COLORS["white"]
-    picture = [[f'{purple}#{white}' for x in range(field.width + 2)]
-               for row in range(field.height + 2)]
-    update_picture(field, picture)
-    coord = calculate_viewzone(field, robot)
-    color_picture(picture, coord)
+    with STATS.phase('draw'):
+        radius = VIEW_RADIUS if renderer is None or \
+            renderer.visibility is None else renderer.visibility.radius
+        coord = calculate_viewzone(field, robot, radius, radius,
+                                   radius, radius)
+        if renderer is not None:
+            renderer.render(robot, field, coord)
+        else:
+            frame = ViewportRenderer().viewport(robot, field, coord)
+            STATS.count('cells_rendered', len(frame) * len(frame[0]))
+            print(frame_text(frame))
 
 
 def move_robot(command: str, robot: Robot, map: list):
@@ -118,19 +131,64 @@ def move_robot(command: str, robot: Robot, map: list):
     :return: None
     """
 
-    flag = False
-    while robot.orientation != command:
-        robot.handling_command(command)
-        if command.find('ROTATE') == -1:
-            robot.print_state(0, 0)
-        else:
-            flag = True
-        if flag:
-            break
-    off_y, off_x = robot.update_orientation()
-    if not robot.check_collisions(map, off_x, off_y):
-        robot.print_state(off_x, off_y)
-        robot.step_forward()
+    with STATS.phase('move_robot'):
+        STATS.count('commands')
+        flag = False
+        while robot.orientation != command:
+            robot.handling_command(command)
+            if command.find('ROTATE') == -1:
+                robot.print_state(0, 0, command)
+            else:
+                flag = True
+            if flag:
+                break
+        off_y, off_x = robot.update_orientation()
+        if not robot.check_collisions(map, off_x, off_y, command):
+            robot.print_state(off_x, off_y, command)
+            robot.step_forward()
+
+
+def parse_goto(command: str) -> Optional[Tuple[int, int]]:
+    """
+    Reads the target of the GOTO command
+
+    :param command: the command entered by the user
+    :return: X and Y coordinates of the target
+        or None if it is not a correct GOTO command
+    """
+
+    parts = command.split()
+    if len(parts) != 3 or parts[0] != 'GOTO':
+        return None
+    try:
+        return int(parts[1]), int(parts[2])
+    except ValueError:
+        return None
+
+
+def go_to(robot: Robot, field: Map, x: int, y: int,
+          planner: Planner = None, recorder: Recorder = None):
+    """
+    Moves the robot to the target along a shortest path
+
+    :param robot: the robot that should reach the target
+    :param field: the field where the robot moves
+    :param x: X coordinate of the target
+    :param y: Y coordinate of the target
+    :param planner: planner with cached distances (default is None)
+    :param recorder: recorder of the applied commands (default is None)
+    :return: None
+    """
+
+    planner = planner or Planner(field)
+    commands = planner.path(robot, x, y)
+    if commands is None:
+        print(f'The point [{x}, {y}] can not be reached.')
+        return None
+    for command in commands:
+        move_robot(command, robot, field.map)
+        if recorder is not None:
+            recorder.record(command)
 
 
 def read_param(param_name: str) -> int:
@@ -170,18 +228,45 @@ def prepare_field(field: Map, x: int, y: int, count: int):
     :return: None
     """
 
-    for index in range(1, count + 1):
-        field.generate_barrier(index)
+    field.generate_barriers(count)
     while not field.free_point(x=x, y=y):
         field.remove_barrier(x=x, y=y)
 
 
-def command_handler(robot: Robot, field: Map):
+def parse_input(line: str, commands: Tuple[str, ...]) \
+        -> Optional[Tuple[str, Optional[Tuple[int, int]]]]:
+    """
+    Checks a line entered by the user
+
+    :param line: the entered line
+    :param commands: the known commands
+    :return: the command and the target of GOTO or None for other
+        commands, None if the command is unknown
+    """
+
+    with STATS.phase('input'):
+        command = line.strip().upper()
+        if command in commands:
+            return command, None
+        target = parse_goto(command)
+        if target is not None:
+            return command, target
+        return None
+
+
+def command_handler(robot: Robot, field: Map, radius: int = VIEW_RADIUS,
+                    scheduler: Scheduler = None,
+                    recorder: Recorder = None):
     """
     Reads, checks, and processes input commands from the terminal
 
     :param robot: the robot for which commands are sent
     :param field: the field where the robot moves
+    :param radius: how far the robot sees, the points hidden
+        behind barriers are not shown (default is VIEW_RADIUS)
+    :param scheduler: moves the dynamic obstacles after every
+        command (default is None)
+    :param recorder: recorder of the applied commands (default is None)
     :return: None
     """
 
@@ -194,27 +279,38 @@ def command_handler(robot: Robot, field: Map):
         'ROTATE180',
         'QUIT'
     )
+    renderer = ViewportRenderer(
+        footer='Commands: ' + ', '.join(commands) + ', GOTO X Y',
+        visibility=Visibility(field, radius))
+    planner = Planner(field)
     while True:
-        x = robot.c_x
-        y = robot.c_y
-        field.map[y][x] = robot.view
-        draw(robot, field)
-        command = input('Enter command: ').strip().upper()
-        while command not in commands:
+        robot.events.flush()
+        draw(robot, field, renderer)
+        parsed = parse_input(input('Enter command: '), commands)
+        renderer.clear_status()
+        while parsed is None:
             print("Unknown command. Try to use:\n"
                   "'UP', 'DOWN', 'LEFT', 'RIGHT',"
-                  " 'ROTATE90', 'ROTATE180', 'QUIT'")
-            command = input('Enter command: ').strip().upper()
+                  " 'ROTATE90', 'ROTATE180', 'GOTO X Y', 'QUIT'")
+            parsed = parse_input(input('Enter command: '), commands)
+        command, target = parsed
         if command == 'QUIT':
-            field.map[y][x] = 0
             return None
-        move_robot(command, robot, field.map)
-        field.map[y][x] = 0
+        if target is not None:
+            go_to(robot, field, *target, planner, recorder)
+        else:
+            move_robot(command, robot, field.map)
+            if recorder is not None:
+                recorder.record(command)
+        if scheduler is not None:
+            scheduler.tick()
 
 
 def save_logs(robot: Robot):
     """
-    Prompts the user to record the robot's traces in a json file
+    Prompts the user to record the robot's traces in a JSONL file.
+    If the trace was streamed to a session file during the session,
+    the file is kept as the traces or deleted.
 
     :param robot: robot whose traces will be recorded
     :return: None
@@ -223,10 +319,15 @@ def save_logs(robot: Robot):
     answer = ''
     while answer not in ('Y', 'N'):
         answer = input('Do you want to save robot traces(Y/N)?: ').upper()
-    if answer == 'Y':
-        with open('../logs/traces.json', 'w') as file:
-            json.dump(robot.trace, file)
-        return None
+    writer = robot.trace.writer
+    if writer is not None:
+        writer.close()
+        if answer == 'Y':
+            os.replace(writer.path, TRACES_PATH)
+        else:
+            os.remove(writer.path)
+    elif answer == 'Y':
+        write_traces(robot.trace, TRACES_PATH)
 
 
 def start():
@@ -244,19 +345,40 @@ def start():
           "\tRIGHT - move robot right\n"
           "\tROTATE90 - rotate the robot 90 degrees\n"
           "\tROTATE180 - rotate the robot 180 degrees.\n"
+          "\tGOTO X Y - move the robot to the point [X, Y]\n"
           "\tQUIT - to exit from program\n"
           "Commands can be entered in any case.\n"
           "-----------------------------------------------\n")
+    interval = os.environ.get('ROBOT_STATS')
+    if interval:
+        STATS.start_dumps(STATS_PATH, float(interval))
     x = read_param('X')
     y = read_param('Y')
     count = read_param('number of barriers')
-    field = Map(x, y)
     center_x = x // 2
     center_y = y // 2
-    prepare_field(field, center_x, center_y, count)
+    if x * y >= TILED_AREA:
+        field = generate_tiled(x, y, count)
+        prepare_field(field, center_x, center_y, 0)
+    else:
+        field = Map(x, y)
+        prepare_field(field, center_x, center_y, count)
     robot = Robot(center_x, center_y)
-    command_handler(robot, field)
+    robot.trace.attach(TraceWriter(SESSION_PATH, buffer_size=1))
+    if x * y < TILED_AREA:
+        robot.coverage = Coverage(field, center_x, center_y)
+    robot.events.subscribe(ConsoleSink())
+    with Recorder(RECORDING_PATH, field, robot) as recorder:
+        command_handler(robot, field, recorder=recorder)
+    robot.events.close()
+    if robot.coverage is not None:
+        print(f'Visited {robot.coverage.visited} points, '
+              f'{robot.coverage.percent():.1f}% of the reachable area, '
+              f'{robot.coverage.revisits} revisits')
     save_logs(robot)
+    if interval:
+        STATS.stop_dumps()
+        STATS.dump(STATS_PATH)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,325 @@
+"""Module containing the sparse map class"""
+import math
+from typing import Dict, Iterator, Optional, Tuple
+
+import numpy as np
+
+from map import Map
+
+
+class SparseMap(Map):
+    """
+    A class used to represent a very large map that stores
+    only the tiles touched by barriers.
+
+    The map is split into square tiles. A tile is allocated when
+    a barrier is placed on it and released when its last barrier is
+    removed, so memory depends on the occupied area and not on the size
+    of the map. Queries about points of missing tiles are answered
+    without allocating anything. The map has the same methods as Map,
+    and its map attribute is a view that supports field.map[y][x],
+    field.map[y1:y2, x1:x2] and field.map[ys, xs] reads.
+
+    Barriers are placed by random draws only, without the placement
+    engine, so generate_barrier may give up on an almost full map.
+
+    Attributes:
+        tile : int
+            the width and height of a tile
+        tiles : dict
+            allocated tiles by their row and column
+    """
+
+    # random draws tried for one barrier
+    PLACEMENT_ATTEMPTS = 256
+
+    def __init__(self, x: int, y: int, tile: int = 64, seed=None,
+                 max_barrier: Optional[int] = None, dtype=np.uint32):
+        """
+        Parameters
+        :param x: the width of the map
+        :param y: the height of the map
+        :param tile: the width and height of a tile (default is 64)
+        :param seed: seed or numpy.random.Generator used to place
+            barriers (default is None)
+        :param max_barrier: the largest width of a barrier,
+            by default a third of the smaller side but at most a tile
+        :param dtype: integer type of the cells (default is numpy.uint32)
+        """
+
+        self.width = x
+        self.height = y
+        self.tile = tile
+        self.tiles: Dict[Tuple[int, int], np.ndarray] = {}
+        self.barriers = {}
+        self.revision = 0
+        self.rng = np.random.default_rng(seed)
+        self.map = SparseView(self)
+        self._dtype = dtype
+        self._filled: Dict[Tuple[int, int], int] = {}
+        self._occupied = 0
+        self._max_barrier = max_barrier or \
+            min(math.ceil(min(x, y) / 3), tile)
+        self._occupancy = None
+        self._obstacles = None
+        self.listeners = []
+        self._placement = None
+
+    @property
+    def max_barrier_size(self) -> int:
+        return self._max_barrier
+
+    @property
+    def nbytes(self) -> int:
+        """Memory taken by the allocated tiles"""
+
+        return sum(tile.nbytes for tile in self.tiles.values())
+
+    def occupancy(self):
+        raise NotImplementedError('Sparse map has no occupancy index')
+
+    def placement(self):
+        raise NotImplementedError('Sparse map has no placement engine')
+
+    def obstacles(self):
+        raise NotImplementedError('Sparse map has no obstacle index')
+
+    def _pieces(self, x: int, y: int, width: int, height: int) \
+            -> Iterator[Tuple[Tuple[int, int], tuple, tuple]]:
+        """
+        Splits a zone into its parts on separate tiles
+
+        :return: key of the tile, slices of the part in the tile
+            and slices of the part in the zone
+        """
+
+        size = self.tile
+        for row in range(y // size, (y + height - 1) // size + 1):
+            top = max(y, row * size)
+            bottom = min(y + height, (row + 1) * size)
+            for column in range(x // size, (x + width - 1) // size + 1):
+                left = max(x, column * size)
+                right = min(x + width, (column + 1) * size)
+                yield ((row, column),
+                       (slice(top - row * size, bottom - row * size),
+                        slice(left - column * size, right - column * size)),
+                       (slice(top - y, bottom - y),
+                        slice(left - x, right - x)))
+
+    def _changed(self, x: int, y: int, width: int, height: int, sign: int):
+        self.revision += 1
+        for listener in self.listeners:
+            listener((x, y, width, height))
+
+    def _rebuilt(self, grown: bool = False):
+        self.revision += 1
+        for listener in self.listeners:
+            listener(None)
+
+    def window(self, x: int, y: int, width: int, height: int) -> np.ndarray:
+        result = np.zeros((height, width), dtype=self._dtype)
+        for key, inside, outside in self._pieces(x, y, width, height):
+            tile = self.tiles.get(key)
+            if tile is not None:
+                result[outside] = tile[inside]
+        return result
+
+    def sense(self, x: int, y: int) -> Tuple[int, int, int, int]:
+        return (self.ray(x, y, 0, -1, y),
+                self.ray(x, y, 0, 1, self.height),
+                self.ray(x, y, -1, 0, x),
+                self.ray(x, y, 1, 0, self.width))
+
+    def sense_many(self, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        result = np.empty((len(xs), 4), dtype=np.int64)
+        for index, (x, y) in enumerate(zip(np.asarray(xs).tolist(),
+                                           np.asarray(ys).tolist())):
+            result[index] = self.sense(x, y)
+        return result
+
+    def flat_occupancy(self) -> 'FlatOccupancy':
+        return FlatOccupancy(self)
+
+    def check_collisions(self, x: int, y: int,
+                         off_x: int, off_y: int) -> bool:
+        if x < 0 or y < 0 or \
+                x + off_x > self.width or y + off_y > self.height:
+            return True
+        for key, inside, _ in self._pieces(x, y, off_x, off_y):
+            tile = self.tiles.get(key)
+            if tile is not None and tile[inside].any():
+                return True
+        return False
+
+    def point(self, x: int, y: int) -> int:
+        """
+        Returns the colour(id) in the point of the map
+
+        :param x: X coordinate of the point
+        :param y: Y coordinate of the point
+        :return: colour(id) of the barrier or 0 if the point is free
+        """
+
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            raise IndexError('The point is outside the map')
+        tile = self.tiles.get((y // self.tile, x // self.tile))
+        if tile is None:
+            return 0
+        return int(tile[y % self.tile, x % self.tile])
+
+    def free_point(self, x: int, y: int) -> bool:
+        return self.point(x, y) == 0
+
+    def barrier_at(self, x: int, y: int) -> Optional[int]:
+        return self.point(x, y) or None
+
+    def is_full(self):
+        return self._occupied == self.width * self.height
+
+    def generate_barrier(self, colour: int) -> bool:
+        """
+        Generates a new random size barrier
+
+        :param colour: colour(id) of generated barrier
+        :return: True if the barrier was placed, False if no free place
+            was found within PLACEMENT_ATTEMPTS draws
+        """
+
+        if self.is_full():
+            return False
+        for _ in range(self.PLACEMENT_ATTEMPTS):
+            x, y, width = (int(value) for value in self.rng.integers(
+                (0, 0, 1), (self.width, self.height,
+                            self.max_barrier_size + 1)))
+            if not self.check_collisions(x, y, width, width):
+                self.place_barrier(colour, x, y, width)
+                return True
+        return False
+
+    def generate_barriers(self, count: int, colour: int = 1) -> int:
+        placed = 0
+        while placed < count and self.generate_barrier(colour + placed):
+            placed += 1
+        return placed
+
+    def _place(self, colour: int, x: int, y: int, width: int):
+        if colour <= 0:
+            raise ValueError('Colour of a barrier should be more than 0')
+        if colour in self.barriers:
+            raise ValueError(f'Barrier {colour} is already on the map')
+        self.barriers[colour] = (x, y, width)
+        self._fill(x, y, width, colour)
+
+    def remove_barrier_by_id(self, colour: int) -> int:
+        try:
+            x, y, width = self.barriers.pop(colour)
+        except KeyError:
+            raise ValueError(f'There is no barrier {colour} on the map')
+        self._fill(x, y, width, 0)
+        self._changed(x, y, width, width, -1)
+        return colour
+
+    def move_barrier(self, colour: int, x: int, y: int):
+        if colour not in self.barriers:
+            raise ValueError(f'There is no barrier {colour} on the map')
+        width = self.barriers[colour][2]
+        self.remove_barrier_by_id(colour)
+        self.place_barrier(colour, x, y, width)
+
+    def _fill(self, x: int, y: int, width: int, colour: int):
+        """
+        Writes a colour into a free or fully occupied square,
+        allocating and releasing the tiles
+
+        :return: None
+        """
+
+        size = self.tile
+        for key, inside, _ in self._pieces(x, y, width, width):
+            area = (inside[0].stop - inside[0].start) \
+                * (inside[1].stop - inside[1].start)
+            if colour:
+                if key not in self.tiles:
+                    self.tiles[key] = np.zeros((size, size),
+                                               dtype=self._dtype)
+                self.tiles[key][inside] = colour
+                self._filled[key] = self._filled.get(key, 0) + area
+            else:
+                self.tiles[key][inside] = 0
+                self._filled[key] -= area
+                if not self._filled[key]:
+                    del self.tiles[key], self._filled[key]
+        self._occupied += width * width if colour else -width * width
+
+
+class SparseRow:
+    """A row of the sparse map that supports reading row[x]"""
+
+    __slots__ = ('field', 'y')
+
+    def __init__(self, field: SparseMap, y: int):
+        self.field = field
+        self.y = y
+
+    def __getitem__(self, x: int) -> int:
+        return self.field.point(x, self.y)
+
+    def __len__(self) -> int:
+        return self.field.width
+
+
+class SparseView:
+    """
+    Read access to the cells of the sparse map with the same
+    indexing as the dense grid of Map
+    """
+
+    __slots__ = ('field',)
+
+    def __init__(self, field: SparseMap):
+        self.field = field
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.field.height, self.field.width
+
+    def __len__(self) -> int:
+        return self.field.height
+
+    def __getitem__(self, key):
+        field = self.field
+        if isinstance(key, tuple):
+            rows, columns = key
+            if isinstance(rows, slice) and isinstance(columns, slice):
+                top, bottom, _ = rows.indices(field.height)
+                left, right, _ = columns.indices(field.width)
+                return field.window(left, top, max(right - left, 0),
+                                    max(bottom - top, 0))
+            ys, xs = np.broadcast_arrays(np.asarray(rows), np.asarray(columns))
+            result = np.zeros(ys.shape, dtype=field._dtype)
+            keys = (ys // field.tile) * (field.width // field.tile + 1) \
+                + xs // field.tile
+            for key in np.unique(keys):
+                mask = keys == key
+                tile = field.tiles.get(divmod(int(key),
+                                              field.width // field.tile + 1))
+                if tile is not None:
+                    result[mask] = tile[ys[mask] % field.tile,
+                                        xs[mask] % field.tile]
+            return result
+        if not 0 <= key < field.height:
+            raise IndexError('The row is outside the map')
+        return SparseRow(field, key)
+
+
+class FlatOccupancy:
+    """Occupancy of the points of the sparse map indexed by y * width + x"""
+
+    __slots__ = ('field',)
+
+    def __init__(self, field: SparseMap):
+        self.field = field
+
+    def __getitem__(self, index: int) -> bool:
+        y, x = divmod(index, self.field.width)
+        return not self.field.free_point(x, y)
@@ -0,0 +1,250 @@
+"""
+The module contains the instrumentation of the simulator: counters
+and timing histograms of its phases. It is disabled by default,
+then the instrumented code only checks the STATS.enabled flag.
+
+Usage:
+    STATS.enable()
+    with STATS.phase('draw'):
+        ...
+    STATS.count('collisions')
+    STATS.snapshot()
+"""
+import os
+import json
+import threading
+from time import perf_counter_ns, time
+from typing import Dict, Optional
+
+
+class Histogram:
+    """
+    A class used to represent durations of a phase,
+    bucket i counts durations below 2 ** i nanoseconds
+
+    Attributes:
+        buckets : list
+            number of durations in every bucket
+        count : int
+            number of durations
+        total : int
+            sum of the durations in nanoseconds
+        low : int
+            the shortest duration in nanoseconds
+        high : int
+            the longest duration in nanoseconds
+    """
+    __slots__ = ('buckets', 'count', 'total', 'low', 'high')
+
+    def __init__(self):
+        self.buckets = [0] * 64
+        self.count = 0
+        self.total = 0
+        self.low = 0
+        self.high = 0
+
+    def record(self, duration: int):
+        """
+        Adds a duration
+
+        :param duration: duration in nanoseconds
+        :return: None
+        """
+
+        self.buckets[min(duration.bit_length(), 63)] += 1
+        if not self.count or duration < self.low:
+            self.low = duration
+        if duration > self.high:
+            self.high = duration
+        self.count += 1
+        self.total += duration
+
+    def percentile(self, share: float) -> int:
+        """
+        Estimates a percentile by the upper bound of its bucket
+
+        :param share: share of the durations, from 0 to 1
+        :return: duration in nanoseconds
+        """
+
+        rank = share * self.count
+        seen = 0
+        for index, number in enumerate(self.buckets):
+            seen += number
+            if number and seen >= rank:
+                return min(2 ** index, self.high)
+        return self.high
+
+    def as_dict(self) -> dict:
+        """Returns the histogram in seconds in a form suitable for JSON"""
+
+        return {'count': self.count, 'total': self.total / 1e9,
+                'mean': self.total / self.count / 1e9 if self.count else 0,
+                'min': self.low / 1e9, 'max': self.high / 1e9,
+                'p50': self.percentile(0.5) / 1e9,
+                'p90': self.percentile(0.9) / 1e9,
+                'p99': self.percentile(0.99) / 1e9,
+                'buckets': {2 ** index: number for index, number
+                            in enumerate(self.buckets) if number}}
+
+
+class Phase:
+    """Context manager that records the duration of a phase"""
+    __slots__ = ('stats', 'name', 'started')
+
+    def __init__(self, stats: 'Stats', name: str):
+        self.stats = stats
+        self.name = name
+        self.started = 0
+
+    def __enter__(self):
+        self.started = perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.stats.record(self.name, perf_counter_ns() - self.started)
+
+
+class NullPhase:
+    """Context manager used while the instrumentation is disabled"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return None
+
+
+NULL_PHASE = NullPhase()
+
+
+class Stats:
+    """
+    A class used to collect counters and timings of the phases
+
+    Attributes:
+        enabled : bool
+            whether anything is recorded
+        counters : dict
+            value of every counter by name
+        histograms : dict
+            durations of every phase by name
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.counters: Dict[str, int] = {}
+        self.histograms: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+        self._stop: Optional[threading.Event] = None
+
+    def enable(self):
+        """Starts recording"""
+
+        self.enabled = True
+
+    def disable(self):
+        """Stops recording, the collected values are kept"""
+
+        self.enabled = False
+
+    def reset(self):
+        """Forgets the collected values"""
+
+        with self._lock:
+            self.counters = {}
+            self.histograms = {}
+
+    def count(self, name: str, number: int = 1):
+        """
+        Increases a counter
+
+        :param name: name of the counter
+        :param number: the increment (default is 1)
+        :return: None
+        """
+
+        if self.enabled:
+            with self._lock:
+                self.counters[name] = self.counters.get(name, 0) + number
+
+    def record(self, name: str, duration: int):
+        """
+        Adds a duration of a phase
+
+        :param name: name of the phase
+        :param duration: duration in nanoseconds
+        :return: None
+        """
+
+        if self.enabled:
+            with self._lock:
+                histogram = self.histograms.get(name)
+                if histogram is None:
+                    histogram = self.histograms[name] = Histogram()
+                histogram.record(duration)
+
+    def phase(self, name: str):
+        """
+        Measures the phase in a with statement
+
+        :param name: name of the phase
+        :return: context manager
+        """
+
+        return Phase(self, name) if self.enabled else NULL_PHASE
+
+    def snapshot(self) -> dict:
+        """
+        Returns the collected values
+
+        :return: counters and histograms in a form suitable for JSON
+        """
+
+        with self._lock:
+            return {'time': time(), 'counters': dict(self.counters),
+                    'phases': {name: histogram.as_dict() for name, histogram
+                               in self.histograms.items()}}
+
+    def dump(self, path: str):
+        """
+        Appends the snapshot to a JSONL file
+
+        :param path: path of the file
+        :return: None
+        """
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'a') as file:
+            file.write(json.dumps(self.snapshot()) + '\n')
+
+    def start_dumps(self, path: str, interval: float):
+        """
+        Enables recording and dumps the snapshot periodically
+        from a background thread until stop_dumps is called
+
+        :param path: path of the JSONL file
+        :param interval: seconds between the dumps
+        :return: None
+        """
+
+        self.stop_dumps()
+        self.enable()
+        stop = self._stop = threading.Event()
+
+        def dump_periodically():
+            while not stop.wait(interval):
+                self.dump(path)
+
+        threading.Thread(target=dump_periodically, daemon=True).start()
+
+    def stop_dumps(self):
+        """Stops the periodic dumps"""
+
+        if self._stop is not None:
+            self._stop.set()
+            self._stop = None
+
+
+STATS = Stats()
@@ -0,0 +1,185 @@
+"""
+The module contains the Monte Carlo sweep runner that evaluates
+the simulator over many random fields in a pool of processes.
+"""
+import os
+import json
+import random
+import argparse
+import itertools
+from time import perf_counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, List, Optional
+
+from map import Map
+from robot import Robot
+from engine import COMMANDS, run_commands
+from pathfinding import Planner
+from simulator import prepare_field
+
+
+def random_script(length: int, seed: int) -> List[str]:
+    """
+    Generates a random command script
+
+    :param length: number of commands
+    :param seed: seed of the random generator
+    :return: list of commands
+    """
+
+    generator = random.Random(seed)
+    return generator.choices(COMMANDS, k=length)
+
+
+def scenarios(sizes: Iterable[tuple], barriers: Iterable[int],
+              scripts: Iterable, seeds: Iterable[int]) -> List[dict]:
+    """
+    Builds every combination of the parameters
+
+    :param sizes: width and height pairs of the fields
+    :param barriers: counts of barriers
+    :param scripts: paths of command files or lengths of random scripts
+    :param seeds: seeds of the random generator
+    :return: list of scenario parameters
+    """
+
+    return [{'width': width, 'height': height, 'barriers': count,
+             'script': script, 'seed': seed}
+            for (width, height), count, script, seed
+            in itertools.product(sizes, barriers, scripts, seeds)]
+
+
+def run_scenario(scenario: dict) -> dict:
+    """
+    Builds the field and the robot of the scenario and runs
+    its commands headless
+
+    :param scenario: parameters of the scenario
+    :return: parameters of the scenario with its statistics
+    """
+
+    started = perf_counter()
+    width, height = scenario['width'], scenario['height']
+    field = Map(width, height, seed=scenario['seed'])
+    center_x, center_y = width // 2, height // 2
+    prepare_field(field, center_x, center_y, scenario['barriers'])
+    prepared = perf_counter()
+
+    script = scenario['script']
+    if isinstance(script, int):
+        commands = random_script(script, scenario['seed'])
+    else:
+        with open(script) as file:
+            commands = file.read().split()
+    robot = Robot(center_x, center_y)
+    result = run_commands(field, robot, commands)
+    counts = result.counts()
+    collisions = counts['hit_border'] + counts['hit_barrier']
+    reachable = int((Planner(field).distances(center_x, center_y) >= 0)
+                    .sum())
+    return dict(scenario, **{
+        'barriers_placed': field.barriers_count,
+        'commands': len(result.outcomes),
+        'outcomes': counts,
+        'collision_rate': collisions / len(result.outcomes)
+        if result.outcomes else 0.0,
+        'reachable_area': reachable,
+        'reachable_share': reachable / (width * height),
+        'final_position': [result.c_x, result.c_y],
+        'prepare_time': prepared - started,
+        'run_time': result.elapsed,
+        'total_time': perf_counter() - started,
+    })
+
+
+def summarize(results: List[dict]) -> dict:
+    """
+    Aggregates the statistics of the scenarios
+    over the seeds they were run with
+
+    :param results: statistics of every run
+    :return: mean statistics for every combination of other parameters
+    """
+
+    groups = {}
+    for result in results:
+        key = (result['width'], result['height'], result['barriers'],
+               str(result['script']))
+        groups.setdefault(key, []).append(result)
+    summary = []
+    for (width, height, count, script), group in groups.items():
+        size = len(group)
+        summary.append({
+            'width': width, 'height': height, 'barriers': count,
+            'script': script, 'runs': size,
+            'collision_rate': sum(r['collision_rate'] for r in group) / size,
+            'reachable_area': sum(r['reachable_area'] for r in group) / size,
+            'run_time': sum(r['run_time'] for r in group) / size,
+            'total_time': sum(r['total_time'] for r in group) / size,
+        })
+    return {'scenarios': summary}
+
+
+def sweep(parameters: List[dict], workers: Optional[int] = None,
+          output: str = None) -> dict:
+    """
+    Runs the scenarios in a pool of processes
+
+    :param parameters: parameters of every scenario
+    :param workers: number of processes, all cores if None
+    :param output: path of the JSON file for the results (default is None)
+    :return: statistics of every run and their summary
+    """
+
+    started = perf_counter()
+    workers = workers or os.cpu_count() or 1
+    chunk = max(1, len(parameters) // (4 * workers))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(run_scenario, parameters, chunksize=chunk))
+    report = summarize(results)
+    report['runs'] = results
+    report['wall_time'] = perf_counter() - started
+    if output:
+        with open(output, 'w') as file:
+            json.dump(report, file, indent=2)
+    return report
+
+
+def read_size(text: str) -> tuple:
+    """Reads a field size written as WIDTHxHEIGHT"""
+
+    width, _, height = text.lower().partition('x')
+    return int(width), int(height or width)
+
+
+def read_script(text: str):
+    """Reads a script length or a path of a command file"""
+
+    return int(text) if text.isdigit() else text
+
+
+def main(argv=None):
+    """Runs a sweep described by the command line"""
+
+    parser = argparse.ArgumentParser(
+        description='Run the simulator over a grid of random scenarios')
+    parser.add_argument('--sizes', type=read_size, nargs='+',
+                        default=[(50, 50)], help='sizes like 100x100')
+    parser.add_argument('--barriers', type=int, nargs='+', default=[10])
+    parser.add_argument('--scripts', type=read_script, nargs='+',
+                        default=[1000],
+                        help='random script lengths or command files')
+    parser.add_argument('--seeds', type=int, nargs='+', default=[0])
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--output', default='../logs/sweep.json')
+    args = parser.parse_args(argv)
+
+    parameters = scenarios(args.sizes, args.barriers, args.scripts,
+                           args.seeds)
+    report = sweep(parameters, args.workers, args.output)
+    print(f'{len(parameters)} scenarios in {report["wall_time"]:.2f}s, '
+          f'results written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -2,10 +2,39 @@
 Module contains tests for main functions and methods
 from simulator.py, map.py and robot.py modules
 """
+import io
+import os
+import re
+import json
+import random
 import unittest
+import tempfile
+import contextlib
+import numpy as np
 import simulator
 from map import Map
 from robot import Robot
+from occupancy import SummedAreaTable, ObstacleIndex
+from renderer import ViewportRenderer
+import engine
+import fleet
+import traces
+import pathfinding
+import sweep
+import benchmarks
+import server
+import asyncio
+from visibility import Visibility
+from exploration import Coverage
+import events
+import dynamics
+import trajectory
+import replay
+import tiling
+import queue
+from stats import Stats, STATS, Histogram
+from sparse_map import SparseMap
+import mapfile
 
 
 class SimulatorTest(unittest.TestCase):
@@ -24,7 +53,7 @@ class SimulatorTest(unittest.TestCase):
         oldmap = field.map
         simulator.prepare_field(field, 5 // 2, 5 // 2, 30)
         newmap = field.map
-        self.assertFalse(oldmap != newmap)
+        self.assertFalse((oldmap != newmap).any())
 
     def test_update_picture(self):
         field = Map(5, 5)
@@ -68,6 +97,943 @@ class SimulatorTest(unittest.TestCase):
         self.assertNotEqual(old_coord, new_coord)
 
 
+class RendererTest(unittest.TestCase):
+
+    def test_viewport_is_cut_from_field(self):
+        field = Map(7, 7)
+        field.place_barrier(1, 0, 0, 1)
+        robot = Robot(7 // 2, 7 // 2)
+        coord = simulator.calculate_viewzone(field, robot)
+        picture = ViewportRenderer().viewport(robot, field, coord)
+        self.assertEqual((len(picture), len(picture[0])), (8, 8))
+        self.assertIn('#', picture[0][0])
+        self.assertIn('+', picture[1][1])
+        self.assertIn('^', picture[4][4])
+
+    def test_render_redraws_only_changes(self):
+        field = Map(7, 7)
+        robot = Robot(7 // 2, 7 // 2)
+        out = io.StringIO()
+        renderer = ViewportRenderer(out)
+        simulator.draw(robot, field, renderer)
+        first = len(out.getvalue())
+        simulator.move_robot('ROTATE180', robot, field.map)
+        simulator.draw(robot, field, renderer)
+        update = out.getvalue()[first:]
+        self.assertEqual(re.findall(r'\033\[\d+;\d+H', update),
+                         ['\033[6;11H'])
+
+
+class EngineTest(unittest.TestCase):
+
+    def test_same_state_as_move_robot(self):
+        random.seed(7)
+        field = Map(8, 8)
+        simulator.prepare_field(field, 4, 4, 5)
+        commands = [random.choice(engine.COMMANDS) for _ in range(300)]
+        interactive, headless = Robot(4, 4), Robot(4, 4)
+        with contextlib.redirect_stdout(io.StringIO()):
+            for command in commands:
+                simulator.move_robot(command, interactive, field.map)
+        result = engine.run_commands(field, headless, commands)
+        self.assertEqual(len(result.outcomes), 300)
+        for attribute in ('c_x', 'c_y', 'angle', 'orientation', 'view'):
+            self.assertEqual(getattr(interactive, attribute),
+                             getattr(headless, attribute))
+
+    def test_outcomes(self):
+        field = Map(3, 3)
+        field.place_barrier(1, 2, 1, 1)
+        robot = Robot(1, 1)
+        result = engine.run_commands(
+            field, robot, ['up\n', 'UP', '', 'ROTATE90', 'DOWN', 'RIGHT',
+                           'QUIT', 'UP'])
+        self.assertEqual(list(result.outcomes),
+                         [engine.MOVED, engine.HIT_BORDER, engine.TURNED,
+                          engine.MOVED, engine.HIT_BARRIER])
+        self.assertEqual((result.c_x, result.c_y), (1, 1))
+        with self.assertRaises(ValueError):
+            engine.run_commands(field, robot, ['JUMP'])
+
+    def test_stream_of_lines(self):
+        random.seed(3)
+        field = Map(10, 10, seed=2)
+        field.generate_barriers(6)
+        field.remove_barrier(5, 5)
+        commands = [random.choice(engine.COMMANDS) for _ in range(200)]
+        stream = io.StringIO(''.join(
+            (command.lower() if index % 7 == 0 else command) + '\n'
+            for index, command in enumerate(commands))
+            + 'UP*3\nQUIT\nUP\n')
+        expected = engine.run_commands(field, Robot(5, 5),
+                                       commands + ['UP*3'])
+        result = engine.run_commands(field, Robot(5, 5), stream)
+        self.assertEqual(result.outcomes, expected.outcomes)
+        self.assertEqual((result.c_x, result.c_y, result.angle),
+                         (expected.c_x, expected.c_y, expected.angle))
+        self.assertEqual(engine.run_commands(
+            field, Robot(5, 5), ['UP \n', 'rotate90\n']).counts()['turned'],
+            1)
+
+    def test_runs_match_single_commands(self):
+        random.seed(5)
+        field = Map(40, 30, seed=5)
+        field.generate_barriers(15)
+        commands, lines = [], []
+        for _ in range(200):
+            command = random.choice(engine.COMMANDS)
+            times = random.choice((1, 2, 3, 9, 50))
+            commands += [command] * times
+            lines.append(f'{command.lower()}*{times}')
+        field.remove_barrier(20, 15)
+        expected = engine.Engine(field, Robot(20, 15)).execute(
+            (command, 1) for command in commands)
+        for result in (engine.run_commands(field, Robot(20, 15), lines),
+                       engine.Engine(field, Robot(20, 15)).execute(
+                           engine.compile_commands(commands))):
+            self.assertEqual(result.outcomes, expected.outcomes)
+            self.assertEqual((result.c_x, result.c_y, result.angle),
+                             (expected.c_x, expected.c_y, expected.angle))
+
+    def test_compile_commands(self):
+        self.assertEqual(
+            list(engine.compile_commands(
+                ['UP', 'up', 'UP*3', '', 'ROTATE90 * 2', 'LEFT*0',
+                 'ROTATE90', 'QUIT', 'DOWN'])),
+            [('UP', 5), ('ROTATE90', 3)])
+        with self.assertRaises(ValueError):
+            list(engine.compile_commands(['UP*x']))
+        with self.assertRaises(ValueError):
+            list(engine.compile_commands(['UP*-1']))
+        field, robot = Map(10, 10), Robot(5, 5)
+        result = engine.run_commands(field, robot, ['UP*1000000'])
+        self.assertEqual(result.counts()['moved'], 5)
+        self.assertEqual(result.counts()['hit_border'], 999995)
+
+    def test_outcomes_of_runs(self):
+        field, robot = Map(10, 10), Robot(5, 5)
+        result = engine.run_commands(
+            field, robot, ['LEFT', 'UP*1000000000000', 'ROTATE90*3', 'DOWN'])
+        self.assertEqual(len(result.outcomes), 1000000000005)
+        self.assertEqual(list(result.outcomes.runs()),
+                         [(engine.MOVED, 6), (engine.HIT_BORDER, 999999999995),
+                          (engine.TURNED, 3), (engine.MOVED, 1)])
+        self.assertEqual(result.counts()['turned'], 3)
+        self.assertEqual(result.outcomes[-1], engine.MOVED)
+        self.assertEqual(result.outcomes[7], engine.HIT_BORDER)
+        outcomes = engine.Outcomes([engine.MOVED, engine.TURNED])
+        outcomes.add_run(engine.TURNED, 2)
+        outcomes.append(engine.HIT_BARRIER)
+        outcomes += engine.Outcomes([engine.HIT_BARRIER])
+        self.assertEqual(list(outcomes), [engine.MOVED] + [engine.TURNED] * 3
+                         + [engine.HIT_BARRIER] * 2)
+        self.assertEqual(outcomes, bytes(outcomes))
+
+
+class FleetTest(unittest.TestCase):
+
+    def test_single_robot_matches_engine(self):
+        random.seed(11)
+        field = Map(10, 10)
+        simulator.prepare_field(field, 5, 5, 6)
+        robots = fleet.Fleet(field, [(5, 5)])
+        robot = Robot(5, 5)
+        commands = [random.choice(engine.COMMANDS) for _ in range(200)]
+        for command in commands:
+            robots.tick(command)
+        engine.run_commands(field, robot, commands)
+        copy = robots.robot(0)
+        self.assertEqual((copy.c_x, copy.c_y, copy.angle, copy.orientation),
+                         (robot.c_x, robot.c_y, robot.angle,
+                          robot.orientation))
+
+    def test_conflicts(self):
+        field = Map(5, 1)
+        robots = fleet.Fleet(field, [(0, 0), (1, 0), (3, 0)])
+        self.assertEqual(list(robots.tick('RIGHT')), [engine.MOVED] * 3)
+        self.assertEqual(list(robots.xs), [1, 2, 4])
+        robots = fleet.Fleet(field, [(0, 0), (1, 0)])
+        self.assertEqual(list(robots.tick(['RIGHT', 'LEFT'])),
+                         [fleet.BLOCKED, fleet.BLOCKED])
+        robots = fleet.Fleet(field, [(0, 0), (2, 0)])
+        self.assertEqual(list(robots.tick(['RIGHT', 'LEFT'])),
+                         [engine.MOVED, fleet.BLOCKED])
+        self.assertEqual(list(robots.xs), [1, 2])
+        with self.assertRaises(ValueError):
+            fleet.Fleet(field, [(1, 0), (1, 0)])
+
+
+class TraceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.field = Map(3, 3)
+        self.field.place_barrier(1, 2, 0, 1)
+        self.robot = Robot(1, 1)
+        with contextlib.redirect_stdout(io.StringIO()):
+            for command in ('UP', 'RIGHT', 'UP', 'LEFT', 'ROTATE180'):
+                simulator.move_robot(command, self.robot, self.field.map)
+
+    def test_records(self):
+        records = list(self.robot.trace)
+        self.assertEqual(records[0], traces.TraceRecord(
+            'UP', 'UP', 1, 1, 1, 0, 'moved'))
+        self.assertEqual(records[2], traces.TraceRecord(
+            'RIGHT', 'RIGHT', 1, 0, 2, 0, 'hit_barrier'))
+        self.assertEqual(records[-1].outcome, 'turned')
+        self.assertIn('Robot arrived to [1, 0] from [1, 1]',
+                      str(self.robot.trace))
+
+    def test_write_and_read(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for binary in (False, True):
+                path = os.path.join(directory, 'traces')
+                traces.write_traces(self.robot.trace, path, binary)
+                self.assertEqual(list(traces.read_traces(path)),
+                                 list(self.robot.trace))
+
+    def test_read_legacy(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'traces.json')
+            with open(path, 'w') as file:
+                json.dump(str(self.robot.trace), file)
+            loaded = traces.read_traces(path)
+        self.assertEqual(str(loaded), str(self.robot.trace))
+        self.assertEqual(len(loaded), sum(
+            record.outcome in ('moved', 'turned')
+            for record in self.robot.trace))
+
+
+class PathfindingTest(unittest.TestCase):
+
+    def test_goto_goes_around_barrier(self):
+        field = Map(5, 5)
+        field.place_barrier(1, 1, 1, 3)
+        robot = Robot(0, 2)
+        planner = pathfinding.Planner(field)
+        commands = planner.path(robot, 4, 2)
+        self.assertEqual(len(commands), 8)
+        result = pathfinding.goto(field, robot, 4, 2, planner)
+        self.assertEqual((result.c_x, result.c_y), (4, 2))
+        self.assertEqual(result.counts()['moved'], 8)
+        self.assertIsNone(planner.path(robot, 2, 2))
+
+    def test_cache(self):
+        field = Map(5, 5)
+        planner = pathfinding.Planner(field, capacity=2)
+        first = planner.distances(0, 0)
+        self.assertIs(planner.distances(0, 0), first)
+        planner.distances(1, 1)
+        planner.distances(2, 2)
+        self.assertIsNot(planner.distances(0, 0), first)
+        field.place_barrier(1, 0, 1, 1)
+        self.assertEqual(planner.distances(0, 0)[1, 0], -1)
+
+    def test_go_to_in_simulator(self):
+        field = Map(5, 5)
+        robot = Robot(2, 2)
+        self.assertEqual(simulator.parse_goto('GOTO 4 0'), (4, 0))
+        self.assertIsNone(simulator.parse_goto('GOTO 4'))
+        with contextlib.redirect_stdout(io.StringIO()):
+            simulator.go_to(robot, field, 4, 0)
+        self.assertEqual((robot.c_x, robot.c_y), (4, 0))
+
+
+class SweepTest(unittest.TestCase):
+
+    def test_scenario_is_reproducible(self):
+        scenario = sweep.scenarios([(20, 20)], [5], [200], [3])[0]
+        first, second = sweep.run_scenario(scenario), \
+            sweep.run_scenario(scenario)
+        self.assertEqual(first['final_position'], second['final_position'])
+        self.assertEqual(first['outcomes'], second['outcomes'])
+        self.assertEqual(first['commands'], 200)
+
+    def test_sweep_writes_results(self):
+        parameters = sweep.scenarios([(10, 10), (15, 10)], [2], [50], [0, 1])
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'sweep.json')
+            sweep.sweep(parameters, workers=2, output=path)
+            with open(path) as file:
+                report = json.load(file)
+        self.assertEqual(len(report['runs']), 4)
+        self.assertEqual([group['runs'] for group in report['scenarios']],
+                         [2, 2])
+
+
+class BenchmarkTest(unittest.TestCase):
+
+    def test_suite_and_compare(self):
+        results = benchmarks.run_suite([10], [10], [20], repeat=1)
+        self.assertIn('check_collisions/10x10/density=10', results['cases'])
+        self.assertIn('run_commands/10x10/density=10/script=20',
+                      results['cases'])
+        slower = json.loads(json.dumps(results))
+        self.assertEqual(benchmarks.compare(results, slower), [])
+        case = slower['cases']['move_robot/10x10/density=10/script=20']
+        case['seconds'], case['memory'] = 1.0, case['memory'] * 2 + 1
+        self.assertEqual(
+            [(name, metric) for name, metric, _, _
+             in benchmarks.compare(results, slower)],
+            [('move_robot/10x10/density=10/script=20', 'seconds'),
+             ('move_robot/10x10/density=10/script=20', 'memory')])
+
+    def test_layouts_share_the_scenario(self):
+        results = benchmarks.compare_grid_layouts(30, barriers=5)
+        self.assertEqual(set(results), {'ListMap', 'Map'})
+        self.assertEqual(set(results['ListMap']), set(results['Map']))
+        field, reference = Map(30, 30, seed=30), benchmarks.ListMap(30, 30)
+        field.generate_barriers(5)
+        for barrier in field.list_barriers():
+            reference.place_barrier(*barrier)
+        np.testing.assert_array_equal(np.array(reference.map), field.map)
+
+
+class StatsTest(unittest.TestCase):
+
+    def setUp(self):
+        STATS.reset()
+        self.addCleanup(STATS.reset)
+        self.addCleanup(STATS.disable)
+
+    def test_disabled_records_nothing(self):
+        field, robot = Map(5, 5), Robot(2, 2)
+        with contextlib.redirect_stdout(io.StringIO()):
+            simulator.move_robot('UP', robot, field.map)
+            simulator.draw(robot, field)
+        self.assertEqual(STATS.snapshot()['counters'], {})
+        self.assertEqual(STATS.snapshot()['phases'], {})
+
+    def test_counters_and_phases(self):
+        STATS.enable()
+        field, robot = Map(5, 5), Robot(2, 0)
+        field.generate_barrier(1)
+        with contextlib.redirect_stdout(io.StringIO()):
+            for command in ('UP', 'ROTATE90', 'UP'):
+                simulator.move_robot(command, robot, field.map)
+            simulator.draw(robot, field)
+        snapshot = STATS.snapshot()
+        self.assertEqual(snapshot['counters']['commands'], 3)
+        self.assertEqual(snapshot['counters']['collisions'], 2)
+        self.assertGreater(snapshot['counters']['placement_attempts'], 0)
+        self.assertGreater(snapshot['counters']['cells_rendered'], 0)
+        self.assertEqual(snapshot['phases']['move_robot']['count'], 3)
+        self.assertEqual(snapshot['phases']['draw']['count'], 1)
+
+    def test_histogram_and_dump(self):
+        histogram = Histogram()
+        for duration in (100, 200, 300, 5000):
+            histogram.record(duration)
+        self.assertEqual(histogram.percentile(0.5), 256)
+        self.assertEqual(histogram.percentile(1), 5000)
+        self.assertEqual((histogram.low, histogram.high), (100, 5000))
+        stats = Stats()
+        stats.enable()
+        with stats.phase('input'):
+            stats.count('commands', 2)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'stats.jsonl')
+            stats.dump(path)
+            stats.dump(path)
+            with open(path) as file:
+                lines = [json.loads(line) for line in file]
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(lines[0]['counters'], {'commands': 2})
+        self.assertEqual(lines[0]['phases']['input']['count'], 1)
+
+
+class ServerTest(unittest.TestCase):
+
+    def test_session_returns_deltas(self):
+        session = server.Session(Map(10, 10))
+        self.assertEqual(session.execute('up'), {'outcome': 'moved', 'y': 4})
+        self.assertEqual(session.execute('ROTATE90'),
+                         {'outcome': 'turned', 'orientation': 'RIGHT'})
+        self.assertEqual(session.execute('UP*10'),
+                         {'outcomes': {'moved': 4, 'hit_border': 6},
+                          'y': 0, 'orientation': 'UP'})
+        self.assertEqual(session.execute('UP'), {'outcome': 'hit_border'})
+        self.assertEqual(session.execute('SENSE'), {'sense': [0, 9, 5, 4]})
+        with self.assertRaises(ValueError):
+            session.execute('JUMP')
+        with self.assertRaises(ValueError):
+            session.execute(f'ROTATE90*{server.MAX_REPEAT + 1}')
+        self.assertEqual(session.execute(f'ROTATE180*{server.MAX_REPEAT}'),
+                         {'outcomes': {'turned': server.MAX_REPEAT}})
+
+    def test_clients(self):
+        async def scenario():
+            host = server.SimulatorServer()
+            listener = await host.start(port=0)
+            port = listener.sockets[0].getsockname()[1]
+            async with listener:
+                private = await server.load(port=port, clients=5,
+                                            commands=20, size=30)
+                shared = await server.load(port=port, clients=5,
+                                           commands=20, shared='arena',
+                                           size=30)
+                reader, writer = await asyncio.open_connection(
+                    server.HOST, port)
+                writer.write(b'UP\nJOIN arena\nSTATE\nQUIT\n')
+                responses = [json.loads(await reader.readline())
+                             for _ in range(4)]
+                writer.close()
+            return private, shared, list(host.shared), responses
+
+        private, shared, names, responses = asyncio.run(scenario())
+        self.assertEqual(private['commands'], 100)
+        self.assertEqual(shared['commands'], 100)
+        self.assertEqual(names, ['ARENA'])
+        self.assertIn('error', responses[0])
+        self.assertEqual(responses[1]['width'], 30)
+        self.assertEqual(responses[3], {'bye': True})
+
+
+class VisibilityTest(unittest.TestCase):
+
+    def test_barriers_hide_points(self):
+        field = Map(11, 11)
+        field.place_barrier(1, 5, 3, 1)
+        view = Visibility(field, 4).view(5, 5)
+        self.assertIn((5, 3), view)
+        self.assertNotIn((5, 2), view)
+        self.assertIn((4, 2), view)
+        self.assertNotIn((5, 0), view)
+        self.assertNotIn((9, 9), view)
+        open_view = Visibility(Map(11, 11), 4).view(5, 5)
+        self.assertEqual(len(open_view) - len(view), 2)
+        self.assertEqual(Visibility(field, 4).barriers(5, 5), [(5, 3)])
+
+    def test_changes_drop_near_views(self):
+        field = Map(40, 10)
+        visibility = Visibility(field, 3)
+        near, far = visibility.view(5, 5), visibility.view(30, 5)
+        field.place_barrier(1, 5, 3, 1)
+        self.assertIs(visibility.view(30, 5), far)
+        self.assertIsNot(visibility.view(5, 5), near)
+        self.assertNotIn((5, 2), visibility.view(5, 5))
+        visibility.close()
+        self.assertEqual(field.listeners, [])
+
+    def test_renderer_hides_points(self):
+        field = Map(7, 7)
+        field.place_barrier(1, 3, 2, 1)
+        robot = Robot(3, 3)
+        frame = ViewportRenderer(visibility=Visibility(field, 3)).viewport(
+            robot, field, simulator.calculate_viewzone(field, robot))
+        self.assertIn('+', frame[3][4])
+        self.assertIn('.', frame[2][4])
+        self.assertIn('.', frame[1][4])
+        self.assertEqual(frame[4][5], ' ')
+        self.assertEqual(server.Session(field).execute('LOOK')['barriers'],
+                         [(3, 2)])
+
+
+class CoverageTest(unittest.TestCase):
+
+    def test_visits_and_revisits(self):
+        field = Map(5, 5)
+        coverage = Coverage(field, 2, 2)
+        for x, y in ((2, 1), (2, 0), (2, 1), (2, 2)):
+            coverage.visit(x, y)
+        self.assertEqual((coverage.visited, coverage.moves,
+                          coverage.revisits), (3, 4, 2))
+        self.assertEqual(coverage.visits(2, 1), 2)
+        self.assertEqual(coverage.visits(0, 0), 0)
+        self.assertEqual(coverage.reachable(), 25)
+        self.assertAlmostEqual(coverage.percent(), 12.0)
+        self.assertEqual(coverage.heatmap()[1, 2], 2)
+        self.assertEqual(int(coverage.heatmap().sum()), 5)
+
+    def test_reachable_follows_barriers(self):
+        field = Map(5, 5)
+        coverage = Coverage(field, 0, 0)
+        self.assertEqual(coverage.reachable(), 25)
+        field.place_barrier(1, 2, 0, 1)
+        self.assertEqual(coverage.reachable(), 24)
+        field.place_barrier(2, 0, 2, 5)
+        self.assertEqual(coverage.reachable(), 9)
+        field.remove_barrier_by_id(2)
+        self.assertEqual(coverage.reachable(), 24)
+        coverage.close()
+        self.assertEqual(field.listeners, [])
+
+    def test_local_updates_match_a_new_count(self):
+        field = Map(30, 30, seed=4)
+        coverage = Coverage(field, 15, 15)
+        coverage.reachable()
+        for step in range(40):
+            if step % 3 == 2 and field.barriers:
+                field.remove_barrier_by_id(next(iter(field.barriers)))
+            else:
+                x, y = field.rng.integers(0, 28, 2).tolist()
+                if not field.map[y:y + 2, x:x + 2].any():
+                    field.place_barrier(100 + step, x, y, 2)
+            self.assertEqual(coverage.reachable(),
+                             Coverage(field, 15, 15).reachable())
+
+    def test_sparse_map(self):
+        field = SparseMap(200, 100, tile=16)
+        field.place_barrier(1, 10, 0, 5)
+        field.place_barrier(2, 10, 5, 5)
+        field.place_barrier(3, 0, 10, 15)
+        coverage = Coverage(field, 150, 50)
+        for x in range(149, 144, -1):
+            coverage.visit(x, 50)
+        self.assertEqual(coverage.reachable(), 200 * 100 - 275 - 100)
+        self.assertEqual(len(coverage._bits), 1)
+        field.remove_barrier_by_id(3)
+        self.assertEqual(coverage.reachable(), 200 * 100 - 50)
+        self.assertEqual(coverage.visits(147, 50), 1)
+        self.assertAlmostEqual(coverage.percent(), 600 / (200 * 100 - 50))
+
+    def test_engine_and_move_robot_count_the_same(self):
+        random.seed(3)
+        field = Map(12, 12)
+        simulator.prepare_field(field, 6, 6, 6)
+        commands = [random.choice(engine.COMMANDS) for _ in range(200)]
+        interactive, headless = Robot(6, 6), Robot(6, 6)
+        interactive.coverage = Coverage(field, 6, 6)
+        headless.coverage = Coverage(field, 6, 6)
+        with contextlib.redirect_stdout(io.StringIO()):
+            for command in commands:
+                simulator.move_robot(command, interactive, field.map)
+        engine.Engine(field, headless).execute(
+            engine.compile_commands(commands))
+        self.assertEqual(headless.coverage.as_dict(),
+                         interactive.coverage.as_dict())
+        self.assertTrue(np.array_equal(headless.coverage.heatmap(),
+                                       interactive.coverage.heatmap()))
+
+    def test_write_heatmap(self):
+        coverage = Coverage(Map(3, 2), 0, 0)
+        coverage.visit(0, 0)
+        coverage.visit(1, 0)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'heatmap.pgm')
+            coverage.write_heatmap(path)
+            with open(path, 'rb') as file:
+                self.assertEqual(file.read(),
+                                 b'P5\n3 2\n255\n\xff\x7f\x00\x00\x00\x00')
+
+
+class EventTest(unittest.TestCase):
+
+    def commands(self, robot: Robot):
+        field = Map(3, 3)
+        field.place_barrier(1, 0, 1, 1)
+        for command in ('UP', 'UP', 'ROTATE90', 'LEFT', 'DOWN'):
+            simulator.move_robot(command, robot, field.map)
+
+    def test_console_sink_prints_as_before(self):
+        robot = Robot(1, 1)
+        out = io.StringIO()
+        sink = robot.events.subscribe(events.ConsoleSink(out))
+        self.commands(robot)
+        self.assertEqual(out.getvalue(), '')
+        robot.events.flush()
+        self.assertEqual(out.getvalue(), (
+            'Robot direction: UP\nRobot arrived to [1, 0] from [1, 1]\n'
+            'Oops...We hit a border. Try again.\n'
+            'Robot turned RIGHT\n'
+            'Robot turned DOWN\nRobot turned LEFT\n'
+            'Robot direction: LEFT\nRobot arrived to [0, 0] from [1, 0]\n'
+            'Robot turned UP\nRobot turned RIGHT\nRobot turned DOWN\n'
+            'Oops...We hit a barrier. Try again.\n'))
+        robot.events.unsubscribe(sink)
+        self.assertEqual(robot.events.sinks, [])
+
+    def test_silent_without_sinks(self):
+        robot = Robot(1, 1)
+        robot.events.subscribe(events.NullSink())
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            self.commands(robot)
+            Robot(1, 1).check_collisions([[0]], 0, -1)
+        self.assertEqual(out.getvalue(), '')
+        self.assertEqual(len(robot.trace), 10)
+
+    def test_batched_sinks(self):
+        robot = Robot(1, 1)
+        batches = queue.Queue()
+        robot.events.subscribe(events.QueueSink(batches, batch_size=3))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'events.jsonl')
+            robot.events.subscribe(events.FileSink(path))
+            self.commands(robot)
+            self.assertEqual(batches.qsize(), 3)
+            robot.events.close()
+            self.assertEqual(list(traces.read_traces(path)),
+                             list(robot.trace))
+        received = []
+        while not batches.empty():
+            received.extend(batches.get())
+        self.assertEqual([event.as_dict() for event in received],
+                         [record.as_dict() for record in robot.trace])
+        self.assertEqual(received[1].name, 'hit_border')
+
+
+class DynamicsTest(unittest.TestCase):
+
+    def test_door_opens_and_closes(self):
+        field = Map(6, 6)
+        scheduler = dynamics.Scheduler(field)
+        door = scheduler.add(dynamics.Door(2, 2, 2, closed=2, opened=1))
+        states = []
+        for _ in range(6):
+            scheduler.tick()
+            states.append(field.barrier_at(2, 2))
+        self.assertEqual(states, [1, None, 1, 1, None, 1])
+        scheduler.remove(door)
+        self.assertEqual(field.barriers, {})
+
+    def test_robot_point_stays_free(self):
+        field = Map(6, 1)
+        robot = Robot(3, 0)
+        scheduler = dynamics.Scheduler(field, [robot])
+        scheduler.add(dynamics.Door(3, 0, 1, closed=1, opened=0))
+        vehicle = scheduler.add(dynamics.Vehicle(0, 0, 1, 1, 0))
+        positions = []
+        for _ in range(6):
+            scheduler.tick()
+            positions.append(vehicle.x)
+        self.assertIsNone(field.barrier_at(3, 0))
+        self.assertEqual(positions, [0, 1, 2, 2, 1, 0])
+        robot.c_x = 5
+        scheduler.tick()
+        self.assertEqual(field.barrier_at(3, 0), 1)
+
+    def test_indexes_follow_changes(self):
+        field = Map(40, 30, seed=2)
+        field.generate_barriers(10)
+        robot = Robot(20, 15)
+        field.remove_barrier(20, 15)
+        scheduler = dynamics.Scheduler(field, [robot])
+        for index in range(12):
+            scheduler.add(dynamics.Vehicle(index * 3, index * 2, 2,
+                                           1 - index % 3, index % 2))
+            scheduler.add(dynamics.Door(index * 3, 28 - index * 2, 1,
+                                        closed=index % 4 + 1))
+        field.occupancy(), field.obstacles()
+        blocked = engine.Engine(field, robot).blocked()
+        visibility = Visibility(field, 3)
+        for _ in range(50):
+            self.assertLessEqual(scheduler.tick(), 12 * 9)
+            self.assertEqual(field.map[15, 20], 0)
+            for x in range(0, 40, 3):
+                visibility.view(x, 15)
+        for (x, y), view in visibility._cache.items():
+            np.testing.assert_array_equal(view.mask,
+                                          visibility._compute(x, y).mask)
+        fresh = SummedAreaTable(field.map)
+        self.assertEqual(field.occupancy().count(3, 4, 20, 11),
+                         fresh.count(3, 4, 20, 11))
+        self.assertEqual(field.occupancy().total(), fresh.total())
+        np.testing.assert_array_equal(field.occupancy().table, fresh.table)
+        fresh = ObstacleIndex(field.map)
+        for name in ('up', 'down', 'left', 'right'):
+            np.testing.assert_array_equal(getattr(field.obstacles(), name),
+                                          getattr(fresh, name))
+        self.assertEqual(bytes(blocked), (field.map != 0).tobytes())
+
+    def test_vehicle_moves_by_strips(self):
+        field = Map(10, 10)
+        scheduler = dynamics.Scheduler(field)
+        vehicle = scheduler.add(dynamics.Vehicle(2, 2, 3, 1, 1))
+        field.obstacles()
+        self.assertEqual(scheduler.tick(), 9)
+        zones = []
+        field.listeners.append(zones.append)
+        self.assertEqual(scheduler.tick(), 2 * (9 - 4))
+        self.assertEqual(zones, [(2, 2, 1, 3), (3, 2, 2, 1),
+                                 (5, 3, 1, 3), (3, 5, 2, 1)])
+        self.assertEqual(field.barriers[vehicle.colour], (3, 3, 3))
+        np.testing.assert_array_equal(field.obstacles().left,
+                                      ObstacleIndex(field.map).left)
+
+    def test_run_scheduled_ticks_between_commands(self):
+        field = Map(5, 1)
+        robot = Robot(0, 0)
+        scheduler = dynamics.Scheduler(field, [robot])
+        scheduler.add(dynamics.Door(2, 0, 1, closed=1, opened=1, phase=1))
+        result = dynamics.run_scheduled(field, robot, ['RIGHT*4'],
+                                        scheduler)
+        self.assertEqual(list(result.outcomes),
+                         [engine.MOVED, engine.HIT_BARRIER,
+                          engine.MOVED, engine.MOVED])
+        self.assertEqual(robot.c_x, 3)
+
+
+class TrajectoryTest(unittest.TestCase):
+
+    def test_time_range_and_rectangle_queries(self):
+        field = Map(50, 40, seed=4)
+        field.generate_barriers(10)
+        positions = [(5, 5), (40, 30), (20, 10)]
+        for x, y in positions:
+            field.remove_barrier(x, y)
+        swarm = fleet.Fleet(field, positions)
+        random.seed(4)
+        steps = []
+        with tempfile.TemporaryDirectory() as directory:
+            with trajectory.TrajectoryWriter(directory, chunk=100,
+                                             cell=8) as writer:
+                for step in range(300):
+                    outcomes = swarm.tick(random.choice(engine.COMMANDS))
+                    writer.extend(step, np.arange(3), swarm.xs, swarm.ys,
+                                  swarm.orientations, outcomes)
+                    steps.extend(zip([step] * 3, range(3),
+                                     swarm.xs.tolist(), swarm.ys.tolist(),
+                                     outcomes.tolist()))
+            store = trajectory.TrajectoryStore(directory)
+            self.assertEqual(len(store), 900)
+            self.assertEqual(len(store.chunks), 9)
+            rows = store.between(120, 180, robot=1)
+            self.assertEqual(
+                list(zip(rows['step'].tolist(), rows['x'].tolist(),
+                         rows['y'].tolist())),
+                [(step, x, y) for step, robot, x, y, _ in steps
+                 if 120 <= step <= 180 and robot == 1])
+            rows = store.within(10, 5, 20, 17, outcome=engine.MOVED)
+            self.assertEqual(
+                list(zip(rows['step'].tolist(), rows['robot'].tolist())),
+                [(step, robot) for step, robot, x, y, outcome in steps
+                 if 10 <= x < 30 and 5 <= y < 22
+                 and outcome == engine.MOVED])
+            self.assertEqual(len(store.between(400, 500)), 0)
+            writer = trajectory.TrajectoryWriter(directory)
+            writer.append(5, 0, 0, 0, 0, 0)
+            with self.assertRaises(ValueError):
+                writer.append(4, 0, 0, 0, 0, 0)
+
+    def test_robot_events_and_traces(self):
+        field = Map(5, 5)
+        robot = Robot(2, 2)
+        with tempfile.TemporaryDirectory() as directory:
+            writer = trajectory.TrajectoryWriter(directory)
+            robot.events.subscribe(trajectory.TrajectorySink(writer))
+            with contextlib.redirect_stdout(io.StringIO()):
+                for command in ('UP', 'UP', 'UP', 'LEFT'):
+                    simulator.move_robot(command, robot, field.map)
+            robot.events.close()
+            rows = trajectory.TrajectoryStore(directory).between(0, 10)
+            self.assertEqual(list(zip(rows['x'].tolist(),
+                                      rows['y'].tolist())),
+                             [(2, 1), (2, 0), (2, 0)] + [(2, 0)] * 3
+                             + [(1, 0)])
+            self.assertEqual(rows['outcome'].tolist(),
+                             [engine.MOVED, engine.MOVED, engine.HIT_BORDER]
+                             + [engine.TURNED] * 3 + [engine.MOVED])
+            copy = os.path.join(directory, 'copy')
+            trajectory.write_trace(robot.trace, copy)
+            np.testing.assert_array_equal(
+                trajectory.TrajectoryStore(copy).between(0, 10), rows)
+
+
+class ReplayTest(unittest.TestCase):
+
+    def test_seek_matches_recorded_session(self):
+        random.seed(5)
+        field = Map(20, 20, seed=5)
+        simulator.prepare_field(field, 10, 10, 15)
+        robot = Robot(10, 10)
+        commands = [random.choice(engine.COMMANDS) for _ in range(250)]
+        states = [(10, 10, 90, 'UP')]
+        with tempfile.TemporaryDirectory() as directory:
+            with replay.Recorder(directory, field, robot, 100) as recorder:
+                for command in commands:
+                    simulator.move_robot(command, robot, field.map)
+                    recorder.record(command)
+                    states.append((robot.c_x, robot.c_y, robot.angle,
+                                   robot.orientation))
+            recording = replay.Replay(directory)
+            self.assertEqual(recording.snapshots, [0, 100, 200])
+            self.assertEqual(len([name for name in os.listdir(directory)
+                                  if name.startswith('map-')]), 1)
+            for step in (0, 1, 99, 100, 101, 237, 250):
+                field_copy, copy = recording.seek(step)
+                self.assertEqual((copy.c_x, copy.c_y, copy.angle,
+                                  copy.orientation), states[step])
+            np.testing.assert_array_equal(field_copy.map, field.map)
+            self.assertEqual(recording.commands(10, 13), commands[10:13])
+            with self.assertRaises(ValueError):
+                recording.seek(251)
+
+    def test_engine_runs_and_changed_map(self):
+        field = Map(10, 10)
+        robot = Robot(5, 5)
+        with tempfile.TemporaryDirectory() as directory:
+            with replay.Recorder(directory, field, robot, 4) as recorder:
+                recorder.run(engine.Engine(field, robot), ['UP*3', 'LEFT'])
+                field.place_barrier(1, 0, 0, 2)
+                recorder.run(engine.Engine(field, robot), ['ROTATE180*6'])
+            recording = replay.Replay(directory)
+            self.assertEqual(recording.snapshots, [0, 4, 8])
+            self.assertEqual(recording.steps, 10)
+            field_copy, copy = recording.seek(10)
+            self.assertEqual((copy.c_x, copy.c_y, copy.orientation),
+                             (robot.c_x, robot.c_y, robot.orientation))
+            self.assertEqual(field_copy.barrier_at(1, 1), 1)
+            self.assertIsNone(recording.seek(4)[0].barrier_at(1, 1))
+
+
+class TilingTest(unittest.TestCase):
+
+    def assert_registry_matches(self, field):
+        grid = np.zeros_like(field.map)
+        for colour, (x, y, width) in field.barriers.items():
+            self.assertFalse(grid[y:y + width, x:x + width].any())
+            grid[y:y + width, x:x + width] = colour
+        np.testing.assert_array_equal(grid, field.map)
+
+    def test_same_map_for_any_number_of_workers(self):
+        alone = tiling.generate_tiled(150, 100, 120, seed=3, tile=32,
+                                      workers=1)
+        pooled = tiling.generate_tiled(150, 100, 120, seed=3, tile=32,
+                                       workers=2)
+        self.assertEqual(alone.barriers_count, 120)
+        self.assertEqual(alone.barriers, pooled.barriers)
+        np.testing.assert_array_equal(alone.map, pooled.map)
+        self.assert_registry_matches(alone)
+        crossing = [(x, y, width) for x, y, width in alone.barriers.values()
+                    if x // 32 != (x + width - 1) // 32
+                    or y // 32 != (y + width - 1) // 32]
+        self.assertTrue(crossing)
+
+    def test_full_and_small_maps(self):
+        field = tiling.generate_tiled(5, 5, 100, seed=1, tile=2, workers=1)
+        self.assertTrue(field.is_full())
+        self.assert_registry_matches(field)
+        self.assertIsNone(field._placement)
+        self.assertLessEqual(max(field.barriers), 200)
+        self.assertEqual(tiling.tiles(5, 3, 4),
+                         [(0, 0, 4, 3), (4, 0, 1, 3)])
+        self.assertEqual(tiling.tiles(5, 3, 4, shift=2),
+                         [(0, 0, 2, 2), (2, 0, 3, 2),
+                          (0, 2, 2, 1), (2, 2, 3, 1)])
+        with self.assertRaises(ValueError):
+            tiling.generate_tiled(0, 5, 1)
+
+
+class SparseMapTest(unittest.TestCase):
+
+    def test_same_cells_as_dense_map(self):
+        dense, sparse = Map(50, 40), SparseMap(50, 40, tile=16)
+        for colour, x, y, width in ((1, 3, 3, 5), (2, 14, 14, 6),
+                                    (3, 30, 20, 10)):
+            dense.place_barrier(colour, x, y, width)
+            sparse.place_barrier(colour, x, y, width)
+        self.assertTrue((sparse.map[0:40, 0:50] == dense.map).all())
+        self.assertEqual(sparse.map[16][15], dense.map[16][15])
+        self.assertEqual(sparse.check_collisions(8, 0, 6, 14),
+                         dense.check_collisions(8, 0, 6, 14))
+        self.assertTrue(sparse.check_collisions(12, 12, 3, 3))
+        with self.assertRaises(IndexError):
+            sparse.map[40][0]
+
+    def test_tiles_follow_barriers(self):
+        field = SparseMap(100000, 100000)
+        self.assertTrue(field.free_point(99999, 99999))
+        self.assertFalse(field.check_collisions(0, 0, 100000, 100000))
+        self.assertEqual(field.tiles, {})
+        field.place_barrier(1, 60, 60, 10)
+        self.assertEqual(len(field.tiles), 4)
+        field.remove_barrier(65, 65)
+        self.assertEqual(field.tiles, {})
+
+    def test_simulator_on_sparse_map(self):
+        field = SparseMap(100000, 100000, seed=2)
+        simulator.prepare_field(field, 50000, 50000, 50)
+        robot = Robot(50000, 50000)
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            simulator.draw(robot, field)
+            simulator.move_robot('LEFT', robot, field.map)
+            simulator.go_to(robot, field, 50010, 50010)
+        self.assertIn('^', out.getvalue())
+        self.assertEqual((robot.c_x, robot.c_y), (50010, 50010))
+
+    def test_fleet_on_sparse_map(self):
+        dense, sparse = Map(50, 40), SparseMap(50, 40, tile=16)
+        for field in (dense, sparse):
+            field.place_barrier(1, 10, 10, 5)
+            field.place_barrier(2, 30, 5, 8)
+        points = [(12, 20), (0, 0), (34, 30), (20, 12)]
+        dense_fleet = fleet.Fleet(dense, points)
+        sparse_fleet = fleet.Fleet(sparse, points)
+        np.testing.assert_array_equal(sparse_fleet.sense(),
+                                      dense_fleet.sense())
+        for command in ('UP', 'RIGHT', 'RIGHT', 'DOWN'):
+            np.testing.assert_array_equal(sparse_fleet.tick(command),
+                                          dense_fleet.tick(command))
+        np.testing.assert_array_equal(sparse_fleet.sense(),
+                                      dense_fleet.sense())
+
+
+class MapFileTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'field.rsmap')
+
+    def test_round_trip(self):
+        field = Map(60, 40, seed=3)
+        field.generate_barriers(20)
+        field.place_barrier(300, 0, 0, 1)
+        mapfile.save_map(field, self.path)
+        loaded = mapfile.load_map(self.path)
+        self.assertIsInstance(loaded.map, np.memmap)
+        self.assertTrue((loaded.map == field.map).all())
+        self.assertEqual(loaded.barriers, field.barriers)
+        self.assertEqual(loaded.check_collisions(0, 0, 60, 40),
+                         field.check_collisions(0, 0, 60, 40))
+
+    def test_sparse_map(self):
+        field = SparseMap(300, 200, tile=64)
+        field.place_barrier(1, 60, 60, 10)
+        mapfile.save_map(field, self.path)
+        loaded = mapfile.load_map(self.path, 'r')
+        self.assertEqual(loaded.barrier_at(65, 65), 1)
+        self.assertEqual(int(np.count_nonzero(loaded.map)), 100)
+
+    def test_modes(self):
+        field = Map(20, 20)
+        field.place_barrier(1, 2, 2, 3)
+        mapfile.save_map(field, self.path)
+        with self.assertRaises(ValueError):
+            mapfile.load_map(self.path, 'r').place_barrier(2, 10, 10, 2)
+        overlay = mapfile.load_map(self.path, 'c')
+        overlay.remove_barrier(3, 3)
+        overlay.place_barrier(2, 10, 10, 2)
+        self.assertEqual(mapfile.load_map(self.path, 'r').barrier_at(3, 3), 1)
+        self.assertTrue(mapfile.load_map(self.path).free_point(10, 10))
+
+    def test_colour_that_does_not_fit(self):
+        field = Map(20, 20)
+        field.place_barrier(1, 2, 2, 3)
+        mapfile.save_map(field, self.path)
+        shared = mapfile.load_map(self.path, 'r+')
+        with self.assertRaises(ValueError):
+            shared.place_barrier(300, 10, 10, 2)
+        self.assertIsInstance(shared.map, np.memmap)
+        shared.place_barrier(200, 10, 10, 2)
+        del shared
+        self.assertEqual(mapfile.load_map(self.path, 'r').barrier_at(11, 11),
+                         200)
+        owned = Map(20, 20)
+        owned.place_barrier(300, 10, 10, 2)
+        self.assertEqual(owned.barrier_at(11, 11), 300)
+
+    def test_broken_file(self):
+        mapfile.save_map(Map(20, 20), self.path)
+        with open(self.path, 'r+b') as file:
+            file.truncate(os.path.getsize(self.path) - 1)
+        with self.assertRaises(ValueError):
+            mapfile.load_map(self.path)
+        with open(self.path, 'wb') as file:
+            file.write(b'{"map": []}')
+        with self.assertRaises(ValueError):
+            mapfile.load_map(self.path)
+
+
 class MapTest(unittest.TestCase):
 
     def test_generating_barrier(self):
@@ -77,6 +1043,55 @@ class MapTest(unittest.TestCase):
         new_count = field.barriers_count
         self.assertNotEqual(old_count, new_count)
 
+    def test_check_collisions(self):
+        field = Map(5, 5)
+        field.map[1:3, 1:3] = 1
+        self.assertTrue(field.check_collisions(0, 0, 2, 2))
+        self.assertFalse(field.check_collisions(3, 0, 2, 5))
+        self.assertTrue(field.check_collisions(4, 4, 2, 2))
+
+    def test_colour_widens_dtype(self):
+        field = Map(5, 5)
+        field.generate_barrier(1000)
+        self.assertEqual(field.map.max(), 1000)
+
+    def test_seed_gives_same_barriers(self):
+        first, second = Map(60, 40, seed=5), Map(60, 40, seed=5)
+        self.assertEqual(first.generate_barriers(300), 300)
+        second.generate_barriers(300)
+        self.assertEqual(first.barriers, second.barriers)
+        self.assertTrue((first.map == second.map).all())
+        other = Map(60, 40, seed=6)
+        other.generate_barriers(300)
+        self.assertNotEqual(first.barriers, other.barriers)
+
+    def test_generate_barriers_do_not_overlap(self):
+        field = Map(30, 30, seed=1)
+        placed = field.generate_barriers(10000)
+        self.assertTrue(field.is_full())
+        self.assertEqual(placed, field.barriers_count)
+        for colour, x, y, width in field.list_barriers():
+            self.assertTrue((field.map[y:y + width, x:x + width]
+                             == colour).all())
+        self.assertEqual(sum(width * width for *_, width
+                             in field.list_barriers()), 900)
+
+    def test_barrier_registry(self):
+        field = Map(9, 9)
+        field.place_barrier(4, 1, 2, 3)
+        field.place_barrier(7, 6, 6, 2)
+        self.assertEqual(field.list_barriers(),
+                         [(4, 1, 2, 3), (7, 6, 6, 2)])
+        self.assertEqual(field.barrier_at(3, 4), 4)
+        self.assertIsNone(field.barrier_at(0, 0))
+        self.assertEqual(field.remove_barrier(0, 0), 0)
+        self.assertEqual(field.remove_barrier(7, 7), 7)
+        self.assertEqual(field.barriers_count, 1)
+        field.remove_barrier_by_id(4)
+        self.assertEqual(np.count_nonzero(field.map), 0)
+        with self.assertRaises(ValueError):
+            field.remove_barrier_by_id(4)
+
     def test_remove_barrier(self):
         field = Map(5, 5)
         simulator.prepare_field(field, 5 // 2, 5 // 2, 25)
@@ -86,6 +1101,92 @@ class MapTest(unittest.TestCase):
         self.assertNotEqual(old_count, new_count)
 
 
+    def test_ray(self):
+        field = Map(10, 6)
+        field.place_barrier(1, 6, 2, 2)
+        self.assertEqual(field.ray(1, 2, 1, 0, 100), 4)
+        self.assertEqual(field.ray(1, 2, 1, 0, 3), 3)
+        self.assertEqual(field.ray(9, 2, -1, 0, 100), 1)
+        self.assertEqual(field.ray(6, 0, 0, 1, 100), 1)
+        self.assertEqual(field.ray(6, 5, 0, -1, 100), 1)
+        self.assertEqual(field.ray(1, 5, 0, -1, 100), 5)
+        self.assertEqual(field.ray(1, 5, 0, 1, 100), 0)
+
+
+class OccupancyTest(unittest.TestCase):
+
+    def test_count(self):
+        grid = np.zeros((6, 8), dtype=np.uint8)
+        grid[1:4, 2:5] = 1
+        table = SummedAreaTable(grid)
+        self.assertEqual(table.count(0, 0, 8, 6), 9)
+        self.assertEqual(table.count(3, 2, 2, 2), 4)
+        self.assertEqual(table.count(5, 0, 3, 6), 0)
+
+    def test_incremental_update_matches_rebuild(self):
+        field = Map(20, 20)
+        field.occupancy()
+        simulator.prepare_field(field, 10, 10, 15)
+        np.testing.assert_array_equal(field.occupancy().table,
+                                      SummedAreaTable(field.map).table)
+
+    def test_obstacle_index_follows_barriers(self):
+        field = Map(30, 20, seed=4)
+        field.obstacles()
+        field.generate_barrier(1)
+        field.place_barrier(2, 10, 5, 4)
+        field.remove_barrier_by_id(1)
+        field.place_barrier(3, 0, 0, 2)
+        fresh = ObstacleIndex(field.map)
+        for name in ('up', 'down', 'left', 'right'):
+            np.testing.assert_array_equal(getattr(field.obstacles(), name),
+                                          getattr(fresh, name))
+
+    def test_sense(self):
+        field = Map(10, 8)
+        field.place_barrier(1, 6, 2, 2)
+        robot = Robot(3, 3)
+        self.assertEqual(robot.sense(field), (3, 4, 3, 2))
+        field.remove_barrier(6, 2)
+        self.assertEqual(robot.sense(field), (3, 4, 3, 6))
+        robots = fleet.Fleet(field, [(3, 3), (0, 0)])
+        np.testing.assert_array_equal(robots.sense(),
+                                      [[3, 4, 3, 6], [0, 7, 0, 9]])
+        sparse = SparseMap(10, 8, tile=4)
+        sparse.place_barrier(1, 6, 2, 2)
+        self.assertEqual(robot.sense(sparse), (3, 4, 3, 2))
+
+
+class PlacementTest(unittest.TestCase):
+
+    def test_candidates_match_brute_force(self):
+        field = Map(9, 7)
+        simulator.prepare_field(field, 4, 3, 4)
+        engine = field.placement()
+        expected = sum(1 for y in range(7) for x in range(9)
+                       for size in range(1, field.max_barrier_size + 1)
+                       if not field.check_collisions(x, y, size, size))
+        self.assertEqual(engine.candidates(), expected)
+        field.generate_barrier(10)
+        expected = sum(1 for y in range(7) for x in range(9)
+                       for size in range(1, field.max_barrier_size + 1)
+                       if not field.check_collisions(x, y, size, size))
+        self.assertEqual(engine.candidates(), expected)
+
+    def test_sample_fits(self):
+        field = Map(30, 30)
+        field.map[:, :29] = 1
+        x, y, width = field.placement().sample()
+        self.assertEqual((x, width), (29, 1))
+
+    def test_full_map_reports_no_place(self):
+        field = Map(3, 3)
+        for colour in range(1, 10):
+            field.generate_barrier(colour)
+        self.assertTrue(field.is_full())
+        self.assertFalse(field.generate_barrier(10))
+
+
 class RobotTest(unittest.TestCase):
 
     def test_update_orientation(self):
@@ -0,0 +1,374 @@
+"""
+The module contains the parallel generation of large maps.
+
+The map is split into tiles and every tile is filled by a process of
+a pool, straight in a grid in shared memory. A tile places only the
+barriers that lie inside it, so the processes never write the same
+points. Barriers that cross the border of a tile are drawn by the
+tiles too, but they are placed afterwards by a short reconciliation
+pass in the order of the tiles. The barriers that did not fit are
+drawn again inside the tiles, and the few that are left after that
+are drawn in a few more rounds, over tiles shifted by half a tile
+every other round and shared by the free points of the tiles. These
+rounds take the colours the earlier rounds did not use. No index of
+the whole map is ever built, and the grid is copied out of shared
+memory in bands of rows.
+
+Every tile has its own random generator spawned from the seed and its
+share of the barriers is drawn from the seed too, so the same seed
+gives the same map for any number of processes. Every tile takes its
+own block of colours, so the colours are unique but not consecutive.
+
+Usage:
+    field = generate_tiled(20000, 20000, 40000, seed=1)
+"""
+import os
+import math
+import mmap
+import argparse
+from time import perf_counter
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from map import Map
+from mapfile import save_map
+from stats import STATS
+
+# side of a tile in points
+TILE = 1024
+# side of a block of the coarse occupancy used by the reconciliation
+BLOCK = 16
+# rounds for the barriers left after the first two rounds
+LEFTOVER_ROUNDS = 4
+# bytes of the grid copied out of shared memory at once
+BAND_BYTES = 64 * 1024 * 1024
+
+
+def tiles(width: int, height: int, tile: int,
+          shift: int = 0) -> List[Tuple[int, ...]]:
+    """
+    Splits the map into tiles
+
+    :param width: the width of the map
+    :param height: the height of the map
+    :param tile: side of a tile
+    :param shift: the tiles are moved by this number of points to the
+        right and down, the first row and column are cut (default is 0)
+    :return: X, Y of the upper-left corner, width and height
+        of every tile in row order
+    """
+
+    def cuts(length: int) -> List[int]:
+        return [0] + list(range(shift % tile or tile, length, tile)) \
+            + [length]
+
+    columns, rows = cuts(width), cuts(height)
+    return [(left, top, right - left, bottom - top)
+            for top, bottom in zip(rows, rows[1:])
+            for left, right in zip(columns, columns[1:])]
+
+
+class Tile(Map):
+    """
+    A map over one tile of a larger grid. The barriers keep the largest
+    size of the larger map as far as they fit into the tile, larger
+    sizes would only be drawn and rejected.
+
+    Attributes:
+        limit : int
+            the largest side of a barrier on the larger map
+    """
+
+    limit = 1
+
+    @property
+    def max_barrier_size(self) -> int:
+        return min(self.limit, self.width, self.height)
+
+
+def fill_tile(task: tuple) -> Tuple[list, list]:
+    """
+    Places barriers inside one tile of the shared grid.
+
+    In the first round candidates are drawn in batches while the tile
+    is sparse as Map.generate_barriers does, and the free candidates
+    that cross the border of the tile are kept for the reconciliation.
+    In the next rounds the tile generates the barriers as a map,
+    with its own placement engine.
+
+    :param task: name, shape and type of the shared grid, the tile,
+        the colours of the barriers, in consecutive runs, the largest
+        side of a barrier, the seed of the tile and whether candidates
+        that cross the border of the tile are kept
+    :return: placed barriers and kept crossing candidates
+        as colour, X, Y and width
+    """
+
+    name, shape, dtype, (left, top, width, height), colours, \
+        max_size, seed, crossing = task
+    memory = shared_memory.SharedMemory(name=name)
+    try:
+        grid = np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+        tile = Tile.from_grid(grid[top:top + height, left:left + width],
+                              seed=seed)
+        tile.limit = max_size
+        kept = []
+        if crossing:
+            kept = _draw(tile, left, top, shape, colours)
+        else:
+            start = 0
+            for index in range(1, len(colours) + 1):
+                if index < len(colours) and \
+                        colours[index] == colours[index - 1] + 1:
+                    continue
+                run = index - start
+                if tile.generate_barriers(run, colours[start]) < run:
+                    break
+                start = index
+        placed = [(barrier, left + x, top + y, side)
+                  for barrier, (x, y, side) in tile.barriers.items()]
+        return placed, kept
+    finally:
+        memory.close()
+
+
+def _draw(tile: Tile, left: int, top: int, shape: Tuple[int, int],
+          colours: Sequence[int]) -> list:
+    """
+    Draws candidates in batches while the tile is sparse, places
+    the ones inside the tile and keeps the free ones that cross
+    its border, they take colours in the order they were drawn
+
+    :return: kept crossing candidates as colour, X, Y and width
+    """
+
+    kept = []
+    count = len(colours)
+    drawn = 0
+    sparse = True
+    while drawn < count and sparse:
+        size = int(np.clip(4 * (count - drawn),
+                           Map.MIN_BATCH, Map.MAX_BATCH))
+        xs = tile.rng.integers(0, tile.width, size)
+        ys = tile.rng.integers(0, tile.height, size)
+        sides = tile.rng.integers(1, tile.limit + 1, size)
+        inside = (xs + sides <= tile.width) & (ys + sides <= tile.height)
+        across = ~inside & (left + xs + sides <= shape[1]) \
+            & (top + ys + sides <= shape[0])
+        ends_x = np.minimum(xs + sides, tile.width)
+        ends_y = np.minimum(ys + sides, tile.height)
+        table = tile.occupancy().table
+        free = (table[ends_y, ends_x] - table[ys, ends_x]
+                - table[ends_y, xs] + table[ys, xs]) == 0
+        accepted = 0
+        for x, y, side, within, outside in zip(
+                xs.tolist(), ys.tolist(), sides.tolist(),
+                (inside & free).tolist(), (across & free).tolist()):
+            if drawn == count:
+                break
+            if within:
+                if accepted and tile.map[y:y + side, x:x + side].any():
+                    continue
+                tile.place_barrier(colours[drawn], x, y, side)
+            elif outside:
+                kept.append((colours[drawn], left + x, top + y, side))
+            else:
+                continue
+            drawn += 1
+            accepted += 1
+        # random draws rarely fit any more, the next round
+        # uses the placement engine of the tile
+        sparse = accepted * Map.MIN_BATCH >= size
+    return kept
+
+
+def _fill_tiles(pool: Optional[ProcessPoolExecutor], tasks: list) -> list:
+    """Fills the tiles in the pool or in this process if it is None"""
+
+    if pool is None:
+        return [fill_tile(task) for task in tasks]
+    return list(pool.map(fill_tile, tasks))
+
+
+def _reconcile(field: Map, kept: List[list]):
+    """
+    Places the kept crossing candidates of the tiles in the order
+    of the tiles if they are free. A coarse map of the occupied blocks
+    rejects most candidates at once, the points are checked only for
+    candidates whose inner blocks are free.
+
+    :param field: the map over the shared grid
+    :param kept: kept crossing candidates of every tile
+    :return: None
+    """
+
+    rows = np.arange(0, field.height, BLOCK)
+    columns = np.arange(0, field.width, BLOCK)
+    blocks = np.maximum.reduceat(np.maximum.reduceat(field.map, rows),
+                                 columns, axis=1) != 0
+    for candidates in kept:
+        STATS.count('tiled_crossing', len(candidates))
+        for barrier, x, y, side in candidates:
+            if blocks[-(-y // BLOCK):(y + side) // BLOCK,
+                      -(-x // BLOCK):(x + side) // BLOCK].any() \
+                    or field.window(x, y, side, side).any():
+                continue
+            field.place_barrier(barrier, x, y, side)
+            blocks[y // BLOCK:(y + side - 1) // BLOCK + 1,
+                   x // BLOCK:(x + side - 1) // BLOCK + 1] = True
+
+
+def _take(memory: shared_memory.SharedMemory,
+          grid: np.ndarray) -> np.ndarray:
+    """
+    Copies the grid out of shared memory in bands of rows. Where the
+    system allows it, the shared pages of every copied band are given
+    back at once, so the whole grid is not held twice.
+
+    :param memory: the shared memory of the grid
+    :param grid: the grid at the start of the shared memory
+    :return: copy of the grid
+    """
+
+    result = np.empty_like(grid)
+    pages = memory.buf.obj if hasattr(mmap, 'MADV_REMOVE') else None
+    stride = grid.strides[0]
+    rows = max(BAND_BYTES // max(stride, 1), 1)
+    released = 0
+    for top in range(0, grid.shape[0], rows):
+        result[top:top + rows] = grid[top:top + rows]
+        end = min(top + rows, grid.shape[0]) * stride
+        end -= end % mmap.PAGESIZE
+        if pages is not None and end > released:
+            pages.madvise(mmap.MADV_REMOVE, released, end - released)
+            released = end
+    return result
+
+
+def generate_tiled(width: int, height: int, count: int, seed=None,
+                   tile: int = TILE, max_size: Optional[int] = None,
+                   workers: Optional[int] = None) -> Map:
+    """
+    Generates a map with random square barriers in a pool of processes
+
+    :param width: the width of the map
+    :param height: the height of the map
+    :param count: number of barriers
+    :param seed: seed of the barriers, the same seed gives the same
+        map for any number of workers (default is None)
+    :param tile: side of a tile (default is TILE)
+    :param max_size: the largest side of a barrier, by default the
+        same as Map.max_barrier_size
+    :param workers: number of processes, all cores if None,
+        1 fills the tiles in this process
+    :return: the map
+    """
+
+    if width <= 0 or height <= 0:
+        raise ValueError('Width and height should be more than 0')
+    if tile <= 0:
+        raise ValueError('Tile should be more than 0')
+    if max_size is None:
+        max_size = math.ceil(min(width, height) / 3)
+    workers = workers or os.cpu_count() or 1
+    # one generator for the shares of the rounds, one for the map
+    # and one per tile and round
+    root = np.random.SeedSequence(seed)
+    shares, field_seed = root.spawn(2)
+    rng = np.random.default_rng(shares)
+    rounds = [(True, 0), (False, 0)] + [
+        (False, (number + 1) % 2 * (tile // 2))
+        for number in range(LEFTOVER_ROUNDS)]
+    # the second round takes new colours for the barriers that did not
+    # fit and the next rounds take the colours that were not used,
+    # so the colours stay below twice the count
+    dtype = np.min_scalar_type(2 * max(count, 1))
+    memory = shared_memory.SharedMemory(
+        create=True, size=max(width * height * dtype.itemsize, 1))
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 \
+        else None
+    try:
+        grid = np.ndarray((height, width), dtype=dtype, buffer=memory.buf)
+        grid[...] = 0
+        field = Map.from_grid(grid, seed=field_seed)
+        colour = 1
+        # the first round keeps the candidates that cross the tiles,
+        # the second one fills the tiles with the barriers that did not
+        # fit, the next ones share the rest by the free points
+        for number, (crossing, shift) in enumerate(rounds):
+            missing = count - len(field.barriers)
+            if not missing:
+                break
+            parts = tiles(width, height, tile, shift)
+            if number < 2:
+                weights = np.array([part[2] * part[3] for part in parts],
+                                   dtype=float)
+            else:
+                weights = np.array(
+                    [np.count_nonzero(field.window(*part) == 0)
+                     for part in parts], dtype=float)
+                if not weights.any():
+                    break
+            counts = rng.multinomial(missing,
+                                     weights / weights.sum()).tolist()
+            if number < 2:
+                colours = range(colour, colour + missing)
+                colour += missing
+            else:
+                colours = [unused for unused in range(1, colour)
+                           if unused not in field.barriers]
+            ends = np.cumsum(counts).tolist()
+            tasks = [(memory.name, grid.shape, dtype.str, part,
+                      colours[end - share:end], max_size, child, crossing)
+                     for part, share, end, child
+                     in zip(parts, counts, ends, root.spawn(len(parts)))]
+            with STATS.phase('tiles'):
+                results = _fill_tiles(pool, tasks)
+            field.barriers.update(
+                (barrier, (x, y, side)) for placed, _ in results
+                for barrier, x, y, side in placed)
+            if crossing:
+                with STATS.phase('reconciliation'):
+                    _reconcile(field, [kept for _, kept in results])
+        if pool is not None:
+            pool.shutdown()
+            pool = None
+        field.map = _take(memory, grid)
+        field._rebuilt()
+        del grid
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        memory.close()
+        memory.unlink()
+    return field
+
+
+def main(argv=None):
+    """Generates a map in parallel and saves it"""
+
+    parser = argparse.ArgumentParser(
+        description='Generate a large map in a pool of processes')
+    parser.add_argument('width', type=int)
+    parser.add_argument('height', type=int)
+    parser.add_argument('count', type=int, help='number of barriers')
+    parser.add_argument('path', help='file of the map in the mapfile format')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--tile', type=int, default=TILE)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    started = perf_counter()
+    field = generate_tiled(args.width, args.height, args.count,
+                           seed=args.seed, tile=args.tile,
+                           workers=args.workers)
+    print(f'Generated {field.barriers_count} barriers '
+          f'in {perf_counter() - started:.1f}s')
+    save_map(field, args.path)
+
+
+if __name__ == '__main__':
+    main()
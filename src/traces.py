@@ -0,0 +1,325 @@
+"""
+The module contains the structured trace of robot movements,
+the streaming writer of traces and the reader of saved traces.
+"""
+import re
+import json
+import struct
+from array import array
+from typing import Iterator, List, NamedTuple, Optional
+
+
+COMMANDS = ('UP', 'DOWN', 'LEFT', 'RIGHT', 'ROTATE90', 'ROTATE180')
+ORIENTATIONS = ('UP', 'DOWN', 'LEFT', 'RIGHT')
+
+MOVED = 0
+TURNED = 1
+HIT_BORDER = 2
+HIT_BARRIER = 3
+OUTCOMES = ('moved', 'turned', 'hit_border', 'hit_barrier')
+
+BINARY_MAGIC = b'RSTRACE1'
+BINARY_RECORD = struct.Struct('<bBiiiiB')
+
+_LEGACY_TURN = re.compile(r'Robot turned (\w+)')
+_LEGACY_MOVE = re.compile(r'Robot arrived to \[(-?\d+), (-?\d+)\]'
+                          r' from \[(-?\d+), (-?\d+)\]')
+_LEGACY_DIRECTION = re.compile(r'Robot direction: (\w+)')
+
+
+class TraceRecord(NamedTuple):
+    """
+    One executed command.
+    The command is None when it is unknown (traces of the old format),
+    for collisions the target point is the point the robot tried to enter.
+    """
+    command: Optional[str]
+    orientation: str
+    from_x: int
+    from_y: int
+    to_x: int
+    to_y: int
+    outcome: str
+
+    def as_dict(self) -> dict:
+        return {'command': self.command, 'orientation': self.orientation,
+                'from': [self.from_x, self.from_y],
+                'to': [self.to_x, self.to_y], 'outcome': self.outcome}
+
+
+class Trace:
+    """
+    A class used to represent logs of robot movements as typed records
+    stored column by column in growable arrays
+
+    Attributes:
+        writer : TraceWriter
+            writer that streams records to a file or None
+        keep : bool
+            whether the records are kept in memory
+    """
+
+    def __init__(self, writer: 'TraceWriter' = None, keep: bool = True):
+        """
+        Parameters
+        :param writer: writer that streams records to a file
+            (default is None)
+        :param keep: whether the records are kept in memory
+            (default is True)
+        """
+
+        self.writer = writer
+        self.keep = keep
+        self._commands = array('b')
+        self._orientations = array('B')
+        self._points = array('i')
+        self._outcomes = array('B')
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def attach(self, writer: 'TraceWriter'):
+        """
+        Streams all next records with the writer
+
+        :param writer: writer of the records
+        :return: None
+        """
+
+        self.writer = writer
+
+    def append(self, command: Optional[str], orientation: str,
+               from_x: int, from_y: int, to_x: int, to_y: int,
+               outcome: int):
+        """
+        Adds a record about an executed command
+
+        :param command: executed command or None if it is unknown
+        :param orientation: direction of the robot after the command
+        :param from_x: position of the robot before the command by X
+        :param from_y: position of the robot before the command by Y
+        :param to_x: position the robot moved or tried to move to by X
+        :param to_y: position the robot moved or tried to move to by Y
+        :param outcome: outcome code of the command
+        :return: None
+        """
+
+        code = COMMANDS.index(command) if command is not None else -1
+        direction = ORIENTATIONS.index(orientation)
+        self._count += 1
+        if self.keep:
+            self._commands.append(code)
+            self._orientations.append(direction)
+            self._points.extend((from_x, from_y, to_x, to_y))
+            self._outcomes.append(outcome)
+        if self.writer is not None:
+            self.writer.write(code, direction, from_x, from_y,
+                              to_x, to_y, outcome)
+
+    def __getitem__(self, index: int) -> TraceRecord:
+        if not self.keep:
+            raise IndexError('Records of the trace are not kept in memory')
+        index = range(len(self._outcomes))[index]
+        command = self._commands[index]
+        return TraceRecord(COMMANDS[command] if command >= 0 else None,
+                           ORIENTATIONS[self._orientations[index]],
+                           *self._points[4 * index:4 * index + 4],
+                           OUTCOMES[self._outcomes[index]])
+
+    def __iter__(self) -> Iterator[TraceRecord]:
+        for index in range(len(self._outcomes)):
+            yield self[index]
+
+    def __str__(self) -> str:
+        """Returns the trace as the text the simulator printed"""
+
+        lines = []
+        for record in self:
+            if record.outcome == 'turned':
+                lines.append(f'Robot turned {record.orientation}\n')
+            elif record.outcome == 'moved':
+                lines.append(f'Robot direction: {record.orientation}\n'
+                             f'Robot arrived to [{record.to_x}, '
+                             f'{record.to_y}] from [{record.from_x}, '
+                             f'{record.from_y}]\n')
+        return ''.join(lines)
+
+
+class TraceWriter:
+    """
+    A class used to stream trace records to a file in JSONL
+    or in a compact binary format. Records are buffered and
+    written in batches.
+
+    Attributes:
+        path : str
+            path of the file
+        binary : bool
+            whether the binary format is used
+        buffer_size : int
+            number of records written in one batch
+    """
+
+    def __init__(self, path: str, binary: bool = False,
+                 buffer_size: int = 1024):
+        """
+        Parameters
+        :param path: path of the file, it is overwritten
+        :param binary: whether the binary format is used
+            (default is False)
+        :param buffer_size: number of records written in one batch
+            (default is 1024)
+        """
+
+        self.path = path
+        self.binary = binary
+        self.buffer_size = buffer_size
+        self._buffer = []
+        self._file = open(path, 'wb' if binary else 'w')
+        if binary:
+            self._file.write(BINARY_MAGIC)
+
+    def write(self, command: int, orientation: int, from_x: int,
+              from_y: int, to_x: int, to_y: int, outcome: int):
+        """
+        Buffers one record with codes instead of names
+
+        :return: None
+        """
+
+        if self.binary:
+            self._buffer.append(BINARY_RECORD.pack(
+                command, orientation, from_x, from_y, to_x, to_y, outcome))
+        else:
+            self._buffer.append(json.dumps({
+                'command': COMMANDS[command] if command >= 0 else None,
+                'orientation': ORIENTATIONS[orientation],
+                'from': [from_x, from_y], 'to': [to_x, to_y],
+                'outcome': OUTCOMES[outcome]}) + '\n')
+        if len(self._buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the buffered records to the file
+
+        :return: None
+        """
+
+        if self._buffer:
+            separator = b'' if self.binary else ''
+            self._file.write(separator.join(self._buffer))
+            self._buffer.clear()
+        self._file.flush()
+
+    def close(self):
+        """
+        Writes the buffered records and closes the file
+
+        :return: None
+        """
+
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+    def __enter__(self) -> 'TraceWriter':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def write_traces(trace: Trace, path: str, binary: bool = False):
+    """
+    Saves all records of the trace to a file
+
+    :param trace: trace to be saved
+    :param path: path of the file
+    :param binary: whether the binary format is used (default is False)
+    :return: None
+    """
+
+    with TraceWriter(path, binary) as writer:
+        for record in trace:
+            writer.write(
+                COMMANDS.index(record.command)
+                if record.command is not None else -1,
+                ORIENTATIONS.index(record.orientation),
+                record.from_x, record.from_y, record.to_x, record.to_y,
+                OUTCOMES.index(record.outcome))
+
+
+def parse_legacy(text: str) -> Trace:
+    """
+    Converts the text the simulator printed into a trace.
+    The old text has no commands and no positions of turns,
+    turns get the position where the robot stood at that moment.
+
+    :param text: logs of robot movements in the old format
+    :return: trace with the same movements
+    """
+
+    records: List[list] = []
+    orientation = 'UP'
+    for line in text.splitlines():
+        turn = _LEGACY_TURN.fullmatch(line)
+        move = _LEGACY_MOVE.fullmatch(line)
+        direction = _LEGACY_DIRECTION.fullmatch(line)
+        if turn:
+            records.append([turn.group(1), None, TURNED])
+        elif direction:
+            orientation = direction.group(1)
+        elif move:
+            to_x, to_y, from_x, from_y = map(int, move.groups())
+            records.append([orientation, (from_x, from_y, to_x, to_y),
+                            MOVED])
+    position = None
+    for record in records:
+        if record[2] == MOVED:
+            position = record[1][2:] * 2
+        elif position is not None:
+            record[1] = position
+    position = (-1, -1, -1, -1)
+    for record in reversed(records):
+        if record[1] is None:
+            record[1] = position
+        elif record[2] == MOVED:
+            position = record[1][:2] * 2
+    trace = Trace()
+    for orientation, points, outcome in records:
+        command = orientation if outcome == MOVED else None
+        trace.append(command, orientation, *points, outcome)
+    return trace
+
+
+def read_traces(path: str) -> Trace:
+    """
+    Loads a trace saved in JSONL, in the binary format
+    or in the old format of a single JSON string
+
+    :param path: path of the file
+    :return: loaded trace
+    """
+
+    trace = Trace()
+    with open(path, 'rb') as file:
+        data = file.read()
+    if data.startswith(BINARY_MAGIC):
+        body = memoryview(data)[len(BINARY_MAGIC):]
+        for command, orientation, *points, outcome in \
+                BINARY_RECORD.iter_unpack(body):
+            trace.append(COMMANDS[command] if command >= 0 else None,
+                         ORIENTATIONS[orientation], *points, outcome)
+        return trace
+    text = data.decode()
+    if text.lstrip().startswith('"'):
+        return parse_legacy(json.loads(text))
+    for line in text.splitlines():
+        if line.strip():
+            record = json.loads(line)
+            trace.append(record['command'], record['orientation'],
+                         *record['from'], *record['to'],
+                         OUTCOMES.index(record['outcome']))
+    return trace
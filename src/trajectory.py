@@ -0,0 +1,478 @@
+"""
+The module contains the columnar store of robot trajectories.
+
+A store is a directory of chunk files and an index.json manifest.
+Every chunk keeps a fixed number of steps in order of the step
+number, column by column, followed by a coarse grid index of the
+points:
+
+    magic        8 bytes   b'RSTRAJ\\x00\\x01'
+    rows         uint64    number of steps in the chunk
+    cells        uint64    number of grid cells the steps fall into
+    step         rows x int64     number of the step
+    robot        rows x uint32    index of the robot
+    x, y         rows x int32     position after the step
+    orientation  rows x uint8     index in traces.ORIENTATIONS
+    outcome      rows x uint8     outcome code of the step
+    cell ids     cells x int64    sorted ids of the grid cells
+    cell starts  (cells + 1) x int64
+    cell rows    rows x uint32    rows of the chunk ordered by the cell
+
+Chunks are read through memory mapping, so queries touch only
+the chunks and the pages they need.
+
+Usage:
+    with TrajectoryWriter('../logs/trajectory') as writer:
+        writer.append(step, robot, x, y, orientation, outcome)
+    store = TrajectoryStore('../logs/trajectory')
+    store.between(10000, 20000, robot=3)
+    store.within(0, 0, 50, 50)
+"""
+import os
+import sys
+import json
+import struct
+import argparse
+from bisect import bisect_left
+from typing import Iterator, Optional
+
+import numpy as np
+
+from traces import Trace, ORIENTATIONS, OUTCOMES, MOVED, read_traces
+from events import Event, NullSink
+
+MAGIC = b'RSTRAJ\x00\x01'
+HEADER = struct.Struct('<8sQQ')
+ROW = np.dtype([('step', '<i8'), ('robot', '<u4'), ('x', '<i4'),
+                ('y', '<i4'), ('orientation', 'u1'), ('outcome', 'u1')])
+INDEX_NAME = 'index.json'
+# steps in one chunk
+CHUNK = 1 << 20
+# side of a cell of the grid index in points
+CELL = 64
+
+
+def _layout(rows: int, cells: int) -> dict:
+    """
+    Finds the offsets of the columns in a chunk file
+
+    :param rows: number of steps in the chunk
+    :param cells: number of grid cells in the chunk
+    :return: offset, type and length of every column by name
+    """
+
+    columns = [(name, ROW.fields[name][0], rows) for name in ROW.names]
+    columns += [('cell_ids', np.dtype('<i8'), cells),
+                ('cell_starts', np.dtype('<i8'), cells + 1),
+                ('cell_rows', np.dtype('<u4'), rows)]
+    layout, offset = {}, HEADER.size
+    for name, dtype, length in columns:
+        offset += -offset % 8
+        layout[name] = (offset, dtype, length)
+        offset += dtype.itemsize * length
+    return layout
+
+
+def cell_ids(xs: np.ndarray, ys: np.ndarray, cell: int) -> np.ndarray:
+    """
+    Finds the ids of the grid cells of the points
+
+    :param xs: X coordinates of the points, not negative
+    :param ys: Y coordinates of the points, not negative
+    :param cell: side of a cell in points
+    :return: id of the cell of every point
+    """
+
+    return ys.astype(np.int64) // cell << 32 | xs.astype(np.int64) // cell
+
+
+class TrajectoryWriter:
+    """
+    A class used to write steps of robots to a store. Steps are
+    buffered in columns and written chunk by chunk, the manifest
+    is written when the writer is closed.
+
+    Attributes:
+        path : str
+            directory of the store
+        chunk : int
+            steps in one chunk
+        cell : int
+            side of a cell of the grid index in points
+        count : int
+            number of written steps
+    """
+
+    def __init__(self, path: str, chunk: int = CHUNK, cell: int = CELL):
+        """
+        Parameters
+        :param path: directory of the store, a store in it is replaced
+        :param chunk: steps in one chunk (default is CHUNK)
+        :param cell: side of a cell of the grid index in points
+            (default is CELL)
+        """
+
+        if chunk <= 0 or cell <= 0:
+            raise ValueError('Chunk and cell sizes should be more than 0')
+        os.makedirs(path, exist_ok=True)
+        for name in os.listdir(path):
+            if name == INDEX_NAME or name.startswith('chunk-'):
+                os.remove(os.path.join(path, name))
+        self.path = path
+        self.chunk = chunk
+        self.cell = cell
+        self.count = 0
+        self._buffer = np.empty(chunk, dtype=ROW)
+        self._size = 0
+        self._chunks = []
+
+    def append(self, step: int, robot: int, x: int, y: int,
+               orientation: int, outcome: int):
+        """
+        Adds one step
+
+        :param step: number of the step, not less than the last one
+        :param robot: index of the robot
+        :param x: position of the robot after the step by X
+        :param y: position of the robot after the step by Y
+        :param orientation: index of the direction in ORIENTATIONS
+        :param outcome: outcome code of the step
+        :return: None
+        """
+
+        if self.count and step < self._last():
+            raise ValueError('Steps should be added in order')
+        self._buffer[self._size] = (step, robot, x, y, orientation, outcome)
+        self._size += 1
+        self.count += 1
+        if self._size == self.chunk:
+            self._write()
+
+    def extend(self, steps, robots, xs, ys, orientations, outcomes):
+        """
+        Adds many steps at once, for example one tick of a fleet.
+        Every argument is an array or a number shared by the steps.
+
+        :return: None
+        """
+
+        rows = np.broadcast_arrays(steps, robots, xs, ys,
+                                   orientations, outcomes)
+        size = rows[0].size
+        steps = rows[0].reshape(-1)
+        if size and (np.any(np.diff(steps) < 0)
+                     or self.count and steps[0] < self._last()):
+            raise ValueError('Steps should be added in order')
+        done = 0
+        while done < size:
+            part = min(size - done, self.chunk - self._size)
+            target = self._buffer[self._size:self._size + part]
+            for name, column in zip(ROW.names, rows):
+                target[name] = column.reshape(-1)[done:done + part]
+            self._size += part
+            self.count += part
+            done += part
+            if self._size == self.chunk:
+                self._write()
+
+    def _last(self) -> int:
+        """Returns the number of the last added step"""
+
+        if self._size:
+            return int(self._buffer['step'][self._size - 1])
+        return self._chunks[-1]['last']
+
+    def _write(self):
+        """Writes the buffered steps as a new chunk"""
+
+        rows = self._buffer[:self._size]
+        ids = cell_ids(rows['x'], rows['y'], self.cell)
+        order = np.argsort(ids, kind='stable').astype(np.uint32)
+        cells, starts = np.unique(ids[order], return_index=True)
+        columns = {name: rows[name] for name in ROW.names}
+        columns.update(cell_ids=cells,
+                       cell_starts=np.append(starts, len(rows)),
+                       cell_rows=order)
+        name = f'chunk-{len(self._chunks):06d}.bin'
+        with open(os.path.join(self.path, name), 'wb') as file:
+            file.write(HEADER.pack(MAGIC, len(rows), len(cells)))
+            for column, (offset, dtype, _) in \
+                    _layout(len(rows), len(cells)).items():
+                file.write(b'\0' * (offset - file.tell()))
+                np.ascontiguousarray(columns[column], dtype=dtype) \
+                    .tofile(file)
+        self._chunks.append({
+            'file': name, 'rows': len(rows),
+            'first': int(rows['step'][0]), 'last': int(rows['step'][-1]),
+            'left': int(rows['x'].min()), 'top': int(rows['y'].min()),
+            'right': int(rows['x'].max()), 'bottom': int(rows['y'].max())})
+        self._size = 0
+
+    def close(self):
+        """
+        Writes the buffered steps and the manifest
+
+        :return: None
+        """
+
+        if self._size:
+            self._write()
+        with open(os.path.join(self.path, INDEX_NAME), 'w') as file:
+            json.dump({'cell': self.cell, 'rows': self.count,
+                       'chunks': self._chunks}, file)
+
+    def __enter__(self) -> 'TrajectoryWriter':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class TrajectorySink(NullSink):
+    """
+    An event sink that writes the events of one robot to a store,
+    every event is one step
+    """
+
+    def __init__(self, writer: TrajectoryWriter, robot: int = 0):
+        """
+        Parameters
+        :param writer: writer of the store
+        :param robot: index of the robot (default is 0)
+        """
+
+        self.writer = writer
+        self.robot = robot
+        self.step = 0
+
+    def handle(self, event: Event):
+        moved = event.outcome == MOVED
+        self.writer.append(self.step, self.robot,
+                           event.to_x if moved else event.from_x,
+                           event.to_y if moved else event.from_y,
+                           ORIENTATIONS.index(event.orientation),
+                           event.outcome)
+        self.step += 1
+
+    def close(self):
+        self.writer.close()
+
+
+def write_trace(trace: Trace, path: str, robot: int = 0,
+                chunk: int = CHUNK, cell: int = CELL):
+    """
+    Converts a trace into a store, every record is one step
+
+    :param trace: the trace
+    :param path: directory of the store
+    :param robot: index of the robot (default is 0)
+    :param chunk: steps in one chunk (default is CHUNK)
+    :param cell: side of a cell of the grid index (default is CELL)
+    :return: None
+    """
+
+    with TrajectoryWriter(path, chunk, cell) as writer:
+        sink = TrajectorySink(writer, robot)
+        for record in trace:
+            sink.handle(Event(
+                OUTCOMES.index(record.outcome), record.command,
+                record.orientation, record.from_x, record.from_y,
+                record.to_x, record.to_y))
+
+
+class TrajectoryStore:
+    """
+    A class used to query a store written by TrajectoryWriter
+
+    Attributes:
+        path : str
+            directory of the store
+        cell : int
+            side of a cell of the grid index in points
+        chunks : list
+            manifest entry of every chunk
+    """
+
+    def __init__(self, path: str):
+        """
+        Parameters
+        :param path: directory of the store
+        """
+
+        with open(os.path.join(path, INDEX_NAME)) as file:
+            manifest = json.load(file)
+        self.path = path
+        self.cell = manifest['cell']
+        self.chunks = manifest['chunks']
+        self._lasts = [chunk['last'] for chunk in self.chunks]
+
+    def __len__(self) -> int:
+        return sum(chunk['rows'] for chunk in self.chunks)
+
+    def columns(self, index: int) -> dict:
+        """
+        Maps the columns of a chunk into memory
+
+        :param index: index of the chunk
+        :return: read-only array of every column by name
+        """
+
+        path = os.path.join(self.path, self.chunks[index]['file'])
+        data = np.memmap(path, dtype=np.uint8, mode='r')
+        magic, rows, cells = HEADER.unpack(data[:HEADER.size].tobytes())
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a trajectory chunk')
+        return {name: data[offset:offset + dtype.itemsize * length]
+                .view(dtype)
+                for name, (offset, dtype, length)
+                in _layout(rows, cells).items()}
+
+    @staticmethod
+    def _rows(columns: dict, selected) -> np.ndarray:
+        """Copies the selected rows of a chunk into an array of ROW"""
+
+        rows = np.empty(len(columns['step'][selected]), dtype=ROW)
+        for name in ROW.names:
+            rows[name] = columns[name][selected]
+        return rows
+
+    def iter_between(self, first: int, last: int,
+                     robot: Optional[int] = None) -> Iterator[np.ndarray]:
+        """
+        Streams the steps with numbers from first to last, chunks are
+        found by bisection over the manifest and steps by bisection
+        over the step column
+
+        :param first: the first step number
+        :param last: the last step number
+        :param robot: index of the robot, all robots if it is None
+            (default is None)
+        :return: arrays of ROW, one per chunk
+        """
+
+        for index in range(bisect_left(self._lasts, first),
+                           len(self.chunks)):
+            if self.chunks[index]['first'] > last:
+                break
+            columns = self.columns(index)
+            steps = columns['step']
+            span = slice(int(np.searchsorted(steps, first, 'left')),
+                         int(np.searchsorted(steps, last, 'right')))
+            if robot is not None:
+                span = span.start + np.flatnonzero(
+                    columns['robot'][span] == robot)
+            rows = self._rows(columns, span)
+            if len(rows):
+                yield rows
+
+    def between(self, first: int, last: int,
+                robot: Optional[int] = None) -> np.ndarray:
+        """
+        Returns the steps with numbers from first to last
+
+        :return: array of ROW
+        """
+
+        return np.concatenate([np.empty(0, dtype=ROW), *self.iter_between(
+            first, last, robot)])
+
+    def iter_within(self, x: int, y: int, width: int, height: int,
+                    robot: Optional[int] = None,
+                    outcome: Optional[int] = None) -> Iterator[np.ndarray]:
+        """
+        Streams the steps that ended inside the rectangle. Chunks are
+        skipped by their bounding boxes and inside a chunk only the
+        rows of the grid cells that cross the rectangle are read.
+
+        :param x: X coordinate of the upper-left corner
+        :param y: Y coordinate of the upper-left corner
+        :param width: width of the rectangle
+        :param height: height of the rectangle
+        :param robot: index of the robot, all robots if it is None
+            (default is None)
+        :param outcome: outcome code of the steps, for example MOVED,
+            all steps if it is None (default is None)
+        :return: arrays of ROW in order of the steps, one per chunk
+        """
+
+        right, bottom = x + width - 1, y + height - 1
+        cell = self.cell
+        for index, chunk in enumerate(self.chunks):
+            if width <= 0 or height <= 0 or chunk['right'] < x or \
+                    chunk['left'] > right or chunk['bottom'] < y or \
+                    chunk['top'] > bottom:
+                continue
+            columns = self.columns(index)
+            ids, starts = columns['cell_ids'], columns['cell_starts']
+            parts = []
+            for row in range(max(y, 0) // cell, bottom // cell + 1):
+                low = int(np.searchsorted(
+                    ids, row << 32 | max(x, 0) // cell, 'left'))
+                high = int(np.searchsorted(
+                    ids, row << 32 | right // cell, 'right'))
+                if low < high:
+                    parts.append(columns['cell_rows'][
+                        starts[low]:starts[high]])
+            if not parts:
+                continue
+            selected = np.sort(np.concatenate(parts))
+            xs, ys = columns['x'][selected], columns['y'][selected]
+            keep = (xs >= x) & (xs <= right) & (ys >= y) & (ys <= bottom)
+            if robot is not None:
+                keep &= columns['robot'][selected] == robot
+            if outcome is not None:
+                keep &= columns['outcome'][selected] == outcome
+            rows = self._rows(columns, selected[keep])
+            if len(rows):
+                yield rows
+
+    def within(self, x: int, y: int, width: int, height: int,
+               robot: Optional[int] = None,
+               outcome: Optional[int] = None) -> np.ndarray:
+        """
+        Returns the steps that ended inside the rectangle
+
+        :return: array of ROW
+        """
+
+        return np.concatenate([np.empty(0, dtype=ROW), *self.iter_within(
+            x, y, width, height, robot, outcome)])
+
+
+def main(argv=None):
+    """Converts a trace file into a store or queries a store"""
+
+    parser = argparse.ArgumentParser(
+        description='Convert traces into a trajectory store and query it')
+    commands = parser.add_subparsers(dest='mode', required=True)
+    convert = commands.add_parser('import', help='convert a trace file')
+    convert.add_argument('trace')
+    convert.add_argument('store')
+    between = commands.add_parser('between', help='steps from FIRST to LAST')
+    between.add_argument('store')
+    between.add_argument('first', type=int)
+    between.add_argument('last', type=int)
+    between.add_argument('--robot', type=int, default=None)
+    within = commands.add_parser('within', help='steps inside a rectangle')
+    within.add_argument('store')
+    within.add_argument('rectangle', type=int, nargs=4,
+                        metavar=('X', 'Y', 'WIDTH', 'HEIGHT'))
+    within.add_argument('--robot', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    if args.mode == 'import':
+        write_trace(read_traces(args.trace), args.store)
+        return None
+    store = TrajectoryStore(args.store)
+    if args.mode == 'between':
+        chunks = store.iter_between(args.first, args.last, args.robot)
+    else:
+        chunks = store.iter_within(*args.rectangle, robot=args.robot)
+    for rows in chunks:
+        for row in rows.tolist():
+            json.dump(dict(zip(ROW.names, row)), sys.stdout)
+            print()
+
+
+if __name__ == '__main__':
+    main()
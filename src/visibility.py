@@ -0,0 +1,250 @@
+"""
+The module contains the line-of-sight field of view of the robot
+computed by shadowcasting and cached between frames.
+"""
+from collections import OrderedDict
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from map import Map
+
+
+# transformations of the first octant into the eight octants,
+# an octant point (column, row) maps to (xx * column + xy * row,
+# yx * column + yy * row) around the viewer
+OCTANTS = ((1, 0, 0, 1), (0, 1, 1, 0), (0, -1, 1, 0), (-1, 0, 0, 1),
+           (-1, 0, 0, -1), (0, -1, -1, 0), (0, 1, -1, 0), (1, 0, 0, -1))
+
+
+class View:
+    """
+    A class used to represent the points seen from a point
+
+    Attributes:
+        left : int
+            X coordinate of the upper-left corner of the mask
+        top : int
+            Y coordinate of the upper-left corner of the mask
+        mask : numpy.ndarray
+            boolean array over the box around the viewer, True where
+            the point is visible
+    """
+    __slots__ = ('left', 'top', 'mask')
+
+    def __init__(self, left: int, top: int, mask: np.ndarray):
+        self.left = left
+        self.top = top
+        self.mask = mask
+
+    def __contains__(self, point: Tuple[int, int]) -> bool:
+        x, y = point[0] - self.left, point[1] - self.top
+        return 0 <= y < self.mask.shape[0] and \
+            0 <= x < self.mask.shape[1] and bool(self.mask[y, x])
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self.mask))
+
+    def __iter__(self) -> Iterator[Tuple[int, int]]:
+        ys, xs = np.nonzero(self.mask)
+        return zip((xs + self.left).tolist(), (ys + self.top).tolist())
+
+
+def cast(opaque: List[List[bool]], lit: np.ndarray, center: int,
+         radius: int):
+    """
+    Marks the points seen from the center of a square box by
+    recursive shadowcasting. A barrier is seen, but it hides the
+    points behind it.
+
+    :param opaque: rows of the box, True where the point blocks the view
+    :param lit: boolean array of the box where the seen points are marked
+    :param center: index of the viewer by X and Y in the box
+    :param radius: the farthest distance that is seen
+    :return: None
+    """
+
+    limit = radius * radius + radius
+    lit[center, center] = True
+    for xx, xy, yx, yy in OCTANTS:
+        stack = [(1, 1.0, 0.0)]
+        while stack:
+            row, start, end = stack.pop()
+            if start < end:
+                continue
+            for distance in range(row, radius + 1):
+                blocked = False
+                new_start = start
+                for column in range(-distance, 1):
+                    left_slope = (column - 0.5) / (-distance + 0.5)
+                    right_slope = (column + 0.5) / (-distance - 0.5)
+                    if start < right_slope:
+                        continue
+                    if end > left_slope:
+                        break
+                    x = center + column * xx - distance * xy
+                    y = center + column * yx - distance * yy
+                    if column * column + distance * distance <= limit:
+                        lit[y, x] = True
+                    if blocked:
+                        if opaque[y][x]:
+                            new_start = right_slope
+                        else:
+                            blocked = False
+                            start = new_start
+                    elif opaque[y][x] and distance < radius:
+                        blocked = True
+                        stack.append((distance + 1, start, left_slope))
+                        new_start = right_slope
+                if blocked:
+                    break
+
+
+class Visibility:
+    """
+    A class used to find the points the robot sees within the radius.
+
+    Views are cached for the most recently used points. Robots that
+    stand on the same point share a view, and a change of the barriers
+    drops only the views whose box touches the changed zone. The cached
+    points are kept in square buckets of the side of a box, so a change
+    looks only at the buckets around the zone. When no
+    barrier lies in the box, the view is the disc of the radius and
+    shadowcasting is skipped.
+
+    Attributes:
+        field : Map
+            the map on which the robots look around
+        radius : int
+            the farthest distance that is seen
+        capacity : int
+            number of points whose views are cached
+    """
+
+    def __init__(self, field: Map, radius: int = 3, capacity: int = 4096):
+        """
+        Parameters
+        :param field: the map on which the robots look around
+        :param radius: the farthest distance that is seen (default is 3)
+        :param capacity: number of points whose views are cached
+            (default is 4096)
+        """
+
+        if radius < 0:
+            raise ValueError('Radius should not be negative')
+        self.field = field
+        self.radius = radius
+        self.capacity = capacity
+        self._cache = OrderedDict()
+        size = 2 * radius + 1
+        # cached points by their bucket of size x size points
+        self._buckets = {}
+        self._side = size
+        offsets = np.arange(size) - radius
+        self._disc = offsets[:, None] ** 2 + offsets[None, :] ** 2 \
+            <= radius * radius + radius
+        field.listeners.append(self._changed)
+
+    def close(self):
+        """Stops following the changes of the map"""
+
+        if self._changed in self.field.listeners:
+            self.field.listeners.remove(self._changed)
+        self._cache.clear()
+        self._buckets.clear()
+
+    def _changed(self, zone: Optional[tuple]):
+        """
+        Drops the views that may see the changed zone
+
+        :param zone: X, Y, width and height of the zone,
+            None if the whole map may have changed
+        :return: None
+        """
+
+        if zone is None:
+            self._cache.clear()
+            self._buckets.clear()
+            return None
+        x, y, width, height = zone
+        radius, side = self.radius, self._side
+        left, top = x - radius, y - radius
+        right, bottom = x + width + radius, y + height + radius
+        columns = range(left // side, (right - 1) // side + 1)
+        rows = range(top // side, (bottom - 1) // side + 1)
+        if len(columns) * len(rows) > len(self._buckets):
+            keys = self._cache
+        else:
+            keys = [key for row in rows for column in columns
+                    for key in self._buckets.get((column, row), ())]
+        stale = [key for key in keys
+                 if left <= key[0] < right and top <= key[1] < bottom]
+        for key in stale:
+            self._forget(key)
+            del self._cache[key]
+
+    def _forget(self, key: Tuple[int, int]):
+        """Takes the point out of its bucket"""
+
+        bucket = (key[0] // self._side, key[1] // self._side)
+        keys = self._buckets[bucket]
+        keys.discard(key)
+        if not keys:
+            del self._buckets[bucket]
+
+    def _compute(self, x: int, y: int) -> View:
+        """Finds the view from the point without the cache"""
+
+        field, radius = self.field, self.radius
+        left, top = max(x - radius, 0), max(y - radius, 0)
+        right = min(x + radius + 1, field.width)
+        bottom = min(y + radius + 1, field.height)
+        box = (slice(top - y + radius, bottom - y + radius),
+               slice(left - x + radius, right - x + radius))
+        if not field.check_collisions(left, top, right - left, bottom - top):
+            return View(left, top, self._disc[box].copy())
+        size = 2 * radius + 1
+        opaque = np.ones((size, size), dtype=bool)
+        opaque[box] = field.window(left, top, right - left,
+                                   bottom - top) != 0
+        lit = np.zeros((size, size), dtype=bool)
+        cast(opaque.tolist(), lit, radius, radius)
+        return View(left, top, lit[box])
+
+    def view(self, x: int, y: int) -> View:
+        """
+        Returns the points seen from the point
+
+        :param x: X coordinate of the viewer
+        :param y: Y coordinate of the viewer
+        :return: the visible points
+        """
+
+        key = (x, y)
+        view = self._cache.get(key)
+        if view is not None:
+            self._cache.move_to_end(key)
+            return view
+        view = self._compute(x, y)
+        self._cache[key] = view
+        bucket = (x // self._side, y // self._side)
+        self._buckets.setdefault(bucket, set()).add(key)
+        if len(self._cache) > self.capacity:
+            self._forget(self._cache.popitem(last=False)[0])
+        return view
+
+    def barriers(self, x: int, y: int) -> List[Tuple[int, int]]:
+        """
+        Returns the points of barriers seen from the point
+
+        :param x: X coordinate of the viewer
+        :param y: Y coordinate of the viewer
+        :return: X and Y of every seen point of a barrier
+        """
+
+        view = self.view(x, y)
+        height, width = view.mask.shape
+        cells = self.field.window(view.left, view.top, width, height)
+        ys, xs = np.nonzero(view.mask & (cells != 0))
+        return list(zip((xs + view.left).tolist(),
+                        (ys + view.top).tolist()))